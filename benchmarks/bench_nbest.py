@@ -0,0 +1,95 @@
+# bench_nbest.py
+#
+# How many utterances have to be repeated when only Google's top transcription is used, against
+# scoring every alternative of the `recognize_google(audio, show_all=True)` response with the
+# command grammar (no network or microphone needed).
+#
+#   python benchmarks/bench_nbest.py [--fixtures benchmarks/fixtures/google_alternatives.json]
+#
+# Every fixture is what was said and the show_all response for it. An utterance counts as a
+# retry when the chosen transcription is not a command, and as wrong when it is a different
+# command than the one that was said.
+#
+# The default fixtures are SYNTHETIC: hand-written near misses in Google's response format, not
+# responses recorded from real audio, so their retry rates only show that the scoring works,
+# not how often it helps on a real robot. Pass responses recorded with
+# `recognize_google(audio, show_all=True)` (same format) with --fixtures for real numbers.
+
+import argparse
+import json
+import logging
+import os
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.command_matcher import CommandMatcher
+from src.command_parser import CommandParser
+from src.commands import PHRASE_BOT_DICT
+from src.recognizers import chooseAlternative
+from src.recognizers import googleAlternatives
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'google_alternatives.json')
+
+def newParser() -> CommandParser:
+    # like Speech2Text, a fresh (uncached) matcher per run
+    return CommandParser(CommandMatcher(PHRASE_BOT_DICT), speed_commands={'increaseWheelSpeed', 'decreaseWheelSpeed'})
+
+def evaluate(fixtures: list, choose) -> dict:
+    """Correct, retry and wrong counts of `choose(alternatives) -> transcription or None`"""
+    parser = newParser()
+    counts = {'correct': 0, 'retry': 0, 'wrong': 0}
+    start = perf_counter()
+    for fixture in fixtures:
+        expected = parser.parse(fixture['spoken'])
+        transcription = choose(googleAlternatives(fixture['response']), parser)
+        plan = parser.parse(transcription) if transcription is not None else None
+        if plan is None:
+            counts['retry'] += 1
+        elif plan == expected:
+            counts['correct'] += 1
+        else:
+            counts['wrong'] += 1
+    counts['seconds'] = perf_counter() - start
+    return counts
+
+def chooseTop(alternatives: list, parser: CommandParser):
+    return alternatives[0] if len(alternatives) > 0 else None
+
+def chooseBest(alternatives: list, parser: CommandParser):
+    if len(alternatives) == 0:
+        return None
+
+    def score(text: str):
+        result = parser.parseScored(text)
+        return result[1] if result is not None else None
+
+    return alternatives[chooseAlternative(alternatives, score)]
+
+def main():
+    parser = argparse.ArgumentParser(description='N-best recognition benchmark')
+    parser.add_argument('--fixtures', type=str, default=FIXTURES, help='JSON list of {"spoken", "response"}, default: the synthetic fixtures')
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    with open(args.fixtures, 'r') as file:
+        fixtures = json.load(file)
+    alternatives = sum(len(googleAlternatives(fixture['response'])) for fixture in fixtures)
+    print(f'fixtures:             {len(fixtures)} utterances, {alternatives / len(fixtures):.1f} alternatives each'
+          f'{" (synthetic, not recorded)" if os.path.abspath(args.fixtures) == FIXTURES else ""}')
+
+    results = {'top only': evaluate(fixtures, chooseTop), 'n-best': evaluate(fixtures, chooseBest)}
+    for name, counts in results.items():
+        print(f'{name + ":":<22}'
+              f'retry {counts["retry"] / len(fixtures):6.1%}   wrong {counts["wrong"] / len(fixtures):6.1%}   '
+              f'correct {counts["correct"] / len(fixtures):6.1%}   '
+              f'{counts["seconds"] / len(fixtures) * 1e6:.0f} us/utterance')
+    top, best = results['top only']['retry'], results['n-best']['retry']
+    if top > 0:
+        print(f'retries avoided:      {top - best} of {top} ({(top - best) / top:.0%})')
+
+if __name__ == '__main__':
+    main()
+
+# END
@@ -0,0 +1,48 @@
+# bench_protocol.py
+#
+# Encode cost per frame and bytes on the wire for the Maestro command encoder.
+#
+#   python benchmarks/bench_protocol.py
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.maestro_protocol import MaestroEncoder
+from src.maestro_protocol import MaestroProtocol
+
+ITERATIONS = 200000
+CENTER = 5950
+
+def legacyWriteCmd(servo: int, target: int) -> bytes:
+    # the string based encoding writeCmd() used before the encoder
+    lsb = target & 0x7F
+    msb = (target >> 7) & 0x7F
+    cmd = chr(0xaa) + chr(0xC) + chr(0x04) + chr(servo) + chr(lsb) + chr(msb)
+    return cmd.encode('utf-8')
+
+def bench(name: str, fnc, frame):
+    seconds = timeit.timeit(fnc, number=ITERATIONS)
+    print(f'{name:<36} {seconds / ITERATIONS * 1e9:8.0f} ns/frame {len(frame):4d} bytes')
+
+def main():
+    pololu = MaestroEncoder(MaestroProtocol.Pololu, 0x0C)
+    compact = MaestroEncoder(MaestroProtocol.Compact)
+    targets = [CENTER] * 5
+
+    print('single target')
+    bench('legacy chr() + encode()', lambda: legacyWriteCmd(4, CENTER), legacyWriteCmd(4, CENTER))
+    bench('encoder, pololu protocol', lambda: pololu.setTarget(4, CENTER), bytes(pololu.setTarget(4, CENTER)))
+    bench('encoder, compact protocol', lambda: compact.setTarget(4, CENTER), bytes(compact.setTarget(4, CENTER)))
+
+    print('center all five servos')
+    bench('legacy, five frames', lambda: [legacyWriteCmd(i, CENTER) for i in range(5)], b''.join(legacyWriteCmd(i, CENTER) for i in range(5)))
+    bench('encoder, pololu multiple targets', lambda: pololu.setMultipleTargets(0, targets), bytes(pololu.setMultipleTargets(0, targets)))
+    bench('encoder, compact multiple targets', lambda: compact.setMultipleTargets(0, targets), bytes(compact.setMultipleTargets(0, targets)))
+
+if __name__ == '__main__':
+    main()
+
+# END
@@ -0,0 +1,125 @@
+# bench_startup.py
+#
+# Import time and memory of each main.py subcommand, measured in fresh interpreters, next to what
+# starting the speech engine costs (the cost every subcommand paid when tango_bot.py created it on
+# import).
+#
+#   python benchmarks/bench_startup.py [--runs 5]
+#   python benchmarks/bench_startup.py --check     # exit 1 when a subcommand is over its budget
+#
+# --check is the startup regression check: every subcommand has to stay within its import time
+# and RSS budget and must not load the heavy modules of the other subcommands. The module part
+# also runs with the tests (tests/test_startup.py), the timings depend on the machine.
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# what main.py imports for each subcommand
+SUBCOMMAND_IMPORTS = {
+    'gui': 'import main; from src import RunTkinterApp',
+    'speech2text': 'import main; from src import TangBotController, Speech2Text',
+    'dialog': 'import main; from src import Dialog',
+}
+
+# import time (ms, median) and peak RSS (MB) budgets, with headroom for slower boards
+BUDGETS = {
+    'gui': (600.0, 120.0),
+    'speech2text': (400.0, 80.0),
+    'dialog': (50.0, 30.0),
+}
+
+# modules a subcommand must not load
+FORBIDDEN_MODULES = {
+    'gui': ['pyttsx3'],
+    'speech2text': ['tkinter', 'PIL', 'pyttsx3'],
+    'dialog': ['tkinter', 'PIL', 'speech_recognition', 'serial', 'pyttsx3'],
+}
+
+TTS_INIT = 'import pyttsx3; pyttsx3.init().getProperty("voices")'
+
+MEASURE = '''
+import json, sys, time
+start = time.perf_counter()
+{statement}
+seconds = time.perf_counter() - start
+try:
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    rss_mb = rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+except ImportError:
+    rss_mb = None
+print(json.dumps({{'seconds': seconds, 'rss_mb': rss_mb, 'modules': sorted(sys.modules.keys())}}))
+'''
+
+def measure(statement: str):
+    # {'seconds', 'rss_mb', 'modules'} of running `statement` in a new interpreter, None if it failed
+    code = MEASURE.format(statement=statement)
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        lines = result.stderr.strip().splitlines()
+        print(f'  failed: {lines[-1] if len(lines) > 0 else result.returncode}')
+        return None
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def bench(name: str, statement: str, runs: int):
+    samples = [measure(statement) for _ in range(runs)]
+    if None in samples:
+        print(f'{name:<24} unavailable')
+        return None
+    seconds = [sample['seconds'] for sample in samples]
+    report = {
+        'ms': statistics.median(seconds) * 1000,
+        'min_ms': min(seconds) * 1000,
+        'rss_mb': samples[-1]['rss_mb'],
+        'modules': set(samples[-1]['modules']),
+    }
+    rss = f'{report["rss_mb"]:6.1f} MB RSS' if report['rss_mb'] is not None else ''
+    print(f'{name:<24} {report["ms"]:8.1f} ms median {report["min_ms"]:8.1f} ms min {rss}')
+    return report
+
+def checkBudget(subcommand: str, report: dict) -> list:
+    # budget violations of one subcommand
+    if report is None:
+        return [f'{subcommand}: import failed']
+    failures = list()
+    max_ms, max_rss_mb = BUDGETS[subcommand]
+    if report['ms'] > max_ms:
+        failures.append(f'{subcommand}: import took {report["ms"]:.1f} ms, budget {max_ms:.0f} ms')
+    if report['rss_mb'] is not None and report['rss_mb'] > max_rss_mb:
+        failures.append(f'{subcommand}: {report["rss_mb"]:.1f} MB RSS, budget {max_rss_mb:.0f} MB')
+    for module in FORBIDDEN_MODULES[subcommand]:
+        if module in report['modules']:
+            failures.append(f'{subcommand}: imports {module}')
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description='main.py startup time')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--check', action='store_true', help='exit 1 when a subcommand is over its budget')
+    args = parser.parse_args()
+
+    print('import time per subcommand')
+    failures = list()
+    for subcommand, statement in SUBCOMMAND_IMPORTS.items():
+        report = bench(subcommand, statement, args.runs)
+        failures += checkBudget(subcommand, report)
+
+    if args.check:
+        for failure in failures:
+            print(f'FAIL {failure}')
+        sys.exit(1 if len(failures) > 0 else 0)
+
+    print('speech engine start (deferred to the first speak())')
+    bench('pyttsx3.init()', TTS_INIT, args.runs)
+
+if __name__ == '__main__':
+    main()
+
+# END
@@ -0,0 +1,83 @@
+# bench_throughput.py
+#
+# Commands per second and end-to-end latency of TangBotController against a VirtualMaestro
+# (no hardware needed, Linux only).
+#
+#   python benchmarks/bench_throughput.py [--write-timeout 0.2] [--commands 50] [--baudrate 115200]
+#
+# The headline number flushes every command, so each one is a frame on the wire: it measures the
+# serial command path. The burst below it shows what target coalescing makes of the same number
+# of calls (most of them never reach the wire), it is not a throughput number.
+
+import argparse
+import logging
+import os
+import statistics
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.tango_bot import TangBotController
+from src.tango_bot import BotServos
+from src.virtual_maestro import VirtualMaestro
+
+def main():
+    parser = argparse.ArgumentParser(description='TangBotController throughput benchmark')
+    parser.add_argument('--write-timeout', type=float, default=TangBotController.usb_write_timeout)
+    parser.add_argument('--commands', type=int, default=50)
+    parser.add_argument('--latency-samples', type=int, default=20)
+    parser.add_argument('--baudrate', type=int, default=115200)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    with VirtualMaestro(baudrate=args.baudrate) as maestro:
+        bot = TangBotController(usb_name=maestro.port_name)
+        bot.writer.write_timeout = args.write_timeout
+        bot.wait()
+        channel = BotServos.HeadTilt
+
+        # end-to-end latency: call -> target applied on the device
+        latencies = list()
+        for i in range(args.latency_samples):
+            target = 4000 + (i % 2) * 1000 + i
+            start = perf_counter()
+            bot.writeCmd(channel, target)
+            maestro.waitForTarget(channel.value, target, timeout=5)
+            latencies.append(perf_counter() - start)
+
+        # throughput: every command is flushed before the next one, so none is coalesced
+        before = maestro.stats()
+        start = perf_counter()
+        for i in range(args.commands):
+            bot.writeCmd(channel, 4000 + i % 3000)
+            bot.wait()
+        last_target = 4000 + (args.commands - 1) % 3000
+        maestro.waitForTarget(channel.value, last_target, timeout=60)
+        command_time = perf_counter() - start
+        command_frames = maestro.stats()['frames_received'] - before['frames_received']
+
+        # the same calls as a burst: latest-wins coalescing keeps most of them off the wire
+        before = maestro.stats()
+        start = perf_counter()
+        for i in range(args.commands):
+            bot.writeCmd(channel, 4000 + (i + 500) % 3000)
+        call_time = perf_counter() - start
+        maestro.waitForTarget(channel.value, 4000 + (args.commands + 499) % 3000, timeout=60)
+        burst_time = perf_counter() - start
+        burst_frames = maestro.stats()['frames_received'] - before['frames_received']
+
+        print(f'write timeout:        {args.write_timeout} s')
+        print(f'latency (median):     {statistics.median(latencies) * 1000:.2f} ms')
+        print(f'latency (max):        {max(latencies) * 1000:.2f} ms')
+        print(f'commands per second:  {args.commands / command_time:.1f} (each flushed, {command_frames} frames for {args.commands} commands)')
+        print(f'frames per second:    {command_frames / command_time:.1f}')
+        print(f'burst:                {args.commands} calls in {call_time * 1000:.2f} ms, '
+              f'{burst_frames} frames on the wire, last target applied after {burst_time * 1000:.0f} ms')
+        print(f'controller stats:     {bot.commandStats()}')
+        bot.close()
+
+if __name__ == '__main__':
+    main()
+
+# END
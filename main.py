@@ -7,26 +7,58 @@ Spring 2022
 """
 
 import argparse
-from src import Speech2Text
-from src import RunTkinterApp
-from src import TangBotController
-from src import Dialog
+
+# each subcommand imports only what it uses (tkinter, speech_recognition, pyserial, pyttsx3, ...)
+
+def runSpeech2Text(args):
+    from src import Speech2Text
+    from src import TangBotController
+    bot = TangBotController(reconnect=True, voice=args.voice)
+    s2t = Speech2Text(bot, recognizer_name=args.recognizer)
+    if not s2t.start():
+        raise SystemExit(1)
+
+def runGui(args):
+    from src import RunTkinterApp
+    RunTkinterApp(recognizer_name=args.recognizer, voice=args.voice)
+
+def runDialog(args):
+    from src import Dialog
+    bot, bus = None, None
+    if args.robot:
+        # the responses are spoken by the robot, through the same command bus as the other front-ends
+        from src import CommandBus
+        from src import TangBotController
+        bot = TangBotController(reconnect=True, voice=args.voice)
+        bus = CommandBus(bot.commands)
+    dialog = Dialog(bus=bus)
+    try:
+        dialog.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if bus is not None:
+            bus.publish('stop')
+            bus.close()
+            bot.wait()
+
+SUBCOMMANDS = {
+    'gui': runGui,
+    'speech2text': runSpeech2Text,
+    'dialog': runDialog,
+}
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Tango Bots')
-    parser.add_argument('app', help='Application', type=str, choices=['gui', 'speech2text', 'dialog'])
+    parser.add_argument('app', help='Application', type=str, choices=list(SUBCOMMANDS.keys()))
+    # same names as src.recognizers.RECOGNIZER_BACKENDS, not imported so dialog does not load speech_recognition
+    parser.add_argument('--recognizer', help='Speech recognizer, auto prefers the offline engines', type=str, default='auto',
+                        choices=['auto', 'hedged', 'vosk', 'sphinx', 'google'])
+    # name, id or index of the speech voice (default: index 10, see TangBotController.DEFAULT_VOICE)
+    parser.add_argument('--voice', help='Speech voice: part of its name, its id or its index', type=str, default='10')
+    # off by default, so dialog starts without pyserial and pyttsx3
+    parser.add_argument('--robot', help='dialog: speak the responses on the robot', action='store_true')
     args = parser.parse_args()
-    if args.app == 'speech2text':
-        bot = TangBotController()
-        s2t = Speech2Text(bot)
-        s2t.start()
-    elif args.app == 'gui':
-        RunTkinterApp()
-    elif args.app == 'dialog':
-        dialog = Dialog()
-        try:
-            dialog.run()
-        except KeyboardInterrupt:
-            pass
+    SUBCOMMANDS[args.app](args)
 
 # END main.py
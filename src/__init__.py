@@ -1,10 +1,29 @@
 # __init__.py
+#
+# The names below are imported on first access, so `from src import Dialog` does not load
+# tkinter, PIL, speech_recognition, pyserial or pyttsx3.
 
-from .usb import getUSB
-from .log import log
-from .tango_bot import TangBotController
-from .tkinter_app import run_app as RunTkinterApp
-from .speech2text import Speech2Text
-from .dialog import Dialog
+import importlib
+from .log import log        # cheap, and `src.log` would otherwise become the submodule on first import
+
+LAZY_NAMES = {
+    'getUSB': ('.usb', 'getUSB'),
+    'TangBotController': ('.tango_bot', 'TangBotController'),
+    'AsyncTangBotController': ('.async_tango_bot', 'AsyncTangBotController'),
+    'RunTkinterApp': ('.tkinter_app', 'run_app'),
+    'Speech2Text': ('.speech2text', 'Speech2Text'),
+    'Dialog': ('.dialog', 'Dialog'),
+    'CommandBus': ('.commands', 'CommandBus'),
+}
+
+__all__ = ['log'] + list(LAZY_NAMES.keys())
+
+def __getattr__(name: str):
+    if name not in LAZY_NAMES:
+        raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
+    module_name, attribute = LAZY_NAMES[name]
+    value = getattr(importlib.import_module(module_name, __name__), attribute)
+    globals()[name] = value
+    return value
 
 # END
@@ -0,0 +1,197 @@
+# async_tango_bot.py
+
+import asyncio
+from .log import log
+from .tango_bot import TangBotController
+from .tango_bot import BotServos
+from .tango_bot import DirectionState
+
+# controller property holding the target of each positional servo
+SERVO_PROPERTY = {
+    BotServos.Waist: 'WAIST',
+    BotServos.HeadPan: 'HEAD_TURN',
+    BotServos.HeadTilt: 'HEAD_TILT',
+}
+
+class AsyncTangBotController:
+    """asyncio front-end for a TangBotController
+
+    Commands are handed to the controller's writer thread and every wait (flush, position
+    queries, turn durations) is awaited on the event loop, so one loop can drive speech, dialog
+    and motion at the same time. Moves awaited with `wait=True` and timed turns are cancellable:
+    a cancelled turn stops the wheels and a cancelled move holds the servos where they are.
+    """
+
+    bot: TangBotController
+    poll_interval: float = 0.02     # time between position queries while waiting for a move
+
+    # constructor
+    def __init__(self, bot: TangBotController = None, usb_name: str = None):
+        if bot is None:
+            bot = TangBotController(usb_name=usb_name)
+        self.bot = bot
+
+    """Serial I/O"""
+
+    async def wait(self):
+        await asyncio.wrap_future(self.bot.writer.submitFlush())
+
+    async def query(self, encode, args: tuple, response_length: int, timeout: float = 1.0):
+        future = self.bot.writer.submitQuery(encode, args, response_length)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def getPosition(self, bot_servo: BotServos):
+        response = await self.query(self.bot.encoder.getPosition, (bot_servo.value,), 2)
+        if response is None:
+            return None
+        return response[0] | (response[1] << 8)
+
+    async def isMoving(self):
+        response = await self.query(self.bot.encoder.getMovingState, (), 1)
+        if response is None:
+            return None
+        return response[0] != 0x00
+
+    async def waitUntilArrived(self, bot_servos: list = None, timeout: float = 2.0) -> bool:
+        if self.bot.usb is None:
+            return True
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            arrived = await self.hasArrived(bot_servos)
+            remaining = deadline - loop.time()
+            if arrived is None:
+                # no feedback, fall back to a plain sleep
+                await asyncio.sleep(max(0, remaining))
+                return False
+            if arrived:
+                return True
+            if remaining <= 0:
+                return False
+            await asyncio.sleep(min(self.poll_interval, remaining))
+
+    async def hasArrived(self, bot_servos: list = None):
+        if bot_servos is None:
+            moving = await self.isMoving()
+            return None if moving is None else not moving
+        for servo in bot_servos:
+            position = await self.getPosition(servo)
+            if position is None:
+                return None
+            if position != self.bot.writer.shadowTarget(servo, self.bot.encodeTargets):
+                return False
+        return True
+
+    async def holdPosition(self, bot_servos: list):
+        # retarget the servos to where they are now
+        for servo in bot_servos:
+            position = await self.getPosition(servo)
+            if position is None or servo not in SERVO_PROPERTY:
+                continue
+            setattr(self.bot, SERVO_PROPERTY[servo], position)
+
+    async def move(self, command, bot_servos: list, wait: bool):
+        command()
+        if not wait:
+            return
+        try:
+            await self.waitUntilArrived(bot_servos)
+        except asyncio.CancelledError:
+            log.debug('Move cancelled, holding %s', bot_servos)
+            await self.holdPosition(bot_servos)
+            raise
+
+    """HEAD Movement Methods"""
+
+    async def moveHeadUp(self, wait: bool = False):
+        await self.move(self.bot.moveHeadUp, [BotServos.HeadTilt], wait)
+
+    async def moveHeadDown(self, wait: bool = False):
+        await self.move(self.bot.moveHeadDown, [BotServos.HeadTilt], wait)
+
+    async def moveHeadLeft(self, wait: bool = False):
+        await self.move(self.bot.moveHeadLeft, [BotServos.HeadPan], wait)
+
+    async def moveHeadRight(self, wait: bool = False):
+        await self.move(self.bot.moveHeadRight, [BotServos.HeadPan], wait)
+
+    async def centerHead(self, wait: bool = False):
+        await self.move(self.bot.centerHead, [BotServos.HeadPan, BotServos.HeadTilt], wait)
+
+    """WAIST Movement Methods"""
+
+    async def moveWaistLeft(self, wait: bool = False):
+        await self.move(self.bot.moveWaistLeft, [BotServos.Waist], wait)
+
+    async def moveWaistRight(self, wait: bool = False):
+        await self.move(self.bot.moveWaistRight, [BotServos.Waist], wait)
+
+    async def centerWaist(self, wait: bool = False):
+        await self.move(self.bot.centerWaist, [BotServos.Waist], wait)
+
+    async def centerAll(self, wait: bool = False):
+        await self.move(self.bot.centerAll, list(SERVO_PROPERTY.keys()), wait)
+
+    """WHEEL Movement Methods"""
+
+    async def increaseWheelSpeed(self, speed_level: int = None):
+        self.bot.increaseWheelSpeed(speed_level)
+
+    async def decreaseWheelSpeed(self, speed_level: int = None):
+        self.bot.decreaseWheelSpeed(speed_level)
+
+    async def stop(self):
+        self.bot.stop()
+
+    async def drive(self, speed_level: int, duration: float, forwards: bool = True):
+        # drive for `duration` seconds, the wheels are stopped even if this is cancelled
+        if forwards:
+            self.bot.increaseWheelSpeed(speed_level)
+        else:
+            self.bot.decreaseWheelSpeed(speed_level)
+        try:
+            # the duration starts once the wheels were told to move
+            await self.wait()
+            await asyncio.sleep(duration)
+        finally:
+            self.bot.stop()
+
+    async def turnLeft(self, duration: float = 0.5):
+        await self.turn(DirectionState.LeftTurn, 7500, duration)
+
+    async def turnRight(self, duration: float = 0.5):
+        await self.turn(DirectionState.RightTurn, 4500, duration)
+
+    async def turn(self, direction: DirectionState, wheel_speed: int, duration: float):
+        self.bot.DIRECTION_STATE = direction
+        self.bot.WHEEL_SPEED = wheel_speed
+        try:
+            await self.wait()
+            await asyncio.sleep(duration)
+        finally:
+            self.bot.stop()
+
+    """Speed Movement Methods"""
+
+    async def setSpeedLevelOne(self):
+        self.bot.setSpeedLevelOne()
+
+    async def setSpeedLevelTwo(self):
+        self.bot.setSpeedLevelTwo()
+
+    async def setSpeedLevelThree(self):
+        self.bot.setSpeedLevelThree()
+
+    async def speak(self, text: str, interrupt: bool = False):
+        # resolves once the speech worker has spoken the text
+        await asyncio.wrap_future(self.bot.speak(text, interrupt))
+
+    async def close(self):
+        self.bot.stop()
+        await self.wait()
+        self.bot.close()
+
+# END
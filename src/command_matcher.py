@@ -0,0 +1,125 @@
+# command_matcher.py
+
+import re
+from functools import lru_cache
+
+# spelling -> sound rewrites applied before the vowels are dropped, in order
+PHONETIC_RULES = [
+    (re.compile(r'ph'), 'f'),
+    (re.compile(r'gh'), 'f'),
+    (re.compile(r'ck'), 'k'),
+    (re.compile(r'c(?=[eiy])'), 's'),
+    (re.compile(r'[cq]'), 'k'),
+    (re.compile(r'x'), 'ks'),
+    (re.compile(r'z'), 's'),
+    (re.compile(r'dt|td'), 't'),
+    (re.compile(r'd\b'), 't'),
+    (re.compile(r'(?<=.)[aeiouyhw]'), ''),
+    (re.compile(r'^[aeiouy]'), 'a'),
+    (re.compile(r'(.)\1+'), r'\1'),
+]
+
+DIGIT_WORDS = ['zero', 'one', 'two', 'three', 'four', 'five', 'six', 'seven', 'eight', 'nine']
+
+PHONETIC_WEIGHT = 0.95      # a phrase that only sounds the same never beats the exact spelling
+
+def normalize(text: str) -> str:
+    # lowercase words, no punctuation, single spaces, digits spelled out ("speed 2" -> "speed two")
+    words = re.findall(r"[a-z0-9']+", text.lower())
+    return ' '.join(DIGIT_WORDS[int(word)] if len(word) == 1 and word.isdigit() else word for word in words)
+
+def phoneticKey(word: str) -> str:
+    """Rough sound of a word: consonant skeleton, so "app"/"up" and "lift"/"left" share a key"""
+    key = word.replace("'", '')
+    for pattern, replacement in PHONETIC_RULES:
+        key = pattern.sub(replacement, key)
+    return key
+
+def editDistance(a: str, b: str) -> int:
+    # Levenshtein distance, one row at a time
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        previous = current
+    return previous[-1]
+
+def similarity(a: str, b: str) -> float:
+    # 1.0 for equal strings, 0.0 for nothing in common
+    longest = max(len(a), len(b))
+    return 1.0 - editDistance(a, b) / longest if longest > 0 else 1.0
+
+class CommandMatch:
+    """A transcription resolved to a command phrase"""
+
+    phrase: str                 # vocabulary phrase, e.g. "head up"
+    command = None              # what the phrase maps to (method name, event type, ...)
+    confidence: float           # 0.0 - 1.0, 1.0 for an exact match
+
+    # constructor
+    def __init__(self, phrase: str, command, confidence: float):
+        self.phrase = phrase
+        self.command = command
+        self.confidence = confidence
+
+    def __repr__(self):
+        return f'CommandMatch({self.phrase!r}, {self.command!r}, {self.confidence:.2f})'
+
+class CommandMatcher:
+    """Resolves transcriptions to the closest command phrase
+
+    The vocabulary (phrase -> command) is indexed once: the normalized text and the phonetic key
+    of every phrase. A transcription scores against every phrase by edit distance over both its
+    spelling and its sound (the better of the two counts), so "head app" still is "head up" and
+    "turn lift" is "turn left". The best phrase wins if it scores at least `threshold` and is
+    `margin` ahead of the best phrase for a different command; otherwise nothing matches.
+    Results are cached, recognizers tend to repeat their mistakes.
+    """
+
+    vocabulary: dict            # normalized phrase -> command
+    index: list                 # (normalized phrase, phonetic key) of every phrase
+    threshold: float
+    margin: float
+
+    # constructor
+    def __init__(self, vocabulary: dict, threshold: float = 0.75, margin: float = 0.05, cache_size: int = 256):
+        self.vocabulary = {normalize(phrase): command for phrase, command in vocabulary.items()}
+        self.index = [(phrase, self.phraseKey(phrase)) for phrase in self.vocabulary.keys()]
+        self.threshold = threshold
+        self.margin = margin
+        self.match = lru_cache(maxsize=cache_size)(self.match)
+
+    @staticmethod
+    def phraseKey(phrase: str) -> str:
+        return ' '.join(phoneticKey(word) for word in phrase.split(' '))
+
+    def scores(self, text: str) -> list:
+        # (confidence, phrase) of every phrase, best first
+        key = self.phraseKey(text)
+        scores = [(max(similarity(text, phrase), PHONETIC_WEIGHT * similarity(key, phrase_key)), phrase) for phrase, phrase_key in self.index]
+        return sorted(scores, reverse=True)
+
+    def match(self, transcription: str):
+        """CommandMatch of the closest phrase, None if no phrase is close enough"""
+        text = normalize(transcription)
+        if text in self.vocabulary:
+            return CommandMatch(text, self.vocabulary[text], 1.0)
+        if len(text) == 0:
+            return None
+        scores = self.scores(text)
+        confidence, phrase = scores[0]
+        if confidence < self.threshold:
+            return None
+        command = self.vocabulary[phrase]
+        for runner_up, other in scores[1:]:
+            if self.vocabulary[other] != command:
+                if confidence - runner_up < self.margin:
+                    # too close to call, better to ask again than to run the wrong command
+                    return None
+                break
+        return CommandMatch(phrase, command, confidence)
+
+# END
@@ -0,0 +1,119 @@
+# command_parser.py
+
+import re
+from .command_matcher import CommandMatcher
+from .command_matcher import DIGIT_WORDS
+from .command_matcher import normalize
+from .log import log
+
+SEPARATORS = re.compile(r'\s*(?:,|\band then\b|\bthen\b|\band\b|\bafter that\b)\s*')
+COUNT_SUFFIX = re.compile(r'^(.*?)\s+(?:(once|twice|thrice)|(\w+)\s+times)$')
+SPEED_SUFFIX = re.compile(r'^(.*?)\s+(?:at\s+)?(?:speed|level)\s+(\w+)$')
+COUNT_WORDS = {'once': 1, 'twice': 2, 'thrice': 3}
+
+# what the offline recognizers may hear around the command phrases, see grammarPhrases()
+SEPARATOR_PHRASES = ['and', 'then', 'and then', 'after that']
+COUNT_PHRASES = list(COUNT_WORDS.keys()) + [f'{DIGIT_WORDS[count]} times' for count in range(2, 6)]
+SPEED_PHRASES = [f'{at}{word} {DIGIT_WORDS[level]}' for at in ('', 'at ') for word in ('speed', 'level') for level in (1, 2, 3)]
+
+def numberWord(word: str):
+    # "two" / "2" -> 2, None if it is not a number
+    if word.isdigit():
+        return int(word)
+    return DIGIT_WORDS.index(word) if word in DIGIT_WORDS else None
+
+def grammarPhrases(phrases: list) -> list:
+    """The command phrases plus the separators, counts and speed levels the parser understands
+
+    For recognizers that take a phrase list (Vosk), so "head up twice and then turn left" is
+    in their vocabulary and not only the single commands.
+    """
+    return list(phrases) + SEPARATOR_PHRASES + COUNT_PHRASES + SPEED_PHRASES
+
+def jsgfGrammar(phrases: list, name: str = 'commands') -> str:
+    """JSGF grammar (PocketSphinx) of one or more commands, each with an optional speed level and count
+
+    speech_recognition loads the public rule `<name>.<name>` of a grammar file `<name>.jsgf`, so
+    the file has to be named after the grammar.
+    """
+    return '\n'.join([
+        '#JSGF V1.0;',
+        f'grammar {name};',
+        f'<phrase> = {" | ".join(phrases)};',
+        f'<speed> = {" | ".join(SPEED_PHRASES)};',
+        f'<count> = {" | ".join(COUNT_PHRASES)};',
+        f'<separator> = {" | ".join(SEPARATOR_PHRASES)};',
+        '<step> = <phrase> [<speed>] [<count>];',
+        f'public <{name}> = <step> (<separator> <step>)*;',
+    ]) + '\n'
+
+class CommandParser:
+    """Splits a transcription into an ordered plan of commands
+
+    "head up twice and then turn left" -> [('moveHeadUp', {}, 2), ('turnLeft', {}, 1)]
+
+    Commands are separated by "and", "then", "after that" and commas; every part is resolved
+    with the CommandMatcher, so near misses still count. A part can end in a count ("twice",
+    "three times") and, for the `speed_commands`, a speed level ("forward at speed two"). If any
+    part does not resolve the whole transcription is rejected, half a plan is worse than asking
+    again.
+    """
+
+    matcher: CommandMatcher
+    speed_commands: set         # commands that take a `speed_level` keyword argument
+    speed_levels: tuple         # valid speed levels
+    max_count: int              # repeats are capped, "head up ninety times" is a misrecognition
+
+    # constructor
+    def __init__(self, matcher: CommandMatcher, speed_commands: set = None, speed_levels: tuple = (1, 2, 3), max_count: int = 5):
+        self.matcher = matcher
+        self.speed_commands = speed_commands if speed_commands is not None else set()
+        self.speed_levels = speed_levels
+        self.max_count = max_count
+
+    def parse(self, transcription: str):
+        """List of (command, kwargs, count), None if a part is not a command"""
+        result = self.parseScored(transcription)
+        return result[0] if result is not None else None
+
+    def parseScored(self, transcription: str):
+        """(plan, confidence) with the confidence of the weakest part, None if a part is not a command"""
+        plan = list()
+        confidence = 1.0
+        for part in SEPARATORS.split(transcription.lower()):
+            part = normalize(part)
+            if len(part) == 0:
+                continue
+            result = self.parseStep(part)
+            if result is None:
+                log.debug('Not a command: "%s" in "%s"', part, transcription)
+                return None
+            step, step_confidence = result
+            plan.append(step)
+            confidence = min(confidence, step_confidence)
+        return (plan, confidence) if len(plan) > 0 else None
+
+    def parseStep(self, part: str):
+        # (step, match confidence), None if the part is not a command
+        count = 1
+        result = COUNT_SUFFIX.match(part)
+        if result is not None:
+            word_count, number = result.group(2), result.group(3)
+            count = COUNT_WORDS[word_count] if word_count is not None else numberWord(number)
+            if count is None:
+                count = 1
+            else:
+                part = result.group(1)
+        count = min(max(count, 1), self.max_count)
+        # "forward speed two" is forward with a speed level, "speed two" alone is its own command
+        result = SPEED_SUFFIX.match(part)
+        if result is not None and numberWord(result.group(2)) in self.speed_levels:
+            match = self.matcher.match(result.group(1))
+            if match is not None and match.command in self.speed_commands:
+                return (match.command, {'speed_level': numberWord(result.group(2))}, count), match.confidence
+        match = self.matcher.match(part)
+        if match is None:
+            return None
+        return (match.command, {}, count), match.confidence
+
+# END
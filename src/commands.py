@@ -0,0 +1,196 @@
+# commands.py
+
+import threading
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError
+from queue import Queue
+from time import perf_counter
+from .log import log
+
+# spoken phrase -> controller method
+PHRASE_BOT_DICT = {
+    'head up': 'moveHeadUp',
+    'head down': 'moveHeadDown',
+    'head left': 'moveHeadLeft',
+    'head right': 'moveHeadRight',
+    'head center': 'centerHead',
+    'body left': 'moveWaistLeft',
+    'body right': 'moveWaistRight',
+    'body center': 'centerWaist',
+    'forward': 'increaseWheelSpeed',
+    'reverse': 'decreaseWheelSpeed',
+    'turn left': 'turnLeft',
+    'turn right': 'turnRight',
+    'stop': 'stop',
+    'speed one': 'setSpeedLevelOne',
+    'speed two': 'setSpeedLevelTwo',
+    'speed three': 'setSpeedLevelThree',
+}
+
+# every controller method a front-end may run, the phrases' methods plus sequencing and speech
+COMMAND_NAMES = sorted(set(PHRASE_BOT_DICT.values()) | {
+    'centerAll',
+    'speak',
+    'hold',
+    'waitUntilArrived',
+})
+
+class CommandRegistry:
+    """Command names resolved once into bound methods of one controller
+
+    Plans are lists of (command name, kwargs, count) steps. `run()` checks the whole plan
+    before anything moves, then calls the bound methods directly.
+    """
+
+    bot = None                      # TangBotController (or a ScriptRecorder)
+    handlers: dict                  # command name -> bound method
+
+    # constructor
+    def __init__(self, bot, names: list = COMMAND_NAMES):
+        self.bot = bot
+        self.handlers = dict()
+        for name in names:
+            handler = getattr(bot, name, None)
+            if not callable(handler):
+                raise ValueError(f'{bot.__class__.__name__} has no command "{name}"')
+            self.handlers[name] = handler
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.handlers
+
+    def check(self, plan: list):
+        for name, kwargs, count in plan:
+            if name not in self.handlers:
+                raise ValueError(f'Unknown command "{name}"')
+
+    def run(self, plan: list, settle_timeout: float = None):
+        """Run the steps in order, repeating each `count` times
+
+        With `settle_timeout` the controller waits (at most that long) for the servos to settle
+        between steps.
+        """
+        self.check(plan)
+        for index, (name, kwargs, count) in enumerate(plan):
+            handler = self.handlers[name]
+            for _ in range(count):
+                handler(**kwargs)
+            if settle_timeout is not None and index < len(plan) - 1:
+                self.bot.waitUntilArrived(timeout=settle_timeout)
+
+class CommandBus:
+    """Thread-safe command queue with a single consumer thread that owns the robot
+
+    The GUI, speech and dialog front-ends publish commands (or whole plans) from their own
+    threads and get a Future back; the consumer runs them one after another through the
+    CommandRegistry, so the controller is only ever driven from one thread. Work that drives the
+    controller itself (e.g. a Maestro script run) is published with `publishCall`. `stats()`
+    reports the command throughput and the latency from publishing until a command finished.
+    """
+
+    registry: CommandRegistry
+    queue: Queue                    # (job, description, commands, future, published time), None to stop
+    thread: threading.Thread
+    lock: threading.Lock            # guards the counters
+    started: float                  # perf_counter() when the bus was created
+    published: int = 0              # plans published
+    executed: int = 0               # plans finished
+    failed: int = 0                 # plans that raised
+    commands: int = 0               # commands (steps times counts) of the finished plans
+    total_latency: float = 0.0      # seconds from publish until finished
+    max_latency: float = 0.0
+
+    # constructor
+    def __init__(self, registry: CommandRegistry):
+        self.registry = registry
+        self.queue = Queue()
+        self.lock = threading.Lock()
+        self.started = perf_counter()
+        self.thread = threading.Thread(target=self.threadedConsuming, name='command-bus', daemon=True)
+        self.thread.start()
+
+    def publish(self, name: str, **kwargs) -> Future:
+        return self.publishPlan([(name, kwargs, 1)])
+
+    def publishPlan(self, plan: list, settle_timeout: float = None) -> Future:
+        """Queue a plan, the Future resolves once it ran (or to its exception)
+
+        Unknown commands raise ValueError right away, on the publishing thread.
+        """
+        self.registry.check(plan)
+
+        def runPlan():
+            self.registry.run(plan, settle_timeout)
+            return True
+
+        # an empty plan is a flush(), it is not counted
+        return self.enqueue(runPlan, plan if len(plan) > 0 else None, sum(count for _, _, count in plan))
+
+    def publishCall(self, function, *args, **kwargs) -> Future:
+        """Queue `function(*args, **kwargs)` to run on the bus thread, the Future resolves to its result
+
+        For work that drives the controller directly instead of through commands; it runs
+        after everything published before it, and nothing else runs until it returns.
+        """
+        return self.enqueue(lambda: function(*args, **kwargs), function.__name__, 0)
+
+    def enqueue(self, job, description, commands: int) -> Future:
+        future = Future()
+        if description is not None:
+            with self.lock:
+                self.published += 1
+        self.queue.put((job, description, commands, future, perf_counter()))
+        return future
+
+    def flush(self, timeout: float = None) -> bool:
+        # block until everything published so far ran, False if `timeout` expired first
+        future = self.publishPlan([])
+        try:
+            future.result(timeout)
+        except TimeoutError:
+            return False
+        return True
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+    def threadedConsuming(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            job, description, commands, future, published = item
+            try:
+                result = job()
+            except Exception as err:
+                log.error('Command failed %s: %s', description, err)
+                with self.lock:
+                    self.failed += 1
+                future.set_exception(err)
+                continue
+            latency = perf_counter() - published
+            if description is None:
+                # flush()
+                future.set_result(result)
+                continue
+            with self.lock:
+                self.executed += 1
+                self.commands += commands
+                self.total_latency += latency
+                self.max_latency = max(self.max_latency, latency)
+            future.set_result(result)
+
+    def stats(self) -> dict:
+        with self.lock:
+            elapsed = perf_counter() - self.started
+            return {
+                'published': self.published,
+                'executed': self.executed,
+                'failed': self.failed,
+                'queue_depth': self.queue.qsize(),
+                'commands_per_second': self.commands / elapsed if elapsed > 0 else 0.0,
+                'mean_latency': self.total_latency / self.executed if self.executed > 0 else 0.0,
+                'max_latency': self.max_latency,
+            }
+
+# END
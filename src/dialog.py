@@ -142,8 +142,10 @@ class Dialog:
     commands_hierarchy: dict = dict()
     active_command : Command = None
     variables: dict = dict()
+    bus = None                      # CommandBus the responses are spoken on, None to only print them
 
-    def __init__(self, file: str = 'dialog.txt'):
+    def __init__(self, file: str = 'dialog.txt', bus = None):
+        self.bus = bus
         self.readFile(file)
         self.parseInstructions()
         self.buildCommandHierarchy()
@@ -186,6 +188,8 @@ class Dialog:
             log.error('Invalid input: "%s"', input_cmd)
         else:
             print(result)
+            if self.bus is not None:
+                self.bus.publish('speak', text=result)
 
     def readFile(self, file: str):
         if os.path.exists(file):
@@ -0,0 +1,110 @@
+# fleet.py
+
+import statistics
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+from .log import log
+from .usb import getUSB
+from .usb import UsbReconnector
+from .serial_writer import SerialWriter
+from .tango_bot import TangBotController
+from .text_to_speech import TextToSpeech
+
+class FleetRobot:
+    name: str
+    usb_name: str               # serial port, robots on the same port are daisy-chained Maestros
+    device_number: int          # Pololu protocol device number of the robot's Maestro
+
+    # constructor
+    def __init__(self, name: str, usb_name: str, device_number: int = TangBotController.DEVICE_NUMBER):
+        self.name = name
+        self.usb_name = usb_name
+        self.device_number = device_number
+
+class Fleet:
+    """Drives several Tango bots across serial ports and Pololu device numbers
+
+    Every port gets one SerialWriter thread, shared by the robots (Maestros) on that port.
+    `send()` runs one logical command on all or some robots in parallel and reports how long
+    each robot took until its command was written.
+    """
+
+    robots: dict                # name -> TangBotController
+    writers: dict               # usb_name -> SerialWriter
+    reconnectors: list          # one UsbReconnector per port when `reconnect` is True
+    latencies: dict             # name -> list of seconds, one per send()
+    tts: TextToSpeech           # one speech worker for every robot (pyttsx3 has one engine per process)
+    lock: threading.Lock
+    executor: ThreadPoolExecutor
+
+    # constructor
+    def __init__(self, robots: list, write_timeout: float = TangBotController.usb_write_timeout, reconnect: bool = False, voice: str = TangBotController.DEFAULT_VOICE):
+        self.tts = TextToSpeech(voice_name=voice)
+        self.robots = dict()
+        self.writers = dict()
+        self.reconnectors = list()
+        self.latencies = dict()
+        self.lock = threading.Lock()
+        for robot in robots:
+            if robot.name in self.robots:
+                raise ValueError(f'Duplicate robot name "{robot.name}"')
+            if robot.usb_name not in self.writers:
+                # exits safe-start once per port (and again after a reconnect), for every robot on it
+                self.writers[robot.usb_name] = SerialWriter(getUSB(robot.usb_name), write_timeout, connect_frame=TangBotController.EXIT_SAFE_START)
+                if reconnect:
+                    self.reconnectors.append(UsbReconnector(self.writers[robot.usb_name], robot.usb_name))
+            self.robots[robot.name] = TangBotController(device_number=robot.device_number, writer=self.writers[robot.usb_name], tts=self.tts)
+            self.latencies[robot.name] = list()
+        self.executor = ThreadPoolExecutor(max_workers=max(1, len(self.robots)), thread_name_prefix='fleet')
+
+    def __getitem__(self, name: str) -> TangBotController:
+        return self.robots[name]
+
+    def send(self, command: str, *args, robots: list = None, wait: bool = True, **kwargs) -> dict:
+        """Call `command` (a name from the robots' CommandRegistry) on `robots` (default: all) in parallel
+
+        Returns robot name -> latency in seconds, measured until the command is written to the USB
+        when `wait` is True, or until the call returned otherwise.
+        """
+        names = list(self.robots.keys()) if robots is None else robots
+        for name in names:
+            # reject unknown commands before any robot moves
+            self.robots[name].commands.check([(command, kwargs, 1)])
+        futures = {name: self.executor.submit(self.runCommand, name, command, args, kwargs, wait) for name in names}
+        latencies = {name: future.result() for name, future in futures.items()}
+        with self.lock:
+            for name, latency in latencies.items():
+                self.latencies[name].append(latency)
+        log.debug('Fleet %s: %s', command, ', '.join(f'{name} {latency * 1000:.1f}ms' for name, latency in latencies.items()))
+        return latencies
+
+    def runCommand(self, name: str, command: str, args: tuple, kwargs: dict, wait: bool) -> float:
+        bot = self.robots[name]
+        start = perf_counter()
+        bot.commands.handlers[command](*args, **kwargs)
+        if wait:
+            bot.wait()
+        return perf_counter() - start
+
+    def latencyReport(self) -> dict:
+        # robot name -> {'count', 'mean', 'max'} in seconds
+        report = dict()
+        with self.lock:
+            for name, latencies in self.latencies.items():
+                report[name] = {
+                    'count': len(latencies),
+                    'mean': statistics.fmean(latencies) if len(latencies) > 0 else 0.0,
+                    'max': max(latencies) if len(latencies) > 0 else 0.0,
+                }
+        return report
+
+    def close(self):
+        self.send('stop')
+        self.executor.shutdown()
+        for reconnector in self.reconnectors:
+            reconnector.stop()
+        for writer in self.writers.values():
+            writer.close()
+
+# END
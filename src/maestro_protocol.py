@@ -0,0 +1,121 @@
+# maestro_protocol.py
+
+from enum import Enum
+
+class MaestroProtocol(Enum):
+    Pololu = 'Pololu'       # 0xAA, device number, command byte with the MSB cleared, data...
+    Compact = 'Compact'     # command byte, data...
+
+class MaestroCommand:
+    # command bytes as sent with the compact protocol
+    EXIT_SAFE_START = 0x83      # see TangBotController.EXIT_SAFE_START
+    SET_TARGET = 0x84
+    SET_SPEED = 0x87
+    SET_ACCELERATION = 0x89
+    GET_POSITION = 0x90
+    GET_MOVING_STATE = 0x93
+    SET_MULTIPLE_TARGETS = 0x9F
+    GET_ERRORS = 0xA1
+    GO_HOME = 0xA2
+    STOP_SCRIPT = 0xA4
+    RESTART_SCRIPT_AT_SUBROUTINE = 0xA7
+    GET_SCRIPT_STATUS = 0xAE
+
+POLOLU_START_BYTE = 0xAA
+MAX_CHANNELS = 24
+
+class MaestroEncoder:
+    """Encodes Maestro serial commands into a preallocated buffer
+
+    Every encode method writes the frame into the same bytearray and returns a memoryview
+    of it, so no objects are created per command. The view is only valid until the next
+    encode call; write it to the USB before encoding another command. An encoder is meant to
+    be used from a single thread (the serial writer thread).
+    """
+
+    protocol: MaestroProtocol
+    device_number: int
+    buffer: bytearray
+    view: memoryview
+    offset: int             # index of the command byte (2 for the Pololu protocol, 0 for compact)
+    command_mask: int       # the Pololu protocol clears the MSB of the command byte
+
+    # constructor
+    def __init__(self, protocol: MaestroProtocol = MaestroProtocol.Pololu, device_number: int = 0x0C):
+        self.protocol = protocol
+        self.device_number = device_number
+        # largest frame: header + set multiple targets for every channel
+        self.buffer = bytearray(2 + 3 + 2 * MAX_CHANNELS)
+        self.view = memoryview(self.buffer)
+        if protocol is MaestroProtocol.Pololu:
+            self.buffer[0] = POLOLU_START_BYTE
+            self.buffer[1] = device_number & 0x7F
+            self.offset = 2
+            self.command_mask = 0x7F
+        else:
+            self.offset = 0
+            self.command_mask = 0xFF
+
+    def channelValue(self, command: int, channel: int, value: int) -> memoryview:
+        # command, channel, value low 7 bits, value high 7 bits
+        buffer = self.buffer
+        i = self.offset
+        buffer[i] = command & self.command_mask
+        buffer[i + 1] = channel
+        buffer[i + 2] = value & 0x7F
+        buffer[i + 3] = (value >> 7) & 0x7F
+        return self.view[:i + 4]
+
+    def setTarget(self, channel: int, target: int) -> memoryview:
+        return self.channelValue(MaestroCommand.SET_TARGET, channel, target)
+
+    def setSpeed(self, channel: int, speed: int) -> memoryview:
+        return self.channelValue(MaestroCommand.SET_SPEED, channel, speed)
+
+    def setAcceleration(self, channel: int, acceleration: int) -> memoryview:
+        return self.channelValue(MaestroCommand.SET_ACCELERATION, channel, acceleration)
+
+    def setMultipleTargets(self, first_channel: int, targets) -> memoryview:
+        # command, number of targets, first channel, then low/high 7 bits per target
+        buffer = self.buffer
+        i = self.offset
+        buffer[i] = MaestroCommand.SET_MULTIPLE_TARGETS & self.command_mask
+        buffer[i + 2] = first_channel
+        i += 3
+        for target in targets:
+            buffer[i] = target & 0x7F
+            buffer[i + 1] = (target >> 7) & 0x7F
+            i += 2
+        buffer[self.offset + 1] = (i - self.offset - 3) // 2
+        return self.view[:i]
+
+    def command(self, command: int) -> memoryview:
+        self.buffer[self.offset] = command & self.command_mask
+        return self.view[:self.offset + 1]
+
+    def getPosition(self, channel: int) -> memoryview:
+        self.buffer[self.offset] = MaestroCommand.GET_POSITION & self.command_mask
+        self.buffer[self.offset + 1] = channel
+        return self.view[:self.offset + 2]
+
+    def getMovingState(self) -> memoryview:
+        return self.command(MaestroCommand.GET_MOVING_STATE)
+
+    def getErrors(self) -> memoryview:
+        return self.command(MaestroCommand.GET_ERRORS)
+
+    def goHome(self) -> memoryview:
+        return self.command(MaestroCommand.GO_HOME)
+
+    def stopScript(self) -> memoryview:
+        return self.command(MaestroCommand.STOP_SCRIPT)
+
+    def restartScriptAtSubroutine(self, subroutine: int) -> memoryview:
+        self.buffer[self.offset] = MaestroCommand.RESTART_SCRIPT_AT_SUBROUTINE & self.command_mask
+        self.buffer[self.offset + 1] = subroutine
+        return self.view[:self.offset + 2]
+
+    def getScriptStatus(self) -> memoryview:
+        return self.command(MaestroCommand.GET_SCRIPT_STATUS)
+
+# END
@@ -0,0 +1,229 @@
+# maestro_script.py
+
+import os
+import shutil
+import subprocess
+import tempfile
+from time import monotonic
+from time import sleep
+from .log import log
+from .tango_bot import TangBotController
+from .tango_bot import BotServos
+
+MAX_DELAY_MS = 32767        # largest literal the Maestro script stack holds
+WAIT_ALLOWANCE = 2.0        # seconds a 'wait' step is allowed when bounding a script's run time
+
+class ScriptCompileError(ValueError):
+    pass
+
+class ScriptRunError(RuntimeError):
+    pass
+
+class ScriptRecorder(TangBotController):
+    """Runs controller methods without a USB and records what they would do as script steps
+
+    The recorder starts from the servo values of `bot`, so relative moves (e.g. moveHeadUp)
+    compile to the same targets the live controller would write.
+    """
+
+    usb = None                  # never writes to a USB
+    steps: list                 # ('targets', {servo: target}), ('delay', seconds), ('wait', None), ...
+    shadow_targets: dict        # servo -> last recorded target, unchanged targets are not recorded
+
+    # constructor
+    def __init__(self, bot: TangBotController):
+        self.steps = list()
+        self.shadow_targets = dict()
+        self.SPEED = bot.SPEED
+        self._HEAD_TILT = bot.HEAD_TILT
+        self._HEAD_TURN = bot.HEAD_TURN
+        self._WAIST = bot.WAIST
+        self._WHEEL_SPEED = bot.WHEEL_SPEED
+        self._DIRECTION_STATE = bot.DIRECTION_STATE
+        self.servo_speed = dict(bot.servo_speed)
+        self.servo_acceleration = dict(bot.servo_acceleration)
+
+    def setTargets(self, targets: dict, force: bool = False):
+        changed = {servo: target for servo, target in targets.items() if force or self.shadow_targets.get(servo) != target}
+        if len(changed) > 0:
+            self.shadow_targets.update(changed)
+            self.steps.append(('targets', changed))
+
+    def setServoSpeed(self, bot_servo: BotServos, speed: int):
+        self.servo_speed[bot_servo] = speed
+        self.steps.append(('speed', (bot_servo, speed)))
+
+    def setServoAcceleration(self, bot_servo: BotServos, acceleration: int):
+        self.servo_acceleration[bot_servo] = acceleration
+        self.steps.append(('acceleration', (bot_servo, acceleration)))
+
+    def hold(self, seconds: float):
+        self.steps.append(('delay', seconds))
+
+    def waitUntilArrived(self, bot_servos: list = None, timeout: float = 2.0, poll_interval: float = 0.02) -> bool:
+        wheels = (BotServos.WheelTogether, BotServos.WheelTurning)
+        if self.WHEEL_SPEED != self.TARGET_CENTER or (bot_servos is not None and any(servo in wheels for servo in bot_servos)):
+            # the wheel channels have no speed limit and never report moving, waiting on them
+            # would stop the wheels right away: keep them going for the whole timeout instead
+            self.steps.append(('delay', timeout))
+        else:
+            self.steps.append(('wait', None))
+        return True
+
+    def speak(self, text, interrupt: bool = False):
+        raise ScriptCompileError('Speech cannot run on the Maestro')
+
+    def wait(self, timeout: float = None) -> bool:
+        return True
+
+class MaestroScript:
+    """Maestro script source for one sequence, started as subroutine 0"""
+
+    SUBROUTINE = 0
+    lines: list
+    duration: float             # seconds of delays, plus WAIT_ALLOWANCE per wait
+
+    # constructor
+    def __init__(self, steps: list, name: str = 'sequence'):
+        self.lines = list()
+        self.duration = 0.0
+        self.lines.append('# generated by TangoBot, do not edit')
+        # nothing runs on power up, the sequence is started with "restart script at subroutine"
+        self.lines.append('quit')
+        self.lines.append(f'sub {name}')
+        for kind, value in steps:
+            if kind == 'targets':
+                for servo in sorted(value, key=lambda servo: servo.value):
+                    self.lines.append(f'  {value[servo]} {servo.value} servo')
+            elif kind == 'speed':
+                self.lines.append(f'  {value[1]} {value[0].value} speed')
+            elif kind == 'acceleration':
+                self.lines.append(f'  {value[1]} {value[0].value} acceleration')
+            elif kind == 'delay':
+                self.duration += value
+                ms = int(round(value * 1000))
+                while ms > 0:
+                    self.lines.append(f'  {min(ms, MAX_DELAY_MS)} delay')
+                    ms -= MAX_DELAY_MS
+            elif kind == 'wait':
+                self.duration += WAIT_ALLOWANCE
+                self.lines.append('  begin get_moving_state while repeat')
+        self.lines.append('  quit')
+
+    @property
+    def source(self) -> str:
+        return '\n'.join(self.lines) + '\n'
+
+    def __str__(self):
+        return self.source
+
+def compileEvents(events: list, bot: TangBotController) -> MaestroScript:
+    """Compile BotEvents (anything with `steps()`, see commands.py) into a Maestro script
+
+    Raises ScriptCompileError if an event cannot run on the Maestro (e.g. speech).
+    """
+    recorder = ScriptRecorder(bot)
+    for event in events:
+        recorder.commands.run(event.steps())
+    # finish like runEvents(): stopped and centered
+    recorder.centerAll()
+    return MaestroScript(recorder.steps)
+
+class MaestroScriptRunner:
+    """Loads a MaestroScript onto the Maestro and runs it
+
+    The serial command port cannot write script memory, so the script is loaded with Pololu's
+    `UscCmd --program` (it compiles the script to bytecode and loads it over the native USB
+    interface). Starting, stopping and polling the script go through the controller's serial writer.
+    """
+
+    bot: TangBotController
+    usccmd: str                 # path to UscCmd, None if it is not installed
+    device_serial: str          # UscCmd --device, None for the only connected Maestro
+
+    # constructor
+    def __init__(self, bot: TangBotController, usccmd: str = None, device_serial: str = None):
+        self.bot = bot
+        self.usccmd = usccmd if usccmd is not None else shutil.which('UscCmd')
+        self.device_serial = device_serial
+
+    @property
+    def available(self) -> bool:
+        return self.usccmd is not None and self.bot.usb is not None
+
+    def upload(self, script: MaestroScript) -> bool:
+        if self.usccmd is None:
+            log.debug('UscCmd not found, unable to load the Maestro script')
+            return False
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as file:
+            file.write(script.source)
+            path = file.name
+        try:
+            command = [self.usccmd, '--program', path]
+            if self.device_serial is not None:
+                command += ['--device', self.device_serial]
+            result = subprocess.run(command, capture_output=True, text=True, timeout=30)
+        except (OSError, subprocess.TimeoutExpired) as err:
+            log.error('Unable to load the Maestro script: %s', err)
+            return False
+        finally:
+            os.remove(path)
+        if result.returncode != 0:
+            log.error('Unable to load the Maestro script: %s', result.stderr.strip() or result.stdout.strip())
+            return False
+        return True
+
+    def start(self, subroutine: int = MaestroScript.SUBROUTINE):
+        self.bot.writer.writeEncoded(self.bot.encoder.restartScriptAtSubroutine, subroutine)
+
+    def stop(self):
+        self.bot.writer.writeEncoded(self.bot.encoder.stopScript)
+
+    def isRunning(self):
+        # Get Script Status answers 0x00 while the script is running, None when there is no answer
+        response = self.bot.writer.query(self.bot.encoder.getScriptStatus, (), 1)
+        if response is None:
+            return None
+        return response[0] == 0x00
+
+    def waitUntilFinished(self, timeout: float = 60.0, poll_interval: float = 0.1, keep_running = None) -> bool:
+        """Poll the script status until the script stops
+
+        `keep_running()` is called every poll, returning False stops the script early (and this
+        returns False). Raises ScriptRunError, after stopping the script, if the Maestro does not
+        answer the status query or the script is still running after `timeout` seconds.
+        """
+        deadline = monotonic() + timeout
+        while True:
+            if keep_running is not None and not keep_running():
+                self.stop()
+                return False
+            running = self.isRunning()
+            if running is None:
+                self.stop()
+                raise ScriptRunError('The Maestro did not answer the script status query')
+            if not running:
+                return True
+            if monotonic() >= deadline:
+                self.stop()
+                raise ScriptRunError(f'The Maestro script is still running after {timeout:.1f} s')
+            sleep(poll_interval)
+
+    def run(self, script: MaestroScript, timeout: float = None, **kwargs) -> bool:
+        """Load, start and wait for the script
+
+        False if it could not be loaded or was stopped by `keep_running`, see waitUntilFinished
+        for the errors. `timeout` defaults to the script's own duration plus a margin.
+        """
+        if not self.upload(script):
+            return False
+        if timeout is None:
+            timeout = script.duration + 5.0
+        self.start()
+        try:
+            return self.waitUntilFinished(timeout=timeout, **kwargs)
+        finally:
+            # the script moved the servos, the controller's shadow targets are stale now
+            self.bot.forgetTargets()
+
+# END
@@ -0,0 +1,155 @@
+# microphone_stream.py
+
+import collections
+import math
+import threading
+import speech_recognition as sr
+from .vad import rms
+from .log import log
+
+class MicrophoneStream:
+    """Long-lived microphone capture that hands out utterances
+
+    The microphone is opened once and read on a background thread. While nobody is speaking the
+    energy threshold follows the ambient noise (the same damping speech_recognition's
+    `dynamic_energy_threshold` uses), so there is no calibration pause before each command.
+    Audio is kept in a short ring buffer, so the start of an utterance is not lost; finished
+    utterances wait in a ring of `max_utterances` (the oldest is dropped when nobody listens).
+    """
+
+    recognizer: sr.Recognizer   # energy and pause settings (energy_threshold, pause_threshold, ...)
+    microphone: sr.Microphone
+    calibration_duration: float # seconds of ambient noise measured before speech is detected
+    phrase_time_limit: float    # longest utterance in seconds, None for no limit
+    utterances: collections.deque
+    condition: threading.Condition
+    running: bool               # False once closed or the capture thread stopped
+    error: Exception = None     # why the capture thread stopped, None while it runs or after close()
+    thread: threading.Thread
+
+    # constructor
+    def __init__(self, recognizer: sr.Recognizer = None, microphone: sr.Microphone = None, calibration_duration: float = 0.5,
+                 phrase_time_limit: float = 2.0, max_utterances: int = 4):
+        self.recognizer = recognizer if recognizer is not None else sr.Recognizer()
+        self.microphone = microphone if microphone is not None else sr.Microphone()
+        self.calibration_duration = calibration_duration
+        self.phrase_time_limit = phrase_time_limit
+        self.utterances = collections.deque(maxlen=max_utterances)
+        self.condition = threading.Condition()
+        self.running = False
+        self.thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.running = True
+        self.error = None
+        self.thread = threading.Thread(target=self.threadedCapturing, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.running = False
+        with self.condition:
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def listen(self, timeout: float = None):
+        """Next utterance as sr.AudioData, None if there was none within `timeout` seconds
+
+        Returns None right away once the stream is not running, see `error`.
+        """
+        with self.condition:
+            if not self.condition.wait_for(lambda: len(self.utterances) > 0 or not self.running, timeout):
+                return None
+            if len(self.utterances) == 0:
+                return None
+            return self.utterances.popleft()
+
+    def ambientEnergy(self) -> float:
+        # RMS energy of the ambient noise: calibration (and the dynamic threshold) keep the
+        # energy threshold `dynamic_energy_ratio` above it
+        return self.recognizer.energy_threshold / self.recognizer.dynamic_energy_ratio
+
+    def clear(self):
+        # drop the utterances nobody listened to yet
+        with self.condition:
+            self.utterances.clear()
+
+    """Capture Thread"""
+
+    def threadedCapturing(self):
+        try:
+            with self.microphone as source:
+                self.capture(source)
+        except Exception as err:
+            log.error('Microphone capture stopped: %s', err)
+            self.error = err
+        finally:
+            self.running = False
+            with self.condition:
+                self.condition.notify_all()
+
+    def capture(self, source):
+        recognizer = self.recognizer
+        seconds_per_buffer = source.CHUNK / source.SAMPLE_RATE
+        pause_buffers = int(math.ceil(recognizer.pause_threshold / seconds_per_buffer))
+        phrase_buffers = int(math.ceil(recognizer.phrase_threshold / seconds_per_buffer))
+        # audio kept before the energy crosses the threshold, so the first syllable is not cut off
+        ring = collections.deque(maxlen=int(math.ceil(recognizer.non_speaking_duration / seconds_per_buffer)) + 1)
+        calibration_buffers = int(math.ceil(self.calibration_duration / seconds_per_buffer))
+        frames = None               # buffers of the current utterance, None while it is quiet
+        silent_buffers = 0
+        while self.running:
+            buffer = source.stream.read(source.CHUNK)
+            if len(buffer) == 0:
+                raise EOFError('the microphone stream ended')
+            energy = rms(buffer, source.SAMPLE_WIDTH)
+            if frames is None:
+                ring.append(buffer)
+                if calibration_buffers > 0 or energy <= recognizer.energy_threshold:
+                    # still quiet, follow the ambient noise
+                    calibration_buffers -= 1
+                    self.adjustThreshold(energy, seconds_per_buffer)
+                    continue
+                # speech started
+                frames = list(ring)
+                silent_buffers = 0
+                continue
+            frames.append(buffer)
+            silent_buffers = silent_buffers + 1 if energy <= recognizer.energy_threshold else 0
+            too_long = self.phrase_time_limit is not None and len(frames) * seconds_per_buffer > self.phrase_time_limit
+            if silent_buffers <= pause_buffers and not too_long:
+                continue
+            # speech ended, drop the trailing silence beyond what the recognizer expects
+            spoken_buffers = len(frames) - silent_buffers
+            if spoken_buffers - len(ring) >= phrase_buffers:
+                keep = len(frames) - max(0, silent_buffers - ring.maxlen)
+                self.addUtterance(sr.AudioData(b''.join(frames[:keep]), source.SAMPLE_RATE, source.SAMPLE_WIDTH))
+            frames = None
+            ring.clear()
+
+    def adjustThreshold(self, energy: float, seconds_per_buffer: float):
+        recognizer = self.recognizer
+        if not recognizer.dynamic_energy_threshold:
+            return
+        damping = recognizer.dynamic_energy_adjustment_damping ** seconds_per_buffer
+        target_energy = energy * recognizer.dynamic_energy_ratio
+        recognizer.energy_threshold = recognizer.energy_threshold * damping + target_energy * (1 - damping)
+
+    def addUtterance(self, audio):
+        with self.condition:
+            if len(self.utterances) == self.utterances.maxlen:
+                log.debug('Dropping an utterance nobody listened to')
+            self.utterances.append(audio)
+            self.condition.notify()
+
+# END
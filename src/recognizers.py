@@ -0,0 +1,420 @@
+# recognizers.py
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+from abc import ABC
+from abc import abstractmethod
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from time import perf_counter
+from time import sleep
+import speech_recognition as sr
+from .command_parser import grammarPhrases
+from .command_parser import jsgfGrammar
+from .log import log
+
+VOSK_MODEL_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'tango_bots', 'vosk-model')
+VOSK_SAMPLE_RATE = 16000
+GOOGLE_TIMEOUT = 5.0                # seconds a Google request may take before it counts as failed
+HEDGE_TIMEOUT = 6.0                 # seconds a hedge waits for an accepted answer, a little over GOOGLE_TIMEOUT
+
+class RecognizerBackend(ABC):
+    """Turns an utterance (sr.AudioData) into text
+
+    `recognize()` returns the transcription, or None when nothing was understood or the engine
+    failed (the error is logged). `phrases` is the command vocabulary; local engines only listen
+    for these phrases, so their answer is always a command or None. `close()` releases what the
+    backend holds, backends are also context managers.
+    """
+
+    name: str = 'backend'
+    phrases: list
+
+    # constructor
+    def __init__(self, phrases: list = None):
+        self.phrases = list(phrases) if phrases is not None else list()
+
+    @abstractmethod
+    def recognize(self, audio: sr.AudioData):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def printTranscription(transcription: str):
+    # console feedback of the speech front-ends, None when nothing was understood
+    if transcription is None:
+        print("Unknown word")
+    else:
+        print(transcription)
+
+def googleAlternatives(response) -> list:
+    # transcripts of a `recognize_google(audio, show_all=True)` response, best ranked first
+    if not isinstance(response, dict):
+        # [] when nothing was understood
+        return list()
+    return [alternative['transcript'] for alternative in response.get('alternative', list()) if 'transcript' in alternative]
+
+def chooseAlternative(alternatives: list, score) -> int:
+    """Index of the alternative to run
+
+    `score(text)` is how well a transcription fits the command grammar, None if it is not a
+    command. The best score wins and the recognizer's ranking breaks ties; if no alternative is a
+    command the top one is kept (the caller reports it as not understood).
+    """
+    best, best_score = 0, None
+    for index, text in enumerate(alternatives):
+        text_score = score(text)
+        if text_score is not None and (best_score is None or text_score > best_score):
+            best, best_score = index, text_score
+    return best
+
+class GoogleBackend(RecognizerBackend):
+    """Google Web Speech API, free-form text, needs the network
+
+    With `score` (see chooseAlternative) the full list of alternatives is requested and the one
+    that fits the command grammar best is returned, so a near miss at the top ("had up") does
+    not waste an utterance that a lower ranked alternative ("head up") got right.
+    """
+
+    name = 'google'
+    recognizer: sr.Recognizer
+    score = None                    # callable(text) -> float or None, None for the top result only
+    timeout: float                  # seconds per request, a stalled request raises sr.RequestError
+    utterances: int = 0             # utterances Google understood
+    rescued: int = 0                # utterances a lower ranked alternative was chosen for
+
+    # constructor
+    def __init__(self, phrases: list = None, recognizer: sr.Recognizer = None, score = None, timeout: float = GOOGLE_TIMEOUT):
+        super().__init__(phrases)
+        self.recognizer = recognizer if recognizer is not None else sr.Recognizer()
+        self.score = score
+        self.timeout = timeout
+        # only bounds the API requests, listening to the microphone is not affected
+        self.recognizer.operation_timeout = timeout
+
+    def recognize(self, audio: sr.AudioData):
+        try:
+            if self.score is None:
+                return self.recognizer.recognize_google(audio)
+            alternatives = googleAlternatives(self.recognizer.recognize_google(audio, show_all=True))
+        except sr.RequestError as err:
+            # API was unreachable or unresponsive
+            log.warning('Google speech API was unreachable or unresponsive: %s', err)
+            return None
+        except sr.UnknownValueError:
+            # speech was unintelligible
+            log.debug('Google speech API: unknown word')
+            return None
+        if len(alternatives) == 0:
+            log.debug('Google speech API: unknown word')
+            return None
+        index = chooseAlternative(alternatives, self.score)
+        self.utterances += 1
+        if index > 0:
+            self.rescued += 1
+            log.debug('Google alternative %d "%s" instead of "%s"', index, alternatives[index], alternatives[0])
+        return alternatives[index]
+
+class VoskBackend(RecognizerBackend):
+    """Offline Vosk (Kaldi) recognizer restricted to the command phrases
+
+    The grammar also holds the separators, counts and speed levels of the CommandParser, so
+    compound commands ("head up twice and then turn left") can be heard. The model directory is
+    loaded once, on the first utterance. Anything outside the grammar comes back as "[unk]",
+    which is reported as not understood.
+    """
+
+    name = 'vosk'
+    model_path: str
+    grammar: str                    # JSON phrase list handed to the KaldiRecognizer
+    model = None                    # vosk.Model, None until the first utterance
+    lock: threading.Lock            # Kaldi recognizers are not thread-safe
+
+    # constructor
+    def __init__(self, phrases: list, model_path: str = VOSK_MODEL_PATH):
+        super().__init__(phrases)
+        self.model_path = model_path
+        self.grammar = json.dumps(grammarPhrases(self.phrases) + ['[unk]'])
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def available(model_path: str = VOSK_MODEL_PATH) -> bool:
+        try:
+            import vosk
+        except ImportError:
+            return False
+        return os.path.isdir(model_path)
+
+    def recognize(self, audio: sr.AudioData):
+        from vosk import KaldiRecognizer
+        from vosk import Model
+        with self.lock:
+            if self.model is None:
+                self.model = Model(self.model_path)
+            recognizer = KaldiRecognizer(self.model, VOSK_SAMPLE_RATE, self.grammar)
+            recognizer.AcceptWaveform(audio.get_raw_data(convert_rate=VOSK_SAMPLE_RATE, convert_width=2))
+            text = json.loads(recognizer.FinalResult()).get('text', '')
+        text = text.replace('[unk]', '').strip()
+        return text if len(text) > 0 else None
+
+class SphinxBackend(RecognizerBackend):
+    """Offline PocketSphinx recognizer restricted to the commands by a JSGF grammar (see jsgfGrammar)
+
+    The grammar is written to `<GRAMMAR_NAME>.jsgf` in a temporary directory, speech_recognition
+    caches the compiled `.fsg` next to it; `close()` deletes the directory.
+    """
+
+    name = 'sphinx'
+    GRAMMAR_NAME: str = 'commands'  # file, grammar and public rule name, see jsgfGrammar
+    recognizer: sr.Recognizer
+    grammar_dir: str                # None once closed
+    grammar_path: str               # None once closed
+
+    # constructor
+    def __init__(self, phrases: list, recognizer: sr.Recognizer = None):
+        super().__init__(phrases)
+        self.recognizer = recognizer if recognizer is not None else sr.Recognizer()
+        self.grammar_dir = tempfile.mkdtemp(prefix='tango_bots_')
+        self.grammar_path = os.path.join(self.grammar_dir, f'{self.GRAMMAR_NAME}.jsgf')
+        with open(self.grammar_path, 'w') as file:
+            file.write(jsgfGrammar(self.phrases, self.GRAMMAR_NAME))
+
+    @staticmethod
+    def available() -> bool:
+        try:
+            import pocketsphinx
+        except ImportError:
+            return False
+        return True
+
+    def recognize(self, audio: sr.AudioData):
+        try:
+            text = self.recognizer.recognize_sphinx(audio, grammar=self.grammar_path)
+        except sr.RequestError as err:
+            log.warning('PocketSphinx failed: %s', err)
+            return None
+        except sr.UnknownValueError:
+            return None
+        text = text.strip()
+        return text if len(text) > 0 else None
+
+    def close(self):
+        if self.grammar_dir is None:
+            return
+        # the grammar and the .fsg speech_recognition compiled from it
+        shutil.rmtree(self.grammar_dir, ignore_errors=True)
+        self.grammar_dir = None
+        self.grammar_path = None
+
+class FakeBackend(RecognizerBackend):
+    """Deterministic backend for tests and benchmarks
+
+    Answers with `responses` in order (None entries are "not understood"), after `delay`
+    seconds, and None once they run out. Given `phrases` it behaves like the grammar restricted
+    engines: an answer with a word outside grammarPhrases() is not understood.
+    """
+
+    name = 'fake'
+    responses: list
+    delay: float
+    words: set                      # vocabulary of the grammar, None for any answer
+    calls: int = 0
+    lock: threading.Lock
+
+    # constructor
+    def __init__(self, responses: list, delay: float = 0.0, name: str = None, phrases: list = None):
+        super().__init__(phrases)
+        self.responses = list(responses)
+        self.delay = delay
+        if name is not None:
+            self.name = name
+        self.words = set(' '.join(grammarPhrases(phrases)).split()) if phrases is not None else None
+        self.lock = threading.Lock()
+
+    def recognize(self, audio: sr.AudioData):
+        with self.lock:
+            index = self.calls
+            self.calls += 1
+        if self.delay > 0:
+            sleep(self.delay)
+        text = self.responses[index] if index < len(self.responses) else None
+        if text is not None and self.words is not None and not self.words.issuperset(text.split()):
+            return None
+        return text
+
+class HedgedBackend(RecognizerBackend):
+    """Sends every utterance to several backends at once and takes the first useful answer
+
+    Latency varies a lot between engines and between requests (Google depends on the network),
+    so all `backends` recognize the same audio concurrently on a thread pool. The first answer
+    that `accept(text)` takes (e.g. it parses into a command) wins; backends that have not
+    started are cancelled and the answers of the slower ones are ignored. If no answer is
+    accepted before `timeout` (or at all), the first transcription is returned so the caller
+    can still report what was heard. `stats()` keeps the win rate and latency of every backend.
+    """
+
+    name = 'hedged'
+    backends: list                  # RecognizerBackend, in order of preference for ties
+    accept = None                   # callable(text) -> bool, None accepts any transcription
+    timeout: float                  # seconds to wait for an accepted answer, None to wait for all (a stalled backend blocks)
+    executor: ThreadPoolExecutor
+    lock: threading.Lock            # guards the counters
+    utterances: int = 0             # utterances recognized
+    unanswered: int = 0             # utterances no backend gave an accepted answer for
+    total_latency: float = 0.0      # seconds until the winning answer (or until giving up)
+    max_latency: float = 0.0
+    backend_stats: dict             # backend name -> counters, see stats()
+
+    # constructor
+    def __init__(self, backends: list, accept = None, timeout: float = HEDGE_TIMEOUT, max_workers: int = None):
+        if len(backends) == 0:
+            raise ValueError('HedgedBackend needs at least one backend')
+        super().__init__(backends[0].phrases)
+        self.backends = list(backends)
+        self.accept = accept
+        self.timeout = timeout
+        # room for the stragglers of the previous utterance while the next one is recognized
+        workers = max_workers if max_workers is not None else 2 * len(self.backends)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='speech-hedged')
+        self.lock = threading.Lock()
+        self.backend_stats = {
+            backend.name: {'requests': 0, 'answers': 0, 'wins': 0, 'total_latency': 0.0, 'max_latency': 0.0}
+            for backend in self.backends
+        }
+
+    def recognizeTimed(self, backend: RecognizerBackend, audio: sr.AudioData):
+        # runs on the pool: (text, seconds the backend took)
+        start = perf_counter()
+        try:
+            text = backend.recognize(audio)
+        except Exception as err:
+            log.error('Speech recognizer %s failed: %s', backend.name, err)
+            text = None
+        latency = perf_counter() - start
+        with self.lock:
+            stats = self.backend_stats[backend.name]
+            stats['requests'] += 1
+            stats['answers'] += text is not None
+            stats['total_latency'] += latency
+            stats['max_latency'] = max(stats['max_latency'], latency)
+        return text, latency
+
+    def isAccepted(self, text: str) -> bool:
+        if text is None:
+            return False
+        return self.accept is None or self.accept(text)
+
+    def recognize(self, audio: sr.AudioData):
+        start = perf_counter()
+        pending = {self.executor.submit(self.recognizeTimed, backend, audio): backend for backend in self.backends}
+        deadline = start + self.timeout if self.timeout is not None else None
+        winner, result, fallback = None, None, None
+        while len(pending) > 0 and winner is None:
+            remaining = max(0.0, deadline - perf_counter()) if deadline is not None else None
+            done, _ = wait(pending.keys(), timeout=remaining, return_when=FIRST_COMPLETED)
+            if len(done) == 0:
+                log.debug('Speech recognizers %s did not answer within %.1f s', ', '.join(backend.name for backend in pending.values()), self.timeout)
+                break
+            # several can finish together, the earlier backend in the list wins the tie
+            for future in sorted(done, key=lambda future: self.backends.index(pending[future])):
+                backend = pending.pop(future)
+                text, latency = future.result()
+                if winner is None and self.isAccepted(text):
+                    winner, result = backend, text
+                elif fallback is None and text is not None:
+                    fallback = text
+        for future in pending.keys():
+            # not started yet: never runs; already running: its answer is ignored
+            future.cancel()
+        latency = perf_counter() - start
+        with self.lock:
+            self.utterances += 1
+            self.unanswered += winner is None
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+            if winner is not None:
+                self.backend_stats[winner.name]['wins'] += 1
+        if winner is None:
+            return fallback
+        log.debug('Speech recognizer %s won in %.3f s: %s', winner.name, latency, result)
+        return result
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        for backend in self.backends:
+            backend.close()
+
+    def stats(self) -> dict:
+        """'hedged' -> overall counters, and every backend name -> its counters
+
+        A backend's latency only counts the requests it finished, its win rate is the share of
+        all utterances it gave the accepted answer for.
+        """
+        with self.lock:
+            utterances = max(1, self.utterances)
+            stats = {'hedged': {
+                'utterances': self.utterances,
+                'unanswered': self.unanswered,
+                'mean_latency': self.total_latency / utterances,
+                'max_latency': self.max_latency,
+            }}
+            for name, counters in self.backend_stats.items():
+                stats[name] = {
+                    'requests': counters['requests'],
+                    'answers': counters['answers'],
+                    'wins': counters['wins'],
+                    'win_rate': counters['wins'] / utterances,
+                    'mean_latency': counters['total_latency'] / max(1, counters['requests']),
+                    'max_latency': counters['max_latency'],
+                }
+            return stats
+
+    def logStats(self):
+        for name, stats in self.stats().items():
+            log.info('Speech recognizer %s: %s', name, ', '.join(f'{key} {value:.3f}' if isinstance(value, float) else f'{key} {value}' for key, value in stats.items()))
+
+RECOGNIZER_BACKENDS = ['auto', 'hedged', 'vosk', 'sphinx', 'google']
+
+def createBackend(name: str, phrases: list, recognizer: sr.Recognizer = None, accept = None, score = None) -> RecognizerBackend:
+    """Backend by name; 'auto' picks the first local engine that is installed, then Google
+
+    'hedged' races every installed engine and Google (see HedgedBackend), `accept(text)` tells
+    it which answers are commands. Google picks among its alternatives with `score(text)`.
+    """
+    if name == 'hedged':
+        backends = list()
+        if VoskBackend.available():
+            backends.append(VoskBackend(phrases))
+        if SphinxBackend.available():
+            backends.append(SphinxBackend(phrases, recognizer))
+        backends.append(GoogleBackend(phrases, recognizer, score))
+        log.info('Speech recognizer: hedged (%s)', ', '.join(backend.name for backend in backends))
+        return HedgedBackend(backends, accept=accept)
+    if name == 'auto':
+        if VoskBackend.available():
+            name = 'vosk'
+        elif SphinxBackend.available():
+            name = 'sphinx'
+        else:
+            name = 'google'
+    log.info('Speech recognizer: %s', name)
+    if name == 'vosk':
+        return VoskBackend(phrases)
+    if name == 'sphinx':
+        return SphinxBackend(phrases, recognizer)
+    if name == 'google':
+        return GoogleBackend(phrases, recognizer, score)
+    raise ValueError(f'Unknown speech recognizer "{name}", expected one of {", ".join(RECOGNIZER_BACKENDS)}')
+
+# END
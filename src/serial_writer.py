@@ -0,0 +1,289 @@
+# serial_writer.py
+
+import threading
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError
+from queue import Queue
+from time import perf_counter
+from time import sleep
+from .log import log
+from .usb import serial
+
+class SerialQuery:
+    """A command that expects a response, written and answered on the writer thread"""
+
+    encode = None                   # callable returning the command frame
+    args: tuple
+    response_length: int
+    future: Future                  # resolves to the response, None if the device did not answer
+
+    # constructor
+    def __init__(self, encode, args: tuple, response_length: int):
+        self.encode = encode
+        self.args = args
+        self.response_length = response_length
+        self.future = Future()
+
+class SerialWriter:
+    """Dedicated thread that owns the serial USB and writes queued commands to it
+
+    Callers hand commands to `write()` and return right away. The writer thread
+    writes each command and then sleeps `write_timeout` so the Maestro is not
+    flooded; that pause now happens on the writer thread instead of the caller's.
+
+    Several controllers (Maestros with different device numbers) can share one writer; their
+    targets are kept apart by the `encode_targets` callable each of them passes in. A
+    `connect_frame` (e.g. Exit Safe Start) is written once per USB, when the writer starts with
+    one and whenever `setUSB()` swaps in a reconnected one, before the reconnect callbacks.
+
+    Servo targets handed to `writeTargets()` are coalesced per servo: while a target
+    is still waiting to be written, a newer target for the same servo replaces it
+    (latest wins), so bursts of moves only put the final position on the wire.
+    The writer also keeps a shadow copy of the last target written for each servo and
+    skips targets that would not change anything, unless they are sent with `force=True`.
+    """
+
+    usb = None                      # serial.Serial (or None when not connected)
+    write_timeout: float = 0.2      # sleep() time after each write to the serial USB
+    read_timeout: float = 0.1       # how long to wait for the response to a query
+    queue: Queue                    # bounded command queue (put() blocks when full)
+    thread: threading.Thread
+    encode_targets = None           # default callable: {servo: target} -> iterable of frames, run on the writer thread
+    connect_frame: bytes = None     # written first on every (re)connected USB, None for nothing
+    lock: threading.Lock            # guards the pending targets and the counters
+    pending_targets: dict           # (encode_targets, servo) -> latest target not yet written
+    forced_servos: set              # pending (encode_targets, servo) keys that must be written even if unchanged
+    shadow_targets: dict            # (encode_targets, servo) -> last target written to the USB
+    targets_scheduled: bool         # a WRITE_TARGETS marker is waiting in the queue
+    targets_submitted: int = 0      # number of targets handed to writeTargets()
+    frames_dropped: int = 0         # number of targets replaced before reaching the wire
+    frames_skipped: int = 0         # number of targets equal to the shadow target (not written)
+    frames_written: int = 0         # number of frames written to the USB
+    disconnected: threading.Event   # set while there is no USB (see UsbReconnector)
+    reconnect_callbacks: list       # called (on the reconnecting thread) after setUSB()
+    write_log: list = None          # perf_counter() of every frame written while not None (e.g. TrajectoryPlayer)
+
+    WRITE_TARGETS = object()        # queue marker: write the pending targets
+
+    # constructor
+    def __init__(self, usb, write_timeout: float = 0.2, max_queue_size: int = 64, encode_targets = None, connect_frame: bytes = None):
+        self.usb = usb
+        self.write_timeout = write_timeout
+        self.encode_targets = encode_targets
+        self.connect_frame = connect_frame
+        self.queue = Queue(maxsize=max_queue_size)
+        self.lock = threading.Lock()
+        self.pending_targets = dict()
+        self.forced_servos = set()
+        self.shadow_targets = dict()
+        self.targets_scheduled = False
+        self.disconnected = threading.Event()
+        if usb is None:
+            self.disconnected.set()
+        self.reconnect_callbacks = list()
+        self.thread = threading.Thread(target=self.threadedWriting, daemon=True)
+        self.thread.start()
+        if usb is not None and connect_frame is not None:
+            self.write(connect_frame)
+
+    def write(self, command: bytes):
+        self.queue.put(command)
+
+    def setUSB(self, usb):
+        # swap in a (re)connected USB, commands written from now on go to it
+        self.usb = usb
+        self.disconnected.clear()
+        if self.connect_frame is not None:
+            self.write(self.connect_frame)
+        for callback in self.reconnect_callbacks:
+            callback()
+
+    def lostUSB(self, err: Exception):
+        log.error('Lost USB: %s', err)
+        usb = self.usb
+        self.usb = None
+        self.disconnected.set()
+        try:
+            usb.close()
+        except Exception:
+            pass
+
+    def writeEncoded(self, encode, *args):
+        # `encode(*args)` is called on the writer thread, so it can reuse a preallocated buffer
+        self.queue.put((encode, args))
+
+    def writeTargets(self, targets: dict, force: bool = False, encode_targets = None):
+        if encode_targets is None:
+            encode_targets = self.encode_targets
+        with self.lock:
+            for servo, target in targets.items():
+                key = (encode_targets, servo)
+                self.targets_submitted += 1
+                if not force and key not in self.pending_targets and self.shadow_targets.get(key) == target:
+                    # the servo is already at this target
+                    self.frames_skipped += 1
+                    continue
+                if key in self.pending_targets:
+                    # the queued target never reaches the wire
+                    self.frames_dropped += 1
+                self.pending_targets[key] = target
+                if force:
+                    self.forced_servos.add(key)
+            if self.targets_scheduled or len(self.pending_targets) < 1:
+                return
+            self.targets_scheduled = True
+        self.queue.put(self.WRITE_TARGETS)
+
+    def query(self, encode, args: tuple, response_length: int, timeout: float = None):
+        """Write a command after everything queued so far and return the device's response
+
+        Returns None if there is no USB, the device did not answer or `timeout` expired.
+        """
+        try:
+            return self.submitQuery(encode, args, response_length).result(timeout)
+        except TimeoutError:
+            return None
+
+    def submitQuery(self, encode, args: tuple, response_length: int) -> Future:
+        # non-blocking version of query(), e.g. for asyncio.wrap_future()
+        query = SerialQuery(encode, args, response_length)
+        self.queue.put(query)
+        return query.future
+
+    def forgetTargets(self, encode_targets = None):
+        with self.lock:
+            if encode_targets is None:
+                self.shadow_targets.clear()
+                return
+            for key in [key for key in self.shadow_targets if key[0] == encode_targets]:
+                del self.shadow_targets[key]
+
+    def shadowTarget(self, servo, encode_targets = None):
+        if encode_targets is None:
+            encode_targets = self.encode_targets
+        with self.lock:
+            return self.shadow_targets.get((encode_targets, servo))
+
+    def flush(self, timeout: float = None) -> bool:
+        """Block until every command queued before this call has been written
+
+        Returns False if `timeout` expired first.
+        """
+        try:
+            self.submitFlush().result(timeout)
+            return True
+        except TimeoutError:
+            return False
+
+    def submitFlush(self) -> Future:
+        # non-blocking version of flush(), resolves once everything queued before it is written
+        done = Future()
+        self.queue.put(done)
+        return done
+
+    def close(self, timeout: float = None):
+        # let queued commands finish, then stop the thread
+        self.queue.put(None)
+        self.thread.join(timeout)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                'targets_submitted': self.targets_submitted,
+                'frames_dropped': self.frames_dropped,
+                'frames_skipped': self.frames_skipped,
+                'frames_written': self.frames_written,
+            }
+
+    def threadedWriting(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            if isinstance(item, Future):
+                # a cancelled flush (e.g. an awaiting task was cancelled) needs no answer
+                if item.set_running_or_notify_cancel():
+                    item.set_result(True)
+            elif item is self.WRITE_TARGETS:
+                self.writePendingTargets()
+            elif isinstance(item, SerialQuery):
+                self.answerQuery(item)
+            elif isinstance(item, tuple):
+                encode, args = item
+                self.writeToUSB(encode(*args))
+            else:
+                self.writeToUSB(item)
+
+    def writePendingTargets(self):
+        with self.lock:
+            targets = self.pending_targets
+            forced_servos = self.forced_servos
+            self.pending_targets = dict()
+            self.forced_servos = set()
+            self.targets_scheduled = False
+            # a burst may have ended where the servo already is
+            for key in list(targets.keys()):
+                if key not in forced_servos and self.shadow_targets.get(key) == targets[key]:
+                    del targets[key]
+                    self.frames_skipped += 1
+            # in flight from now on: a target submitted while these are written is compared to them
+            self.shadow_targets.update(targets)
+        # one batch per controller sharing this writer
+        batches = dict()
+        for (encode_targets, servo), target in targets.items():
+            batches.setdefault(encode_targets, dict())[servo] = target
+        written = True
+        for encode_targets, batch in batches.items():
+            for command in encode_targets(batch):
+                written = self.writeToUSB(command) and written
+        if not written:
+            with self.lock:
+                # the device may not have them, write them again next time
+                for key, target in targets.items():
+                    if self.shadow_targets.get(key) == target:
+                        del self.shadow_targets[key]
+
+    def answerQuery(self, query: SerialQuery):
+        if not query.future.set_running_or_notify_cancel():
+            # nobody waits for the answer anymore, do not write the query at all
+            return
+        response = None
+        usb = self.usb
+        try:
+            if usb is not None:
+                # drop anything left over from an earlier query that timed out
+                usb.reset_input_buffer()
+                usb.timeout = self.read_timeout
+                usb.write(query.encode(*query.args))
+                response = usb.read(query.response_length)
+                if len(response) != query.response_length:
+                    log.debug('No response from USB for query')
+                    response = None
+        except (serial.SerialException, OSError) as err:
+            response = None
+            self.lostUSB(err)
+        finally:
+            query.future.set_result(response)
+
+    def writeToUSB(self, command) -> bool:
+        # False if the command was dropped (no USB or the write failed)
+        usb = self.usb
+        if usb is None:
+            log.debug('Unable to write to USB - USB not connected')
+            return False
+        if log.root.isEnabledFor(log.DEBUG):
+            log.debug('Writing USB Command: "%s"', command.hex())
+        try:
+            usb.write(command)
+        except (serial.SerialException, OSError) as err:
+            # the command is dropped, the controllers restore their state once reconnected
+            self.lostUSB(err)
+            return False
+        with self.lock:
+            self.frames_written += 1
+            if self.write_log is not None:
+                self.write_log.append(perf_counter())
+        sleep(self.write_timeout)
+        return True
+
+# END
@@ -1,106 +1,106 @@
 # speech2text.py
 
 import speech_recognition as sr
-import threading
 from .tango_bot import TangBotController
+from .microphone_stream import MicrophoneStream
+from .speech_pipeline import SpeechPipeline
+from .vad import VoiceActivityDetector
+from .recognizers import RecognizerBackend
+from .recognizers import HedgedBackend
+from .recognizers import createBackend
+from .recognizers import printTranscription
+from .command_matcher import CommandMatcher
+from .command_parser import CommandParser
+from .commands import PHRASE_BOT_DICT
+from .commands import CommandBus
 from .log import log
 
-PHRASE_BOT_DICT = {
-    'head up': 'moveHeadUp',
-    'head down': 'moveHeadDown',
-    'head left': 'moveHeadLeft',
-    'head right': 'moveHeadRight',
-    'head center': 'centerHead',
-    'body left': 'moveWaistLeft',
-    'body right': 'moveWaistRight',
-    'body center': 'centerWaist',
-    'forward': 'increaseWheelSpeed',
-    'reverse': 'decreaseWheelSpeed',
-    'turn left': 'turnLeft',
-    'turn right': 'turnRight',
-    'stop': 'stop',
-    'speed one': 'setSpeedLevelOne',
-    'speed two': 'setSpeedLevelTwo',
-    'speed three': 'setSpeedLevelThree',
-}
-
 class Speech2Text:
 
     bot: TangBotController
     running: bool
     recognizer: sr.Recognizer
     microphone: sr.Microphone
-    audio_recognizing_thread: threading.Thread
+    backend: RecognizerBackend      # speech to text engine (local grammar restricted engines or Google)
+    matcher: CommandMatcher         # resolves near misses ("head app") to the closest phrase
+    parser: CommandParser           # "head up twice and turn left" -> one plan
+    bus: CommandBus                 # runs the plans on the robot, on its own thread
+    stream: MicrophoneStream        # keeps the microphone open and calibrated between commands
+    vad: VoiceActivityDetector      # drops utterances without speech and trims the silence
+    pipeline: SpeechPipeline        # capture -> vad -> recognize -> dispatch, one thread each
 
     # constructor
-    def __init__(self, bot: TangBotController):
+    def __init__(self, bot: TangBotController, backend: RecognizerBackend = None, recognizer_name: str = 'auto'):
         self.bot = bot
         self.running = False
         self.recognizer = sr.Recognizer()
         self.microphone = sr.Microphone()
-        self.audio_recognizing_thread = threading.Thread(target=self.threaded_audio_transcribing, daemon=True)
-
-    def recognize_speech_from_mic(self):
-        # check that recognizer and microphone arguments are appropriate type
-        if not isinstance(self.recognizer, sr.Recognizer):
-            raise TypeError("`recognizer` must be `Recognizer` instance")
+        self.matcher = CommandMatcher(PHRASE_BOT_DICT)
+        self.parser = CommandParser(self.matcher, speed_commands={'increaseWheelSpeed', 'decreaseWheelSpeed'})
+        if backend is None:
+            backend = createBackend(recognizer_name, list(PHRASE_BOT_DICT.keys()), self.recognizer,
+                                    accept=self.is_command, score=self.command_score)
+        self.backend = backend
+        self.bus = CommandBus(bot.commands)
+        self.stream = MicrophoneStream(self.recognizer, self.microphone)
+        # the noise floor comes from the stream, which follows the ambient noise between commands
+        self.vad = VoiceActivityDetector(ambient_energy=self.stream.ambientEnergy)
+        self.pipeline = SpeechPipeline(self.stream, self.recognize_audio, self.dispatch_transcription, vad=self.vad.detect)
 
-        if not isinstance(self.microphone, sr.Microphone):
-            raise TypeError("`microphone` must be `Microphone` instance")
-        # adjust the recognizer sensitivity to ambient noise and record audio
-        # from the microphone
-        try:
-            with self.microphone as source:
-                self.recognizer.adjust_for_ambient_noise(source, 0.5)
-                print("Listening...")
-                audio = self.recognizer.listen(source, timeout=5, phrase_time_limit=2)
-        except sr.WaitTimeoutError:
-            return None
-        # try recognizing the speech in the recording
-        # if a RequestError or UnknownValueError exception is caught
-        transcription = None
-        try:
-            transcription = self.recognizer.recognize_google(audio)
-            print(transcription)
-        except sr.RequestError as err:
-            # API was unreachable or unresponsive
-            print("API was unreachable or unresponsive.\n", err)
-        except sr.UnknownValueError as err:
-            # speech was unintelligible
-            print("Unknown word")
+    def recognize_audio(self, audio: sr.AudioData):
+        # None when the backend did not understand the speech (or failed, it logs why)
+        transcription = self.backend.recognize(audio)
+        printTranscription(transcription)
         return transcription
 
-    def threaded_audio_transcribing(self):
-        while True:
-            if self.running is False: 
-                break
-            transcription: str = self.recognize_speech_from_mic()
-            if transcription is None: 
-                continue
-            log.info("Transcription: %s", transcription)
-            transcription = transcription.lower()
-            print("Converted: ", transcription)
-            # call TangoBot method based on phrase transcription
-            if transcription not in PHRASE_BOT_DICT.keys(): 
-                continue
-            attr_name = PHRASE_BOT_DICT[transcription]
-            if not hasattr(self.bot, attr_name):
-                continue
-            obj_attr = getattr(self.bot, attr_name)
-            obj_attr()
+    def is_command(self, transcription: str) -> bool:
+        # a hedged backend takes the first transcription this accepts
+        return self.parser.parse(transcription) is not None
+
+    def command_score(self, transcription: str):
+        # how well the transcription fits the command grammar, None if it is not a command
+        result = self.parser.parseScored(transcription)
+        return result[1] if result is not None else None
+
+    def dispatch_transcription(self, transcription: str):
+        log.info("Transcription: %s", transcription)
+        transcription = transcription.lower()
+        print("Converted: ", transcription)
+        # every command in the transcription (closest phrases), run by the TangoBot as one plan
+        plan = self.parser.parse(transcription)
+        if plan is None:
+            return
+        log.info('Plan: %s', plan)
+        # the bus waits for the servos to settle between the steps, so opposite moves are not coalesced away
+        self.bus.publishPlan(plan, settle_timeout=0.8)
 
-    def start(self):
+    def start(self) -> bool:
+        # returns False if it stopped because the microphone failed
         self.running = True
-        self.audio_recognizing_thread.start()
+        # the pipeline captures the next utterance while the previous one is being recognized
+        self.pipeline.start()
+        print("Listening...")
         try:
-            while True:
-                if self.running is False: break
+            # until Ctrl+C, or the microphone fails
+            while self.running and not self.pipeline.wait(0.1):
+                pass
         except:
             print()
             pass
-        self.bot.stop()
         self.running = False
-        self.audio_recognizing_thread.join()
+        self.pipeline.close()
+        if self.pipeline.error is not None:
+            print("Microphone failed:", self.pipeline.error)
+        self.pipeline.logStats()
+        log.info('Speech vad: %s', self.vad.stats())
+        if isinstance(self.backend, HedgedBackend):
+            self.backend.logStats()
+        self.backend.close()
+        self.bus.publish('stop')
+        self.bus.close()
+        log.info('Command bus: %s', self.bus.stats())
+        self.bot.wait()
+        return self.pipeline.error is None
 
 
 # END
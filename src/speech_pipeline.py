@@ -0,0 +1,204 @@
+# speech_pipeline.py
+
+import threading
+from queue import Queue
+from queue import Empty
+from queue import Full
+from time import perf_counter
+from .log import log
+
+class PipelineItem:
+    """A value on its way through the pipeline, with the time its utterance was captured"""
+
+    value = None
+    captured: float                 # perf_counter() when the capture stage produced it
+
+    # constructor
+    def __init__(self, value, captured: float):
+        self.value = value
+        self.captured = captured
+
+def putDroppingOldest(queue: Queue, item) -> bool:
+    # put without blocking, dropping the oldest item when the queue is full (returns True then)
+    dropped = False
+    while True:
+        try:
+            queue.put_nowait(item)
+            return dropped
+        except Full:
+            pass
+        try:
+            queue.get_nowait()
+            dropped = True
+        except Empty:
+            continue
+
+class PipelineStage:
+    """One thread running `process` on the items of a bounded input queue
+
+    `process(value)` returns the value for the next stage, or None to drop the item (e.g. an
+    utterance without speech). When the next stage's queue is full its oldest item is dropped,
+    so a slow stage never blocks capture and the newest command wins.
+    """
+
+    name: str
+    process = None                  # callable(value) -> value or None
+    input: Queue
+    output: Queue                   # None for the last stage
+    thread: threading.Thread
+    lock: threading.Lock            # guards the counters
+    processed: int = 0              # items that went through `process`
+    dropped: int = 0                # items `process` returned None for
+    overflowed: int = 0             # items dropped because the next queue was full
+    max_queue_depth: int = 0
+    total_latency: float = 0.0      # seconds spent in `process`
+    max_latency: float = 0.0
+    total_turnaround: float = 0.0   # seconds from capture until this stage finished the item
+    max_turnaround: float = 0.0
+
+    # constructor
+    def __init__(self, name: str, process, input: Queue, output: Queue = None):
+        self.name = name
+        self.process = process
+        self.input = input
+        self.output = output
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.threadedProcessing, name=f'speech-{name}', daemon=True)
+
+    def threadedProcessing(self):
+        while True:
+            item = self.input.get()
+            if item is None:
+                # pass the shutdown on to the next stage
+                if self.output is not None:
+                    self.output.put(None)
+                break
+            depth = self.input.qsize() + 1
+            start = perf_counter()
+            try:
+                value = self.process(item.value)
+            except Exception as err:
+                log.error('Speech %s stage failed: %s', self.name, err)
+                value = None
+            end = perf_counter()
+            overflowed = False
+            if value is not None and self.output is not None:
+                overflowed = putDroppingOldest(self.output, PipelineItem(value, item.captured))
+            with self.lock:
+                self.processed += 1
+                self.dropped += value is None and self.output is not None
+                self.overflowed += overflowed
+                self.max_queue_depth = max(self.max_queue_depth, depth)
+                self.total_latency += end - start
+                self.max_latency = max(self.max_latency, end - start)
+                self.total_turnaround += end - item.captured
+                self.max_turnaround = max(self.max_turnaround, end - item.captured)
+
+    def stats(self) -> dict:
+        with self.lock:
+            processed = max(1, self.processed)
+            return {
+                'processed': self.processed,
+                'dropped': self.dropped,
+                'overflowed': self.overflowed,
+                'queue_depth': self.input.qsize(),
+                'max_queue_depth': self.max_queue_depth,
+                'mean_latency': self.total_latency / processed,
+                'max_latency': self.max_latency,
+                'mean_turnaround': self.total_turnaround / processed,
+                'max_turnaround': self.max_turnaround,
+            }
+
+class SpeechPipeline:
+    """Capture -> voice activity detection -> recognition -> dispatch, one thread per stage
+
+    Stages are joined by bounded queues, so the next utterance is captured (and checked for
+    speech) while the previous one is still being recognized. `vad(audio)` returns the audio to
+    recognize or None (see VoiceActivityDetector.detect), `recognize(audio)` returns a
+    transcription or None and `dispatch(text)` runs the command. Every stage keeps its own
+    latency, queue-depth and turnaround (time since capture) counters, see `stats()`.
+
+    If the stream stops on its own (the microphone failed) the capture stops too, `stopped` is
+    set and `error` tells why, so the caller can shut down instead of listening to nothing.
+    """
+
+    stream = None                   # MicrophoneStream, or anything with start(), listen(timeout), close(), running and error
+    stages: list                    # PipelineStage, in order
+    capture_thread: threading.Thread
+    running: bool
+    stopped: threading.Event        # set once the capture stopped (closed or the stream failed)
+    error: Exception = None         # why the stream stopped, None if it was closed
+    lock: threading.Lock
+    captured: int = 0               # utterances handed out by the stream
+    overflowed: int = 0             # utterances dropped because the VAD queue was full
+
+    # constructor
+    def __init__(self, stream, recognize, dispatch, vad = None, max_queue_size: int = 2):
+        self.stream = stream
+        self.running = False
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()
+        queues = [Queue(max_queue_size) for _ in range(3)]
+        self.stages = [
+            PipelineStage('vad', vad if vad is not None else (lambda audio: audio), queues[0], queues[1]),
+            PipelineStage('recognize', recognize, queues[1], queues[2]),
+            PipelineStage('dispatch', dispatch, queues[2]),
+        ]
+        self.capture_thread = None
+
+    def start(self):
+        self.running = True
+        self.stream.start()
+        for stage in self.stages:
+            stage.thread.start()
+        self.capture_thread = threading.Thread(target=self.threadedCapturing, name='speech-capture', daemon=True)
+        self.capture_thread.start()
+
+    def close(self):
+        self.running = False
+        if self.capture_thread is not None:
+            self.capture_thread.join()
+        self.stream.close()
+        # the shutdown travels through the stages in order, so queued commands still run
+        self.stages[0].input.put(None)
+        for stage in self.stages:
+            stage.thread.join()
+
+    def wait(self, timeout: float = None) -> bool:
+        # True once the capture stopped, False if `timeout` expired first
+        return self.stopped.wait(timeout)
+
+    def threadedCapturing(self):
+        try:
+            self.capture()
+        finally:
+            self.stopped.set()
+
+    def capture(self):
+        while self.running:
+            audio = self.stream.listen(timeout=0.2)
+            if audio is None:
+                if not self.stream.running and self.running:
+                    # listen() returns right away from now on, stop instead of spinning
+                    self.error = self.stream.error if self.stream.error is not None else RuntimeError('the stream stopped')
+                    log.error('Speech capture stopped: %s', self.error)
+                    break
+                continue
+            overflowed = putDroppingOldest(self.stages[0].input, PipelineItem(audio, perf_counter()))
+            with self.lock:
+                self.captured += 1
+                self.overflowed += overflowed
+
+    def stats(self) -> dict:
+        # 'capture' and every stage name -> counters
+        with self.lock:
+            stats = {'capture': {'captured': self.captured, 'overflowed': self.overflowed}}
+        for stage in self.stages:
+            stats[stage.name] = stage.stats()
+        return stats
+
+    def logStats(self):
+        for name, stats in self.stats().items():
+            log.info('Speech %s: %s', name, ', '.join(f'{key} {value:.3f}' if isinstance(value, float) else f'{key} {value}' for key, value in stats.items()))
+
+# END
@@ -1,20 +1,16 @@
 # tango_bot.py
 
 from .log import log
-from .log import log_method_call
-from .usb import serial
 from .usb import getUSB
+from .usb import supportsMultipleTargets
+from .usb import UsbReconnector
+from .serial_writer import SerialWriter
+from .maestro_protocol import MaestroEncoder
+from .maestro_protocol import MaestroProtocol
+from .text_to_speech import TextToSpeech
+from .commands import CommandRegistry
 from enum import Enum
-from time import sleep
-import pyttsx3
-
-
-engine = pyttsx3.init()
-# getting details of current voice
-voices = engine.getProperty('voices')
-engine.setProperty('voice', voices[10].id)
-engine.setProperty('rate', 150)
-
+from time import monotonic, sleep
 
 class BotServos(Enum):
     WheelTogether = 0x00
@@ -32,8 +28,17 @@ class DirectionState(Enum):
 class TangBotController:
     """Object Oriented Implementation of the Tango Bot"""
 
-    usb: serial.Serial
     usb_write_timeout: int = 0.2    # sleep() time after each write to the serial USB
+    writer: SerialWriter            # background thread that performs the USB writes
+    reconnector: UsbReconnector = None
+    encoder: MaestroEncoder         # builds the command frames (only used on the writer thread)
+    multiple_targets: bool = True   # send Set Multiple Targets frames, the Micro Maestro 6 only knows Set Target
+    detect_multiple_targets: bool = True    # set `multiple_targets` from the USB's PID on every (re)connect
+    _commands: CommandRegistry = None   # see `commands`
+    tts: TextToSpeech               # speech worker, its engine is created on first speak() or prewarm()
+    DEFAULT_VOICE: str  = '10'      # voices[10] of the driver, the voice the robot has always used
+    DEVICE_NUMBER: int  = 0x0C      # Pololu protocol device number of the Maestro
+    EXIT_SAFE_START: bytes = bytes([0x83])  # compact protocol, every Maestro on the port leaves safe-start
     TARGET_CENTER: int  = 5950
     SPEED: int          = 500       # This is the current update to the motor
     SPEED_CEILING: int  = 7500      # Upper limit for wheel speed
@@ -44,33 +49,245 @@ class TangBotController:
     _WHEEL_SPEED: int               # Speed of the forward/backward movement
     _DIRECTION_STATE: DirectionState = DirectionState.Forwards
 
+    # Maestro motion limits, sent to the device on startup so it interpolates the motion itself
+    # speed: 0.25us per 10ms, acceleration: 0.25us per 10ms per 80ms, 0 = unlimited
+    SERVO_SPEED: dict = {
+        BotServos.WheelTogether: 0,
+        BotServos.WheelTurning: 0,
+        BotServos.Waist: 40,
+        BotServos.HeadPan: 60,
+        BotServos.HeadTilt: 60,
+    }
+    SERVO_ACCELERATION: dict = {
+        BotServos.WheelTogether: 0,
+        BotServos.WheelTurning: 0,
+        BotServos.Waist: 10,
+        BotServos.HeadPan: 20,
+        BotServos.HeadTilt: 20,
+    }
+    servo_speed: dict               # current speed limit per BotServos
+    servo_acceleration: dict        # current acceleration limit per BotServos
+    # (lower, upper) target limit and the attribute holding the target, per servo
+    SERVO_LIMITS: dict = {
+        BotServos.WheelTogether: (SPEED_FLOOR, SPEED_CEILING),
+        BotServos.WheelTurning: (SPEED_FLOOR, SPEED_CEILING),
+        BotServos.Waist: (4000, 7500),
+        BotServos.HeadPan: (4000, 7500),
+        BotServos.HeadTilt: (4000, 7500),
+    }
+    SERVO_ATTRIBUTE: dict = {
+        BotServos.WheelTogether: '_WHEEL_SPEED',
+        BotServos.WheelTurning: '_WHEEL_SPEED',
+        BotServos.Waist: '_WAIST',
+        BotServos.HeadPan: '_HEAD_TURN',
+        BotServos.HeadTilt: '_HEAD_TILT',
+    }
+
     # constructor
-    def __init__(self):
-        # Fetch the serial USB
-        self.usb = getUSB()
-        # Exit Safe Start. Note: something I found online
-        if self.usb is not None: # TODO: see if we need this
-            self.usb.write(chr(0x83).encode())
+    def __init__(self, usb_name: str = None, protocol: MaestroProtocol = MaestroProtocol.Pololu, device_number: int = None, writer: SerialWriter = None,
+                 reconnect: bool = False, voice: str = DEFAULT_VOICE, tts: TextToSpeech = None, multiple_targets: bool = None):
+        if device_number is not None:
+            self.DEVICE_NUMBER = device_number
+        # `multiple_targets`: None to pick it by the board's USB PID (see supportsMultipleTargets)
+        if multiple_targets is not None:
+            self.multiple_targets = multiple_targets
+            self.detect_multiple_targets = False
+        # `voice`: name, id or index of the speech voice (see TextToSpeech), `tts` shares a speech worker (see Fleet)
+        self.tts = tts if tts is not None else TextToSpeech(voice_name=voice)
+        self.encoder = MaestroEncoder(protocol, self.DEVICE_NUMBER)
+        if writer is not None:
+            # share the port (and its writer thread) with other Maestros, the writer's
+            # connect_frame exits safe-start once for all of them (see Fleet)
+            self.writer = writer
+        else:
+            # Fetch the serial USB (`usb_name` picks a port, e.g. a VirtualMaestro)
+            usb = getUSB(usb_name)
+            # Commands are queued and written on the writer thread, which exits safe-start on
+            # every (re)connected USB
+            self.writer = SerialWriter(usb, self.usb_write_timeout, encode_targets=self.encodeTargets, connect_frame=self.EXIT_SAFE_START)
+        self.detectMultipleTargets()
+        # let the Maestro smooth the motion
+        self.servo_speed = dict()
+        self.servo_acceleration = dict()
+        for servo in BotServos:
+            self.setServoSpeed(servo, self.SERVO_SPEED.get(servo, 0))
+            self.setServoAcceleration(servo, self.SERVO_ACCELERATION.get(servo, 0))
         # center all of the servo motors
-        self.centerHead()       # Centers the HEAD_TILT and HEAD_PAN
-        self.centerWaist()      # Centers the WAIST
-        self.stop()             # Centers the WHEEL_SPEED
-
-    def writeCmd(self, bot_servo: BotServos, target: int = TARGET_CENTER):
-        # Build command
-        lsb = target & 0x7F
-        msb = (target >> 7) & 0x7F
-        servo_chr = bot_servo.value
-        cmd = chr(0xaa) + chr(0xC) + chr(0x04) + chr(servo_chr) + chr(lsb) + chr(msb)
-        command = cmd.encode('utf-8')
+        self.centerAll()        # Centers the HEAD_TILT, HEAD_PAN, WAIST and WHEEL_SPEED
+        # send everything again whenever the USB is reconnected
+        self.writer.reconnect_callbacks.append(self.restoreState)
+        if reconnect and writer is None:
+            # reopen the USB in the background whenever it is lost (e.g. the cable is bumped)
+            self.reconnector = UsbReconnector(self.writer, usb_name)
+
+    @property
+    def usb(self):
+        # the writer owns the USB, it is None while disconnected
+        return self.writer.usb
+
+    def restoreState(self):
+        # the USB was reconnected, the Maestro may have been reset: send the limits and servo values again
+        log.info('Restoring servo state after reconnecting')
+        # the port may now be another board
+        self.detectMultipleTargets()
+        self.forgetTargets()
+        for servo in BotServos:
+            self.setServoSpeed(servo, self.servo_speed.get(servo, 0))
+            self.setServoAcceleration(servo, self.servo_acceleration.get(servo, 0))
+        self.setTargets({
+            BotServos.Waist: self.WAIST,
+            BotServos.HeadPan: self.HEAD_TURN,
+            BotServos.HeadTilt: self.HEAD_TILT,
+        })
+        self.stop()
+
+    def writeCmd(self, bot_servo: BotServos, target: int = TARGET_CENTER, force: bool = False):
+        self.setTargets({bot_servo: target}, force=force)
+
+    def setTargets(self, targets: dict, force: bool = False):
+        """Write several servo targets at once
+
+        `targets` maps BotServos -> target. Servos on contiguous channels are sent as a
+        single Maestro "Set Multiple Targets" command, so centering every servo is one
+        frame and one write instead of one frame (and one write timeout) per servo.
+        Targets still waiting in the writer queue for the same servo are replaced (latest wins),
+        and targets equal to the last one written are skipped unless `force` is True.
+        """
         # Check if usb is not None
+        if self.usb is None:
+            log.debug('Unable to write to USB - USB not connected')
+            return
+        self.writer.writeTargets(targets, force=force, encode_targets=self.encodeTargets)
+
+    def detectMultipleTargets(self):
+        if not self.detect_multiple_targets or self.usb is None:
+            return
+        self.multiple_targets = supportsMultipleTargets(getattr(self.usb, 'port', None))
+        if not self.multiple_targets:
+            log.info('Micro Maestro: one Set Target frame per channel')
+
+    def encodeTargets(self, targets: dict):
+        # called by the writer thread with the coalesced targets, yields one frame per run
+        servos = sorted(targets, key=lambda servo: servo.value)
+        if not self.multiple_targets:
+            for servo in servos:
+                yield self.encoder.setTarget(servo.value, targets[servo])
+            return
+        # split the servos into runs of contiguous channels
+        runs = list()
+        for servo in servos:
+            if len(runs) > 0 and runs[-1][-1].value + 1 == servo.value:
+                runs[-1].append(servo)
+            else:
+                runs.append([servo])
+        for run in runs:
+            if len(run) == 1:
+                yield self.encoder.setTarget(run[0].value, targets[run[0]])
+            else:
+                yield self.encoder.setMultipleTargets(run[0].value, (targets[servo] for servo in run))
+
+    def setServoSpeed(self, bot_servo: BotServos, speed: int):
+        """Limit how fast the Maestro moves `bot_servo` towards its target (0 = unlimited)"""
+        self.servo_speed[bot_servo] = speed
         if self.usb is not None:
-            log.debug('Writing USB Command: "%s"', command)
-            self.usb.write(command)
-            sleep(self.usb_write_timeout)
+            self.writer.writeEncoded(self.encoder.setSpeed, bot_servo.value, speed)
+
+    def setServoAcceleration(self, bot_servo: BotServos, acceleration: int):
+        """Limit how fast the speed of `bot_servo` changes (0 = unlimited)"""
+        self.servo_acceleration[bot_servo] = acceleration
+        if self.usb is not None:
+            self.writer.writeEncoded(self.encoder.setAcceleration, bot_servo.value, acceleration)
+
+    def getPosition(self, bot_servo: BotServos):
+        """Position reported by the Maestro for `bot_servo`, None when there is no answer"""
+        response = self.writer.query(self.encoder.getPosition, (bot_servo.value,), 2)
+        if response is None:
+            return None
+        return response[0] | (response[1] << 8)
+
+    def isMoving(self):
+        """True while any servo is still moving towards its target, None when there is no answer"""
+        response = self.writer.query(self.encoder.getMovingState, (), 1)
+        if response is None:
+            return None
+        return response[0] != 0x00
+
+    def waitUntilArrived(self, bot_servos: list = None, timeout: float = 2.0, poll_interval: float = 0.02) -> bool:
+        """Block until `bot_servos` (default: all servos) have reached their targets
+
+        Uses the Maestro's Get Moving State / Get Position queries, so a sequence can move on as
+        soon as the servos have settled. Returns False if `timeout` expired first. Without
+        position feedback (the device does not answer) this waits out the whole `timeout`.
+        """
+        if self.usb is None:
+            return True
+        deadline = monotonic() + timeout
+        while True:
+            arrived = self.hasArrived(bot_servos)
+            remaining = deadline - monotonic()
+            if arrived is None:
+                # no feedback, fall back to a plain sleep
+                sleep(max(0, remaining))
+                return False
+            if arrived:
+                return True
+            if remaining <= 0:
+                return False
+            sleep(min(poll_interval, remaining))
+
+    def hasArrived(self, bot_servos: list = None):
+        if bot_servos is None:
+            moving = self.isMoving()
+            return None if moving is None else not moving
+        for servo in bot_servos:
+            position = self.getPosition(servo)
+            if position is None:
+                return None
+            # the query runs after the queued targets are written, so the shadow target is current
+            if position != self.writer.shadowTarget(servo, self.encodeTargets):
+                return False
+        return True
+
+    def hold(self, seconds: float):
+        # keep the current motion going for `seconds` (e.g. the duration of a turn); the motion
+        # is written first, so the writer cannot coalesce it with whatever comes after the hold
+        self.wait()
+        sleep(seconds)
+
+    @property
+    def commands(self) -> CommandRegistry:
+        # command names resolved into this controller's methods, built on first use
+        if self._commands is None:
+            self._commands = CommandRegistry(self)
+        return self._commands
+
+    def forgetTargets(self):
+        # the servos were moved by something else (e.g. a Maestro script), write the next targets even if unchanged
+        self.writer.forgetTargets(self.encodeTargets)
+
+    def writeFrame(self, command: bytes):
+        # Check if usb is not None
+        if self.usb is not None:
+            # returns right away, the write (and its timeout) happens on the writer thread
+            self.writer.write(command)
         else:
             log.debug('Unable to write to USB - USB not connected')
 
+    def commandStats(self) -> dict:
+        return self.writer.stats()
+
+    def wait(self, timeout: float = None) -> bool:
+        """Block until all queued commands have been written to the USB"""
+        return self.writer.flush(timeout)
+
+    def flush(self, timeout: float = None) -> bool:
+        return self.wait(timeout)
+
+    def close(self):
+        if self.reconnector is not None:
+            self.reconnector.stop()
+        self.writer.close()
+
     """Getters and Setters
 
     The setter methods are used to condense the necesity to write to the USB each time a servo motor value is changed.
@@ -174,12 +391,17 @@ class TangBotController:
     """Speed Movement Methods"""
 
     def stop(self):
-        self.WHEEL_SPEED = self.TARGET_CENTER
-        self.writeCmd(BotServos.WheelTogether, self.WHEEL_SPEED)
+        self._WHEEL_SPEED = self.TARGET_CENTER
+        log.debug('Set WHEEL_SPEED: %s', self.WHEEL_SPEED)
+        # center both wheel channels with one frame
+        self.setTargets({
+            BotServos.WheelTogether: self.WHEEL_SPEED,
+            BotServos.WheelTurning: self.WHEEL_SPEED,
+        })
 
-    def speak(self, text):
-        engine.say(text)
-        engine.runAndWait()
+    def speak(self, text, interrupt: bool = False):
+        # queued on the speech worker, returns a Future that resolves once the text was spoken
+        return self.tts.speak(text, interrupt)
 
     def setSpeed(self, speed: int):
         self.SPEED = speed
@@ -208,8 +430,31 @@ class TangBotController:
         self.HEAD_TURN -= self.SPEED
 
     def centerHead(self):
-        self.HEAD_TURN = self.TARGET_CENTER
-        self.HEAD_TILT = self.TARGET_CENTER
+        self._HEAD_TURN = self.TARGET_CENTER
+        self._HEAD_TILT = self.TARGET_CENTER
+        log.debug('Set HEAD_TURN: %s, HEAD_TILT: %s', self.HEAD_TURN, self.HEAD_TILT)
+        self.setTargets({
+            BotServos.HeadPan: self.HEAD_TURN,
+            BotServos.HeadTilt: self.HEAD_TILT,
+        })
+
+    def moveTo(self, targets: dict):
+        """Clamp and write several servo targets as one batch, keeping the servo values in sync"""
+        clamped = dict()
+        for servo, target in targets.items():
+            lower, upper = self.SERVO_LIMITS[servo]
+            clamped[servo] = min(max(int(target), lower), upper)
+            setattr(self, self.SERVO_ATTRIBUTE[servo], clamped[servo])
+        self.setTargets(clamped)
+
+    def centerAll(self):
+        self._HEAD_TURN = self.TARGET_CENTER
+        self._HEAD_TILT = self.TARGET_CENTER
+        self._WAIST = self.TARGET_CENTER
+        self._WHEEL_SPEED = self.TARGET_CENTER
+        log.debug('Centering all servos: %s', self.TARGET_CENTER)
+        # channels 0-4 are contiguous, so this is a single frame
+        self.setTargets({servo: self.TARGET_CENTER for servo in BotServos})
 
     """WAIST Movement Methods"""
 
@@ -264,14 +509,14 @@ class TangBotController:
         self.DIRECTION_STATE = DirectionState.LeftTurn
         self.WHEEL_SPEED = 7500
         # self.writeCmd(BotServos.RightWheel, 7500)
-        sleep(.5)
+        self.hold(.5)
         self.stop()
 
     def turnRight(self):
         self.DIRECTION_STATE = DirectionState.RightTurn
         self.WHEEL_SPEED = 4500
         # self.writeCmd(BotServos.RightWheel, 4600)
-        sleep(.5)
+        self.hold(.5)
         self.stop()
 
 # END
@@ -0,0 +1,293 @@
+# text_to_speech.py
+
+import hashlib
+import os
+import shutil
+import subprocess
+import threading
+from concurrent.futures import Future
+from queue import Queue
+from queue import Empty
+from .log import log
+
+TTS_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'tango_bots')
+TTS_CACHE_FILE = os.path.join(TTS_CACHE_DIR, 'tts_voice')
+AUDIO_CACHE_DIR = os.path.join(TTS_CACHE_DIR, 'speech')
+AUDIO_PLAYERS = ['aplay', 'paplay', 'afplay']     # ALSA, PulseAudio, macOS
+
+class AudioCache:
+    """On-disk LRU cache of rendered speech, keyed by text, voice and rate
+
+    Entries are plain audio files; a hit touches the file, so the least recently used files are
+    the oldest and are removed first once the cache grows past `max_bytes`.
+    """
+
+    directory: str
+    max_bytes: int
+
+    # constructor
+    def __init__(self, directory: str = AUDIO_CACHE_DIR, max_bytes: int = 50 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, text: str, voice_id: str, rate: int) -> str:
+        key = hashlib.sha1(f'{voice_id}\0{rate}\0{text}'.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, f'{key}.wav')
+
+    def get(self, text: str, voice_id: str, rate: int):
+        # path of the cached audio, None on a miss
+        path = self.path(text, voice_id, rate)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def add(self, rendered_path: str, text: str, voice_id: str, rate: int) -> str:
+        path = self.path(text, voice_id, rate)
+        os.replace(rendered_path, path)
+        self.evict(keep=path)
+        return path
+
+    def evict(self, keep: str = None):
+        # remove the least recently used files until the cache fits, `keep` is never removed
+        entries = list()
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.wav'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+class TextToSpeech:
+    """Speech worker thread with a queue, interruption and a rendered-audio cache
+
+    `speak()` queues the text and returns a Future right away, so motion, the GUI run loop and
+    speech recognition keep going while the robot talks. The worker owns the pyttsx3 engine
+    (pyttsx3 is not thread-safe), which is created on the first utterance or by `prewarm()`:
+    pyttsx3 and its driver take a while to start, so nothing happens at import time.
+
+    Utterances are rendered to audio files with the engine and played with the platform's
+    player; rendered audio is kept in an AudioCache, so repeated phrases (greetings, status
+    lines) play without being synthesized again. Without a player the engine speaks directly
+    and nothing is cached.
+
+    The voice is picked by (part of) its name, e.g. "english-us", its id or its index in the
+    driver's voice list ("10"), falling back to the driver's default voice. The id it resolved
+    to is cached, so the next start with the same voice does not list every voice.
+    """
+
+    voice_name: str             # part of the voice name, voice id or index, None for the driver's default voice
+    rate: int                   # words per minute
+    engine = None               # pyttsx3.Engine, None until first use, only used on the worker thread
+    voice_id: str               # id of the selected voice, part of the audio cache key
+    cache: AudioCache           # None when there is no player to play rendered audio
+    player: str                 # path to the audio player, None to speak through the engine
+    queue: Queue                # (text, future, generation) waiting to be spoken
+    lock: threading.Lock        # guards the worker start, the generation and the playing process
+    thread: threading.Thread
+    playing = None              # subprocess.Popen of the player, while audio is playing
+    generation: int = 0         # bumped by interrupt(), utterances queued before are not spoken
+
+    # constructor
+    def __init__(self, voice_name: str = None, rate: int = 150, cache: AudioCache = None, player: str = None):
+        self.voice_name = voice_name
+        self.rate = rate
+        self.voice_id = None
+        self.player = player if player is not None else findAudioPlayer()
+        self.cache = cache
+        self.queue = Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def prewarm(self):
+        # start the worker, it creates the engine before the first utterance arrives
+        self.startWorker()
+
+    def startWorker(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.threadedSpeaking, daemon=True)
+                self.thread.start()
+
+    def speak(self, text: str, interrupt: bool = False) -> Future:
+        """Queue `text`, the Future resolves to True once it was spoken (False if interrupted)
+
+        `interrupt=True` cuts off the current utterance and drops everything still queued.
+        """
+        if interrupt:
+            self.interrupt()
+        future = Future()
+        with self.lock:
+            generation = self.generation
+        self.queue.put((text, future, generation))
+        self.startWorker()
+        return future
+
+    def say(self, text: str):
+        # speak and block until done
+        return self.speak(text).result()
+
+    def interrupt(self):
+        # everything queued so far is stale, even an utterance the worker is just taking off the queue
+        with self.lock:
+            self.generation += 1
+        # drop the queued utterances
+        while True:
+            try:
+                _, future, _ = self.queue.get_nowait()
+            except Empty:
+                break
+            if future.set_running_or_notify_cancel():
+                future.set_result(False)
+        # and stop the one being spoken
+        with self.lock:
+            if self.playing is not None:
+                self.playing.terminate()
+        if self.engine is not None and self.player is None:
+            self.engine.stop()
+
+    """Worker Thread"""
+
+    def threadedSpeaking(self):
+        try:
+            self.getEngine()
+        except Exception as err:
+            # retried by every utterance, which then fails with the error
+            log.error('Unable to start the speech engine: %s', err)
+        while True:
+            text, future, generation = self.queue.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            if not self.isCurrent(generation):
+                # interrupted while it was queued
+                future.set_result(False)
+                continue
+            try:
+                self.speakNow(text, generation)
+            except Exception as err:
+                log.error('Unable to speak "%s": %s', text, err)
+                future.set_exception(err)
+                continue
+            future.set_result(self.isCurrent(generation))
+
+    def isCurrent(self, generation: int) -> bool:
+        with self.lock:
+            return generation == self.generation
+
+    def getEngine(self):
+        if self.engine is None:
+            self.engine = self.createEngine()
+            if self.player is not None and self.cache is None:
+                try:
+                    self.cache = AudioCache()
+                except OSError as err:
+                    log.warning('Speech audio cache unavailable: %s', err)
+        return self.engine
+
+    def createEngine(self):
+        import pyttsx3
+        engine = pyttsx3.init()
+        voice_id = self.selectVoice(engine)
+        if voice_id is not None:
+            try:
+                engine.setProperty('voice', voice_id)
+            except (ValueError, KeyError, RuntimeError) as err:
+                # e.g. a cached id from a different driver
+                log.warning('Unable to select voice %s: %s', voice_id, err)
+        engine.setProperty('rate', self.rate)
+        self.voice_id = engine.getProperty('voice')
+        log.debug('Speech engine ready, voice: %s', self.voice_id)
+        return engine
+
+    def selectVoice(self, engine):
+        if self.voice_name is None:
+            return None
+        # the cached id skips listing every voice
+        voice_id = readCachedVoiceId(self.voice_name)
+        if voice_id is not None:
+            return voice_id
+        voice_id = findVoice(engine.getProperty('voices'), self.voice_name)
+        if voice_id is None:
+            log.warning('Voice "%s" not found, using the default voice', self.voice_name)
+            return None
+        writeCachedVoiceId(self.voice_name, voice_id)
+        return voice_id
+
+    def speakNow(self, text: str, generation: int):
+        engine = self.getEngine()
+        if self.player is None or self.cache is None:
+            engine.say(text)
+            engine.runAndWait()
+            return
+        path = self.cache.get(text, self.voice_id, self.rate)
+        if path is None:
+            path = self.render(text)
+        self.play(path, generation)
+
+    def render(self, text: str) -> str:
+        rendered_path = os.path.join(self.cache.directory, f'rendering-{threading.get_ident()}.wav')
+        self.engine.save_to_file(text, rendered_path)
+        self.engine.runAndWait()
+        return self.cache.add(rendered_path, text, self.voice_id, self.rate)
+
+    def play(self, path: str, generation: int):
+        with self.lock:
+            if generation != self.generation:
+                # interrupted while rendering
+                return
+            self.playing = subprocess.Popen([self.player, path], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            self.playing.wait()
+        finally:
+            with self.lock:
+                self.playing = None
+
+def findAudioPlayer():
+    for name in AUDIO_PLAYERS:
+        path = shutil.which(name)
+        if path is not None:
+            return path
+    return None
+
+def findVoice(voices: list, voice_name: str):
+    # id of the voice at index `voice_name` ("10") or whose name or id contains it, None if there is none
+    if voice_name.isdigit():
+        index = int(voice_name)
+        return voices[index].id if index < len(voices) else None
+    name = voice_name.lower()
+    for voice in voices:
+        if name in (voice.name or '').lower() or name == voice.id.lower():
+            return voice.id
+    return None
+
+def readCachedVoiceId(voice_name: str):
+    # the cache holds the requested voice name and the id it resolved to, one per line
+    try:
+        with open(TTS_CACHE_FILE, 'r') as file:
+            lines = file.read().splitlines()
+    except OSError:
+        return None
+    if len(lines) != 2 or lines[0] != voice_name:
+        return None
+    return lines[1] or None
+
+def writeCachedVoiceId(voice_name: str, voice_id: str):
+    try:
+        os.makedirs(os.path.dirname(TTS_CACHE_FILE), exist_ok=True)
+        with open(TTS_CACHE_FILE, 'w') as file:
+            file.write(f'{voice_name}\n{voice_id}\n')
+    except OSError as err:
+        log.debug('Unable to cache voice id: %s', err)
+
+# END
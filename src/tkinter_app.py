@@ -8,31 +8,26 @@ from typing import List
 import platform
 from time import sleep
 from .tango_bot import TangBotController
+from .tango_bot import BotServos
+from .maestro_script import compileEvents
+from .maestro_script import MaestroScriptRunner
+from .maestro_script import ScriptCompileError
+from .maestro_script import ScriptRunError
+from .recognizers import RecognizerBackend
+from .recognizers import createBackend
+from .recognizers import printTranscription
+from .command_matcher import CommandMatcher
+from .commands import PHRASE_BOT_DICT
+from .commands import CommandBus
 from .log import log
 from enum import Enum
 import speech_recognition as sr
 
-recognizer: sr.Recognizer = sr.Recognizer()
-microphone: sr.Microphone = sr.Microphone()
-
-PHRASE_BOT_DICT = {
-    'head up': 'moveHeadUp',
-    'head down': 'moveHeadDown',
-    'head left': 'moveHeadLeft',
-    'head right': 'moveHeadRight',
-    'head center': 'centerHead',
-    'body left': 'moveWaistLeft',
-    'body right': 'moveWaistRight',
-    'body center': 'centerWaist',
-    'forward': 'increaseWheelSpeed',
-    'reverse': 'decreaseWheelSpeed',
-    'turn left': 'turnLeft',
-    'turn right': 'turnRight',
-    'stop': 'stop',
-    # 'speed one': 'setSpeedLevelOne',
-    # 'speed two': 'setSpeedLevelTwo',
-    # 'speed three': 'setSpeedLevelThree',
-}
+# created on the first speech input, opening the microphone is slow and needs PyAudio
+recognizer: sr.Recognizer = None
+microphone: sr.Microphone = None
+recognizer_backend: RecognizerBackend = None
+RECOGNIZER_NAME: str = 'auto'      # set by run_app()
 
 class BotEventType(Enum):
     HeadUp      = 'HEAD UP'
@@ -50,6 +45,51 @@ class BotEventType(Enum):
     Stop        = 'STOP'
     Speak       = 'SPEAK'
 
+# event type -> controller command (see commands.py)
+BOT_EVENT_COMMANDS = {
+    BotEventType.HeadUp: 'moveHeadUp',
+    BotEventType.HeadDown: 'moveHeadDown',
+    BotEventType.HeadLeft: 'moveHeadLeft',
+    BotEventType.HeadRight: 'moveHeadRight',
+    BotEventType.HeadCenter: 'centerHead',
+    BotEventType.WaistLeft: 'moveWaistLeft',
+    BotEventType.WaistRight: 'moveWaistRight',
+    BotEventType.WaistCenter: 'centerWaist',
+    BotEventType.Forward: 'increaseWheelSpeed',
+    BotEventType.Reverse: 'decreaseWheelSpeed',
+    BotEventType.TurnLeft: 'turnLeft',
+    BotEventType.TurnRight: 'turnRight',
+    BotEventType.Stop: 'stop',
+    BotEventType.Speak: 'speak',
+}
+
+# servos a positional event moves; the other events (wheels, speech) last a fixed time instead,
+# the wheel channels have no speed limit and report "arrived" right away
+BOT_EVENT_SERVOS = {
+    BotEventType.HeadUp: [BotServos.HeadTilt],
+    BotEventType.HeadDown: [BotServos.HeadTilt],
+    BotEventType.HeadLeft: [BotServos.HeadPan],
+    BotEventType.HeadRight: [BotServos.HeadPan],
+    BotEventType.HeadCenter: [BotServos.HeadPan, BotServos.HeadTilt],
+    BotEventType.WaistLeft: [BotServos.Waist],
+    BotEventType.WaistRight: [BotServos.Waist],
+    BotEventType.WaistCenter: [BotServos.Waist],
+}
+
+# spoken phrase -> event type, for the phrases that have an event (no speed levels)
+SPEECH_EVENT_TYPES = {
+    phrase: event_type
+    for phrase, command in PHRASE_BOT_DICT.items()
+    for event_type, event_command in BOT_EVENT_COMMANDS.items()
+    if command == event_command
+}
+COMMAND_MATCHER = CommandMatcher(SPEECH_EVENT_TYPES)
+
+def commandScore(transcription: str):
+    # confidence of the closest phrase, None if the transcription is not a command
+    match = COMMAND_MATCHER.match(transcription)
+    return match.confidence if match is not None else None
+
 """ BotEventFrame
 
     Layouts
@@ -289,46 +329,35 @@ class BotEvent:
     def createWidget(self):
         self.widget = BotEventFrame(bot_event=self)
 
-    def execute(self):
-        log.debug("Executing BotEvent '%s'", self.event_type.value)
+    def steps(self) -> list:
+        # the event as a plan of (command, kwargs, count) steps
         default_sleep = 0.8
+        kwargs = dict()
         if self.event_type == BotEventType.Speak:
-            TANGO_BOT.speak(text=self.speak_text)
-        if self.event_type == BotEventType.HeadUp:
-            TANGO_BOT.moveHeadUp()
-        elif self.event_type == BotEventType.HeadDown:
-            TANGO_BOT.moveHeadDown()
-        elif self.event_type == BotEventType.HeadLeft:
-            TANGO_BOT.moveHeadLeft()
-        elif self.event_type == BotEventType.HeadRight:
-            TANGO_BOT.moveHeadRight()
-        elif self.event_type == BotEventType.HeadCenter:
-            TANGO_BOT.centerHead()
-        elif self.event_type == BotEventType.WaistCenter:
-            TANGO_BOT.centerWaist()
-        elif self.event_type == BotEventType.WaistLeft:
-            TANGO_BOT.moveWaistLeft()
-        elif self.event_type == BotEventType.WaistRight:
-            TANGO_BOT.moveWaistRight()
-        elif self.event_type == BotEventType.Forward:
-            TANGO_BOT.increaseWheelSpeed(speed_level=self.speed_step)
-        elif self.event_type == BotEventType.Reverse:
-            TANGO_BOT.decreaseWheelSpeed(speed_level=self.speed_step)
-        elif self.event_type == BotEventType.TurnLeft:
-            TANGO_BOT.turnLeft()
-        elif self.event_type == BotEventType.TurnRight:
-            TANGO_BOT.turnRight()
-        elif self.event_type == BotEventType.Stop:
-            TANGO_BOT.stop()
-            return
+            kwargs['text'] = self.speak_text
+        elif self.event_type in (BotEventType.Forward, BotEventType.Reverse):
+            kwargs['speed_level'] = self.speed_step
+        steps = [(BOT_EVENT_COMMANDS[self.event_type], kwargs, 1)]
+        if self.event_type == BotEventType.Stop:
+            return steps
 
         # timeout
         if self.has_time_interval:
-            sleep(self.time_interval)
+            steps.append(('hold', {'seconds': self.time_interval}, 1))
+        elif self.event_type in BOT_EVENT_SERVOS:
+            # move on as soon as the servos have settled
+            steps.append(('waitUntilArrived', {'bot_servos': BOT_EVENT_SERVOS[self.event_type], 'timeout': default_sleep}, 1))
         else:
-            sleep(default_sleep)
+            # drive (or talk) for the default duration
+            steps.append(('hold', {'seconds': default_sleep}, 1))
+
+        steps.append(('stop', {}, 1))
+        return steps
 
-        TANGO_BOT.stop()
+    def execute(self):
+        # runs on the command bus, the Future resolves once the event finished
+        log.debug("Executing BotEvent '%s'", self.event_type.value)
+        return COMMAND_BUS.publishPlan(self.steps())
 
 class ArrowDirectionControlsFrame(ttk.Frame):
     # properties
@@ -788,6 +817,7 @@ class RunningEventsProgressFrame(ttk.Frame):
     def stopRunningEvents(self):
         global EVENTS_RUNNING
         EVENTS_RUNNING = False
+        TANGO_BOT.tts.interrupt()
 
 class SpeechInputFrame(ttk.Frame):
     # constructor
@@ -798,7 +828,7 @@ class SpeechInputFrame(ttk.Frame):
 
         self.phrases_frame = ttk.Frame(self)
 
-        for phrase in PHRASE_BOT_DICT.keys():
+        for phrase in SPEECH_EVENT_TYPES.keys():
             ttk.Label(self.phrases_frame, text=f"\"{phrase}\"").pack()
 
         self.phrases_frame.pack()
@@ -852,7 +882,9 @@ class SpeechInputFrame(ttk.Frame):
         transcription = transcription.lower()
         print("Converted: ", transcription)
 
-        if transcription not in PHRASE_BOT_DICT.keys():
+        # closest phrase, so near misses ("head app") do not have to be spoken again
+        match = COMMAND_MATCHER.match(transcription)
+        if match is None:
             self.listening_label.config(text=f"Invalid Phrase: \"{transcription}\"")
             self.phrases_frame.pack_forget()
             self.listen_button.pack_forget()
@@ -861,36 +893,7 @@ class SpeechInputFrame(ttk.Frame):
             self.listen_button.pack()
             self.cancel_button.pack()
             return
-
-
-        bot_event: BotEvent = None
-        if transcription == 'head up':
-            bot_event = BotEvent(event_type=BotEventType.HeadUp)
-        elif transcription == 'head down':
-            bot_event = BotEvent(event_type=BotEventType.HeadDown)
-        elif transcription == 'head left':
-            bot_event = BotEvent(event_type=BotEventType.HeadLeft)
-        elif transcription == 'head right':
-            bot_event = BotEvent(event_type=BotEventType.HeadRight)
-        elif transcription == 'head center':
-            bot_event = BotEvent(event_type=BotEventType.HeadCenter)
-        elif transcription == 'body left':
-            bot_event = BotEvent(event_type=BotEventType.WaistLeft)
-        elif transcription == 'body right':
-            bot_event = BotEvent(event_type=BotEventType.WaistRight)
-        elif transcription == 'body center':
-            bot_event = BotEvent(event_type=BotEventType.WaistCenter)
-        elif transcription == 'forward':
-            bot_event = BotEvent(event_type=BotEventType.Forward)
-        elif transcription == 'reverse':
-            bot_event = BotEvent(event_type=BotEventType.Reverse)
-        elif transcription == 'turn left':
-            bot_event = BotEvent(event_type=BotEventType.TurnLeft)
-        elif transcription == 'turn right':
-            bot_event = BotEvent(event_type=BotEventType.TurnRight)
-        elif transcription == 'stop':
-            bot_event = BotEvent(event_type=BotEventType.Stop)
-
+        bot_event = BotEvent(event_type=match.command)
         APP_INST.frames['event_settings'].bot_event = bot_event
         APP_INST.showFrame('event_settings')
 
@@ -899,6 +902,15 @@ class SpeechInputFrame(ttk.Frame):
 
     def recognize_speech_from_mic(self):
         global APP_INST
+        global recognizer
+        global microphone
+        global recognizer_backend
+
+        if microphone is None:
+            recognizer = sr.Recognizer()
+            microphone = sr.Microphone()
+            recognizer_backend = createBackend(RECOGNIZER_NAME, list(SPEECH_EVENT_TYPES.keys()), recognizer,
+                                               accept=lambda text: commandScore(text) is not None, score=commandScore)
 
         # check that recognizer and microphone arguments are appropriate type
         if not isinstance(recognizer, sr.Recognizer):
@@ -917,18 +929,9 @@ class SpeechInputFrame(ttk.Frame):
                 audio = recognizer.listen(source, timeout=5, phrase_time_limit=2)
         except sr.WaitTimeoutError:
             return None
-        # try recognizing the speech in the recording
-        # if a RequestError or UnknownValueError exception is caught
-        transcription = None
-        try:
-            transcription = recognizer.recognize_google(audio)
-            print(transcription)
-        except sr.RequestError as err:
-            # API was unreachable or unresponsive
-            print("API was unreachable or unresponsive.\n", err)
-        except sr.UnknownValueError as err:
-            # speech was unintelligible
-            print("Unknown word")
+        # None when the backend did not understand the speech (or failed, it logs why)
+        transcription = recognizer_backend.recognize(audio)
+        printTranscription(transcription)
         return transcription
 
 class TkinterApp(tk.Tk):
@@ -973,8 +976,14 @@ class TkinterApp(tk.Tk):
             self.destroy()
         except tk.TclError as err:
             log.error(err)
-        global TANGO_BOT
-        TANGO_BOT.stop()
+        TANGO_BOT.tts.interrupt()
+        COMMAND_BUS.publish('stop')
+        COMMAND_BUS.close()
+        log.info('Command bus: %s', COMMAND_BUS.stats())
+        TANGO_BOT.wait()
+        if recognizer_backend is not None:
+            # e.g. the Sphinx grammar file
+            recognizer_backend.close()
 
     def showMainFrame(self):
         self.showFrame('main')
@@ -1021,17 +1030,6 @@ class TkinterApp(tk.Tk):
         # make the top right close button
         self.protocol('WM_DELETE_WINDOW', self.stop)
 
-def runEventsThreadFnc():
-    print('Running Events...')
-    global EVENTS_DATA
-    for event in EVENTS_DATA:
-        print(event.type.value)
-        event.execute()
-        sleep(0.5)
-    TANGO_BOT.stop()
-    global RUN_EVENTS_THREAD
-    RUN_EVENTS_THREAD = None
-
 def runEvents():
 
     global APP_INST
@@ -1049,32 +1047,67 @@ def runEvents():
 
     log.debug('Running Events')
 
-    for event in EVENTS_DATA:
-        if EVENTS_RUNNING is False:
-            log.debug('Stopped Running Events')
-            break
-        events_completed += 1
-        progress_value = events_completed * progress_step_size
-        APP_INST.frames['running_events'].progressbar['value'] = progress_value
-        APP_INST.update_idletasks()
-        APP_INST.update()
-        event.execute()
+    if runEventsOnDevice():
+        APP_INST.frames['running_events'].progressbar['value'] = 100
+    else:
+        for event in EVENTS_DATA:
+            if EVENTS_RUNNING is False:
+                log.debug('Stopped Running Events')
+                break
+            events_completed += 1
+            progress_value = events_completed * progress_step_size
+            APP_INST.frames['running_events'].progressbar['value'] = progress_value
+            APP_INST.update_idletasks()
+            APP_INST.update()
+            future = event.execute()
+            # keep the window responsive (and the stop button working) while the event runs
+            while not future.done() and EVENTS_RUNNING:
+                APP_INST.update_idletasks()
+                APP_INST.update()
+                sleep(0.02)
 
     log.debug('Finished Running Events, stopping robot and centering')
-    # stop the robot
-    TANGO_BOT.stop()
-    TANGO_BOT.centerHead()
-    TANGO_BOT.centerWaist()
+    # stop the robot and center every servo (a single frame)
+    COMMAND_BUS.publish('centerAll')
+    COMMAND_BUS.flush()
+    TANGO_BOT.wait()
     log.debug('Finished Running Events')
     showinfo(message='Finished Running!')
     EVENTS_RUNNING = False
     APP_INST.showFrame('main')
 
+def runEventsOnDevice():
+    # the bus thread compiles and runs the script, like every other command; this (Tk) thread
+    # keeps the window responsive (and the stop button working) meanwhile
+    future = COMMAND_BUS.publishCall(runScriptOnDevice, list(EVENTS_DATA))
+    while not future.done():
+        APP_INST.update_idletasks()
+        APP_INST.update()
+        sleep(0.02)
+    try:
+        return future.result()
+    except ScriptRunError as err:
+        # the script was stopped part way, running the events again from the host would repeat moves
+        showerror(message=f'Running on the Maestro failed: {err}')
+        return True
+
+def runScriptOnDevice(events: list) -> bool:
+    # compile the events into a Maestro script so the timing runs on the controller,
+    # False if they have to run from the host (runs on the bus thread)
+    runner = MaestroScriptRunner(TANGO_BOT)
+    if not runner.available:
+        return False
+    try:
+        script = compileEvents(events, TANGO_BOT)
+    except ScriptCompileError as err:
+        log.debug('Running events from the host: %s', err)
+        return False
+    log.debug('Running events as a Maestro script:\n%s', script)
+    return runner.run(script, keep_running=lambda: EVENTS_RUNNING)
 
 def stopRobot():
     print('Stop Robot')
-    global TANGO_BOT
-    TANGO_BOT.stop()
+    COMMAND_BUS.publish('stop')
 
 def fetchTkImage(file: str, size: int = 20, rotate: float = None, transpose = None):
     img = Image.open(file)
@@ -1087,13 +1120,22 @@ def fetchTkImage(file: str, size: int = 20, rotate: float = None, transpose = No
     return ImageTk.PhotoImage(img)
 
 APP_INST: TkinterApp = None
-TANGO_BOT: TangBotController = TangBotController()
+TANGO_BOT: TangBotController = None     # created by run_app()
+COMMAND_BUS: CommandBus = None          # created by run_app(), the only thread driving TANGO_BOT
 EVENTS_VIEW_PORT_FRAME = None
 EVENTS_DATA: List[BotEvent] = list()
 EVENTS_RUNNING: bool = False
 
-def run_app():
+def run_app(recognizer_name: str = 'auto', voice: str = TangBotController.DEFAULT_VOICE):
     global APP_INST
+    global TANGO_BOT
+    global COMMAND_BUS
+    global RECOGNIZER_NAME
+    RECOGNIZER_NAME = recognizer_name
+    TANGO_BOT = TangBotController(reconnect=True, voice=voice)
+    COMMAND_BUS = CommandBus(TANGO_BOT.commands)
+    # Speak events need the speech engine, start it while the window is built
+    TANGO_BOT.tts.prewarm()
     APP_INST = TkinterApp()
     APP_INST.run()
 
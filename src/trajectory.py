@@ -0,0 +1,268 @@
+# trajectory.py
+
+import bisect
+import statistics
+import threading
+from enum import Enum
+from time import perf_counter, sleep
+from .log import log
+from .tango_bot import TangBotController
+from .tango_bot import BotServos
+
+class Interpolation(Enum):
+    Linear = 'linear'
+    Cubic = 'cubic'         # cubic Hermite with Catmull-Rom tangents, eases in/out at the ends
+
+class Keyframe:
+    time: float             # seconds from the start of the trajectory
+    target: int
+
+    # constructor
+    def __init__(self, time: float, target: int):
+        self.time = time
+        self.target = target
+
+    def __repr__(self):
+        return f'Keyframe({self.time}, {self.target})'
+
+class Trajectory:
+    """Keyframes per servo, interpolated into targets at any point in time"""
+
+    keyframes: dict             # BotServos -> list of Keyframe (sorted by time)
+    times: dict                 # BotServos -> list of keyframe times (for bisect)
+    interpolation: Interpolation
+
+    # constructor
+    def __init__(self, keyframes: dict, interpolation: Interpolation = Interpolation.Linear):
+        self.interpolation = interpolation
+        self.keyframes = dict()
+        self.times = dict()
+        for servo, frames in keyframes.items():
+            frames = sorted((frame if isinstance(frame, Keyframe) else Keyframe(*frame) for frame in frames), key=lambda frame: frame.time)
+            if len(frames) < 1:
+                raise ValueError(f'No keyframes for {servo}')
+            self.keyframes[servo] = frames
+            self.times[servo] = [frame.time for frame in frames]
+
+    @property
+    def duration(self) -> float:
+        return max(frames[-1].time for frames in self.keyframes.values())
+
+    def targetsAt(self, time: float) -> dict:
+        return {servo: self.targetAt(servo, time) for servo in self.keyframes}
+
+    def targetAt(self, servo: BotServos, time: float) -> int:
+        frames = self.keyframes[servo]
+        times = self.times[servo]
+        if time <= times[0]:
+            return frames[0].target
+        if time >= times[-1]:
+            return frames[-1].target
+        i = bisect.bisect_right(times, time) - 1
+        start, end = frames[i], frames[i + 1]
+        span = end.time - start.time
+        u = (time - start.time) / span
+        if self.interpolation is Interpolation.Linear:
+            return round(start.target + (end.target - start.target) * u)
+        # cubic Hermite between start and end, tangents from the neighbouring keyframes
+        m0 = self.tangent(frames, i) * span
+        m1 = self.tangent(frames, i + 1) * span
+        u2 = u * u
+        u3 = u2 * u
+        value = (2 * u3 - 3 * u2 + 1) * start.target + (u3 - 2 * u2 + u) * m0 \
+            + (-2 * u3 + 3 * u2) * end.target + (u3 - u2) * m1
+        return round(value)
+
+    def tangent(self, frames: list, i: int) -> float:
+        # zero at the first/last keyframe so the motion starts and ends at rest
+        if i == 0 or i == len(frames) - 1:
+            return 0.0
+        return (frames[i + 1].target - frames[i - 1].target) / (frames[i + 1].time - frames[i - 1].time)
+
+class PlaybackReport:
+    """Timing of one trajectory playback, on the host and on the wire"""
+
+    rate: float                 # ticks per second played (the requested rate, capped by the writer)
+    ticks: int
+    duration: float             # seconds from the first to the last tick
+    lateness: list              # seconds each tick ran after its deadline
+    intervals: list             # seconds between consecutive ticks
+    write_intervals: list       # seconds between consecutive frames the writer put on the USB
+    frames_written: int
+    frames_dropped: int
+
+    # constructor
+    def __init__(self, rate: float, ticks: int, duration: float, lateness: list, intervals: list, write_intervals: list, frames_written: int, frames_dropped: int):
+        self.rate = rate
+        self.ticks = ticks
+        self.duration = duration
+        self.lateness = lateness
+        self.intervals = intervals
+        self.write_intervals = write_intervals
+        self.frames_written = frames_written
+        self.frames_dropped = frames_dropped
+
+    @property
+    def mean_lateness(self) -> float:
+        return statistics.fmean(self.lateness) if len(self.lateness) > 0 else 0.0
+
+    @property
+    def max_lateness(self) -> float:
+        return max(self.lateness) if len(self.lateness) > 0 else 0.0
+
+    @property
+    def tick_jitter(self) -> float:
+        # standard deviation of the tick interval (host side)
+        return statistics.pstdev(self.intervals) if len(self.intervals) > 1 else 0.0
+
+    @property
+    def jitter(self) -> float:
+        # standard deviation of the interval between frames actually written to the USB
+        return statistics.pstdev(self.write_intervals) if len(self.write_intervals) > 1 else 0.0
+
+    def __str__(self):
+        return (f'{self.ticks} ticks at {self.rate:.1f}/s in {self.duration:.3f}s, '
+                f'lateness mean {self.mean_lateness * 1000:.2f}ms max {self.max_lateness * 1000:.2f}ms, '
+                f'tick jitter {self.tick_jitter * 1000:.2f}ms, write jitter {self.jitter * 1000:.2f}ms, '
+                f'frames written {self.frames_written} dropped {self.frames_dropped}')
+
+class TrajectoryPlayer:
+    """Streams a Trajectory to a TangBotController at a fixed rate
+
+    Each tick writes the interpolated targets of every servo as one batch (`moveTo`). The
+    Maestro speed/acceleration limits of the servos in the trajectory are switched off during
+    playback, since the trajectory already does the smoothing. The writer sleeps its
+    `write_timeout` after every frame, so the rate is capped at what it can put on the wire
+    (see `effectiveRate`); faster ticks would only be coalesced away. Lower the controller's
+    `usb_write_timeout` to stream at higher rates. The report's jitter is measured on the
+    frames the writer wrote.
+    """
+
+    bot: TangBotController
+    rate: float                 # ticks per second
+    thread: threading.Thread = None
+    stopped: threading.Event
+
+    # constructor
+    def __init__(self, bot: TangBotController, rate: float = 50.0):
+        self.bot = bot
+        self.rate = rate
+        self.stopped = threading.Event()
+
+    def effectiveRate(self, servos: list) -> float:
+        """Ticks per second the writer keeps up with: a frame per run of contiguous channels (per channel
+        without Set Multiple Targets), each followed by the write timeout"""
+        write_timeout = self.bot.writer.write_timeout
+        if write_timeout <= 0:
+            return self.rate
+        channels = sorted(servo.value for servo in servos)
+        if self.bot.multiple_targets:
+            frames = 1 + sum(1 for a, b in zip(channels, channels[1:]) if b != a + 1)
+        else:
+            frames = len(channels)
+        return min(self.rate, 1 / (write_timeout * frames))
+
+    def play(self, trajectory: Trajectory) -> PlaybackReport:
+        """Play `trajectory` on the calling thread and return its timing report"""
+        self.stopped.clear()
+        servos = list(trajectory.keyframes.keys())
+        rate = self.effectiveRate(servos)
+        if rate < self.rate:
+            log.info('Trajectory rate capped at %.1f/s by the write timeout (%.3fs)', rate, self.bot.writer.write_timeout)
+        limits = {servo: (self.bot.servo_speed.get(servo, 0), self.bot.servo_acceleration.get(servo, 0)) for servo in servos}
+        for servo in servos:
+            self.bot.setServoSpeed(servo, 0)
+            self.bot.setServoAcceleration(servo, 0)
+        # the limits go out first, so they do not delay (and coalesce) the first ticks
+        self.bot.wait()
+        stats_before = self.bot.commandStats()
+        write_log = list()
+        self.bot.writer.write_log = write_log
+        period = 1 / rate
+        ticks = int(trajectory.duration * rate) + 1
+        lateness = list()
+        tick_times = list()
+        start = perf_counter()
+        try:
+            for tick in range(ticks):
+                if self.stopped.is_set():
+                    break
+                deadline = start + tick * period
+                delay = deadline - perf_counter()
+                if delay > 0:
+                    sleep(delay)
+                now = perf_counter()
+                lateness.append(now - deadline)
+                tick_times.append(now)
+                self.bot.moveTo(trajectory.targetsAt(min(tick * period, trajectory.duration)))
+            # always finish on the last keyframe
+            if not self.stopped.is_set():
+                self.bot.moveTo(trajectory.targetsAt(trajectory.duration))
+            self.bot.wait()
+            stats_after = self.bot.commandStats()
+        finally:
+            self.bot.writer.write_log = None
+            for servo, (speed, acceleration) in limits.items():
+                self.bot.setServoSpeed(servo, speed)
+                self.bot.setServoAcceleration(servo, acceleration)
+        self.bot.wait()
+        intervals = [b - a for a, b in zip(tick_times, tick_times[1:])]
+        report = PlaybackReport(
+            rate=rate,
+            ticks=len(tick_times),
+            duration=tick_times[-1] - tick_times[0] if len(tick_times) > 0 else 0.0,
+            lateness=lateness,
+            intervals=intervals,
+            write_intervals=[b - a for a, b in zip(write_log, write_log[1:])],
+            frames_written=stats_after['frames_written'] - stats_before['frames_written'],
+            frames_dropped=stats_after['frames_dropped'] - stats_before['frames_dropped'],
+        )
+        log.info('Trajectory playback: %s', report)
+        return report
+
+    def start(self, trajectory: Trajectory):
+        """Play `trajectory` on a background thread"""
+        self.stop()
+        self.thread = threading.Thread(target=self.play, args=(trajectory,), daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is not None and self.thread.is_alive():
+            self.stopped.set()
+            self.thread.join()
+        self.thread = None
+
+"""Gestures"""
+
+def headNod(times: int = 2, depth: int = 700, period: float = 0.6, center: int = TangBotController.TARGET_CENTER) -> Trajectory:
+    frames = [Keyframe(0.0, center)]
+    for i in range(times):
+        frames.append(Keyframe((i + 0.5) * period, center - depth))
+        frames.append(Keyframe((i + 1) * period, center))
+    return Trajectory({BotServos.HeadTilt: frames}, Interpolation.Cubic)
+
+def headShake(times: int = 2, width: int = 800, period: float = 0.8, center: int = TangBotController.TARGET_CENTER) -> Trajectory:
+    frames = [Keyframe(0.0, center)]
+    for i in range(times):
+        frames.append(Keyframe((i + 0.25) * period, center + width))
+        frames.append(Keyframe((i + 0.75) * period, center - width))
+        frames.append(Keyframe((i + 1) * period, center))
+    return Trajectory({BotServos.HeadPan: frames}, Interpolation.Cubic)
+
+def waistSweep(width: int = 1200, duration: float = 3.0, center: int = TangBotController.TARGET_CENTER) -> Trajectory:
+    return Trajectory({
+        BotServos.Waist: [
+            Keyframe(0.0, center),
+            Keyframe(duration * 0.25, center + width),
+            Keyframe(duration * 0.75, center - width),
+            Keyframe(duration, center),
+        ],
+        BotServos.HeadPan: [
+            Keyframe(0.0, center),
+            Keyframe(duration * 0.25, center - width // 2),
+            Keyframe(duration * 0.75, center + width // 2),
+            Keyframe(duration, center),
+        ],
+    }, Interpolation.Cubic)
+
+# END
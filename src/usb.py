@@ -1,28 +1,144 @@
 # usb.py
 
+import os
+import threading
 import serial
+from serial.tools import list_ports
 from .log import log
 
-def getUSB():
-    usb = None
-    usb_name = '/dev/ttyACM0'
+USB_NAMES = ['/dev/ttyACM0', '/dev/ttyACM1']     # fallback when the ports carry no VID/PID (see fallbackPorts)
+POLOLU_VID = 0x1FFB
+MAESTRO_PIDS = [0x0089, 0x008A, 0x008B, 0x008C]   # Micro Maestro 6, Mini Maestro 12, 18 and 24
+MICRO_MAESTRO_PID = 0x0089                        # no Set Multiple Targets command
+USB_CACHE_FILE = os.path.join(os.path.expanduser('~'), '.cache', 'tango_bots', 'usb_port')
+
+def findMaestroPorts(ports: list = None) -> list:
+    """Command ports of the connected Maestros, found by USB VID/PID"""
+    if ports is None:
+        ports = list_ports.comports()
+    maestro_ports = list()
+    for port in ports:
+        if port.vid != POLOLU_VID or port.pid not in MAESTRO_PIDS:
+            continue
+        # every Maestro has a "Command Port" (interface 0) and a "TTL Port", keep the command port
+        if port.location is not None and not port.location.endswith(':1.0'):
+            continue
+        maestro_ports.append(port.device)
+    return sorted(maestro_ports)
+
+def fallbackPorts(ports: list = None) -> list:
+    """The default names that may still be a Maestro
+
+    A name is dropped when list_ports knows it as another USB device, so after re-enumeration
+    an unrelated ACM device (modem, another board) is never opened as the Maestro.
+    """
+    if ports is None:
+        ports = list_ports.comports()
+    identified = {port.device for port in ports if port.vid is not None}
+    return [name for name in USB_NAMES if name not in identified]
+
+def supportsMultipleTargets(usb_name: str) -> bool:
+    """False if `usb_name` is a Micro Maestro 6, which has no Set Multiple Targets (0x9F)
+
+    Ports list_ports cannot identify (e.g. a VirtualMaestro) count as a Mini Maestro.
+    """
+    for port in list_ports.comports():
+        if port.device == usb_name:
+            return not (port.vid == POLOLU_VID and port.pid == MICRO_MAESTRO_PID)
+    return True
+
+def readCachedUSBName():
+    try:
+        with open(USB_CACHE_FILE, 'r') as file:
+            return file.read().strip() or None
+    except OSError:
+        return None
+
+def writeCachedUSBName(usb_name: str):
+    try:
+        os.makedirs(os.path.dirname(USB_CACHE_FILE), exist_ok=True)
+        with open(USB_CACHE_FILE, 'w') as file:
+            file.write(usb_name)
+    except OSError as err:
+        log.debug('Unable to cache USB name: %s', err)
+
+def openUSB(usb_name: str):
     try:
-        usb = serial.Serial(usb_name)
-    except:
+        return serial.Serial(usb_name)
+    except (serial.SerialException, OSError, ValueError):
         log.debug('Unable to get USD: %s', usb_name)
-        usb = None
-    if usb is None:
-        usb_name = '/dev/ttyACM1'
-        try:
-            usb = serial.Serial(usb_name)
-        except:
-            log.debug('Unable to get USD: %s', usb_name)
-            usb = None
+        return None
+
+def getUSB(usb_name: str = None, quiet: bool = False):
+    usb = None
+    if usb_name is not None:
+        # the requested port (e.g. a VirtualMaestro)
+        usb = openUSB(usb_name)
+    else:
+        # the Maestros found by VID/PID, starting with the last one that worked, then the default names
+        ports = list_ports.comports()
+        maestro_ports = findMaestroPorts(ports)
+        cached_name = readCachedUSBName()
+        if cached_name in maestro_ports:
+            maestro_ports.remove(cached_name)
+            maestro_ports.insert(0, cached_name)
+        elif cached_name is not None:
+            log.debug('Cached USB "%s" is not a Maestro anymore', cached_name)
+        for name in maestro_ports + [name for name in fallbackPorts(ports) if name not in maestro_ports]:
+            usb = openUSB(name)
+            if usb is not None:
+                if name != cached_name:
+                    writeCachedUSBName(name)
+                break
     if usb is not None:
         log.info('USB:\n- name: "%s"\n- baudrate: "%s"', usb.name, usb.baudrate)
-    else:
+    elif not quiet:
         log.critical('Unable to get USB Serial')
     # return usb (serial)
     return usb
 
+class UsbReconnector:
+    """Reopens the USB of a SerialWriter whenever it is lost, with exponential backoff
+
+    The new port is swapped into the writer, which then calls its reconnect callbacks so the
+    controllers can restore their state.
+    """
+
+    writer = None                   # SerialWriter
+    usb_name: str                   # None to search (cache, VID/PID, default names)
+    initial_delay: float = 0.5
+    max_delay: float = 30.0
+    thread: threading.Thread
+    stopped: threading.Event
+
+    # constructor
+    def __init__(self, writer, usb_name: str = None, initial_delay: float = 0.5, max_delay: float = 30.0):
+        self.writer = writer
+        self.usb_name = usb_name
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.threadedReconnecting, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.writer.disconnected.set()
+        self.thread.join()
+
+    def threadedReconnecting(self):
+        while not self.stopped.is_set():
+            # sleep until the writer loses its USB
+            self.writer.disconnected.wait()
+            delay = self.initial_delay
+            while not self.stopped.is_set() and self.writer.usb is None:
+                usb = getUSB(self.usb_name, quiet=True)
+                if usb is not None:
+                    log.info('USB reconnected: %s', usb.name)
+                    self.writer.setUSB(usb)
+                    break
+                log.debug('USB not found, retrying in %.1fs', delay)
+                self.stopped.wait(delay)
+                delay = min(delay * 2, self.max_delay)
+
 # END
@@ -0,0 +1,111 @@
+# vad.py
+
+import threading
+import numpy as np
+import speech_recognition as sr
+
+SAMPLE_TYPES = {1: np.int8, 2: np.int16, 4: np.int32}
+
+def rms(buffer: bytes, sample_width: int) -> float:
+    # RMS energy of a buffer of raw samples (audioop.rms, which is gone in Python 3.13)
+    samples = np.frombuffer(buffer, dtype=SAMPLE_TYPES[sample_width]).astype(np.float32)
+    return float(np.sqrt(np.mean(samples * samples))) if len(samples) > 0 else 0.0
+
+class VoiceActivityDetector:
+    """Frame-based voice activity detection on whole utterances
+
+    The audio is cut into `frame_duration` frames and the RMS energy and zero-crossing rate of
+    every frame are computed at once with NumPy. A frame is speech when its energy is
+    `energy_ratio` times the noise floor and its zero-crossing rate is below
+    `max_zero_crossing_rate` (hiss and fan noise cross zero on almost every sample). The noise
+    floor is the stream's ambient energy (`ambient_energy()`, see MicrophoneStream). Without
+    one it is the utterance's quietest frames, and the threshold is capped at `max_peak_ratio`
+    of the loudest frame, so an utterance without quiet frames is not measured against itself
+    and dropped. Utterances with less than `min_speech_duration` of speech are
+    dropped; the rest are trimmed to the speech plus `padding` on both sides.
+    """
+
+    frame_duration: float           # seconds per frame
+    energy_ratio: float             # speech energy over the noise floor
+    min_energy: float               # speech energy floor, quieter frames are never speech
+    max_peak_ratio: float           # cap of the threshold relative to the loudest frame, without ambient_energy
+    ambient_energy = None           # callable() -> ambient noise energy of the stream, None to use the utterance only
+    max_zero_crossing_rate: float   # crossings per sample, above this a frame is noise
+    min_speech_duration: float      # seconds of speech an utterance needs to be recognized
+    padding: float                  # seconds kept around the speech when trimming
+    lock: threading.Lock            # guards the counters
+    utterances: int = 0             # utterances checked
+    dropped: int = 0                # utterances without speech
+    seconds_in: float = 0.0         # audio checked
+    seconds_out: float = 0.0        # audio left after trimming
+
+    # constructor
+    def __init__(self, frame_duration: float = 0.02, energy_ratio: float = 3.0, min_energy: float = 100.0, max_zero_crossing_rate: float = 0.4,
+                 min_speech_duration: float = 0.1, padding: float = 0.15, max_peak_ratio: float = 0.5, ambient_energy = None):
+        self.frame_duration = frame_duration
+        self.energy_ratio = energy_ratio
+        self.min_energy = min_energy
+        self.max_peak_ratio = max_peak_ratio
+        self.ambient_energy = ambient_energy
+        self.max_zero_crossing_rate = max_zero_crossing_rate
+        self.min_speech_duration = min_speech_duration
+        self.padding = padding
+        self.lock = threading.Lock()
+
+    def frameFeatures(self, samples: np.ndarray, frame_length: int):
+        # (energy, zero crossing rate) of every whole frame
+        frames = samples[:len(samples) - len(samples) % frame_length].reshape(-1, frame_length).astype(np.float32)
+        energy = np.sqrt(np.mean(frames * frames, axis=1))
+        signs = np.signbit(frames)
+        zero_crossing_rate = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / (frame_length - 1)
+        return energy, zero_crossing_rate
+
+    def speechFrames(self, energy: np.ndarray, zero_crossing_rate: np.ndarray) -> np.ndarray:
+        if self.ambient_energy is not None:
+            threshold = self.ambient_energy() * self.energy_ratio
+        else:
+            # without quiet frames the percentile is speech itself, the cap keeps it below the peak
+            threshold = min(float(np.percentile(energy, 10)) * self.energy_ratio, float(np.max(energy)) * self.max_peak_ratio)
+        threshold = max(self.min_energy, threshold)
+        return (energy > threshold) & (zero_crossing_rate < self.max_zero_crossing_rate)
+
+    def detect(self, audio: sr.AudioData):
+        """`audio` trimmed to its speech, None if it contains no speech"""
+        samples = np.frombuffer(audio.frame_data, dtype=SAMPLE_TYPES[audio.sample_width])
+        frame_length = max(2, int(audio.sample_rate * self.frame_duration))
+        seconds = len(samples) / audio.sample_rate
+        with self.lock:
+            self.utterances += 1
+            self.seconds_in += seconds
+        if len(samples) < frame_length:
+            with self.lock:
+                self.dropped += 1
+            return None
+        speech = self.speechFrames(*self.frameFeatures(samples, frame_length))
+        if np.count_nonzero(speech) * self.frame_duration < self.min_speech_duration:
+            with self.lock:
+                self.dropped += 1
+            return None
+        # trim the leading and trailing silence
+        padding_frames = int(round(self.padding / self.frame_duration))
+        speech_indices = np.flatnonzero(speech)
+        first = max(0, speech_indices[0] - padding_frames) * frame_length
+        last = min(len(speech), speech_indices[-1] + 1 + padding_frames) * frame_length
+        if speech_indices[-1] + 1 + padding_frames >= len(speech):
+            # keep the samples past the last whole frame
+            last = len(samples)
+        trimmed = samples[first:last]
+        with self.lock:
+            self.seconds_out += len(trimmed) / audio.sample_rate
+        return sr.AudioData(trimmed.tobytes(), audio.sample_rate, audio.sample_width)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                'utterances': self.utterances,
+                'dropped': self.dropped,
+                'seconds_in': self.seconds_in,
+                'seconds_out': self.seconds_out,
+            }
+
+# END
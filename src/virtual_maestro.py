@@ -0,0 +1,280 @@
+# virtual_maestro.py
+
+import os
+import select
+import threading
+import tty
+from time import monotonic, sleep
+from .log import log
+from .maestro_protocol import MaestroCommand
+from .maestro_protocol import POLOLU_START_BYTE
+from .maestro_protocol import MAX_CHANNELS
+
+# number of data bytes that follow each command byte (SET_MULTIPLE_TARGETS is variable)
+COMMAND_DATA_LENGTH = {
+    MaestroCommand.EXIT_SAFE_START: 0,
+    MaestroCommand.SET_TARGET: 3,
+    MaestroCommand.SET_SPEED: 3,
+    MaestroCommand.SET_ACCELERATION: 3,
+    MaestroCommand.GET_POSITION: 1,
+    MaestroCommand.GET_MOVING_STATE: 0,
+    MaestroCommand.GET_ERRORS: 0,
+    MaestroCommand.GO_HOME: 0,
+    MaestroCommand.STOP_SCRIPT: 0,
+    MaestroCommand.RESTART_SCRIPT_AT_SUBROUTINE: 1,
+    MaestroCommand.GET_SCRIPT_STATUS: 0,
+}
+
+SERIAL_PROTOCOL_ERROR = 0x0010      # Maestro error bit for an unknown/malformed command
+
+class VirtualMaestro:
+    """Pseudo-terminal backed stand-in for a Pololu Maestro
+
+    Open `port_name` like a real `/dev/ttyACM*` (e.g. `TangBotController(usb_name=maestro.port_name)`).
+    Frames written to it are decoded (Pololu and compact protocol), the per-channel targets are
+    tracked and position/moving state/error queries are answered. Each frame is delayed by the
+    time it would take on a serial line at `baudrate` (10 bits per byte). Positions move towards
+    the targets using the channel's speed and acceleration limits, like the real device.
+    """
+
+    device_number: int
+    baudrate: int
+    port_name: str
+    targets: list               # channel -> target (0 until set)
+    target_times: list          # channel -> monotonic() time the target was applied
+    positions: list             # channel -> simulated position
+    velocities: list            # channel -> simulated velocity (0.25us / 10ms)
+    speeds: list                # channel -> speed limit (0.25us / 10ms, 0 = unlimited)
+    accelerations: list         # channel -> acceleration limit (0.25us / 10ms / 80ms, 0 = unlimited)
+    position_times: list        # channel -> monotonic() time the position was last simulated
+    errors: int
+    frames_received: int
+    bytes_received: int
+    lock: threading.Lock
+    thread: threading.Thread
+    running: bool
+
+    # constructor
+    def __init__(self, device_number: int = 0x0C, baudrate: int = 115200):
+        self.device_number = device_number
+        self.baudrate = baudrate
+        self.targets = [0] * MAX_CHANNELS
+        self.target_times = [0.0] * MAX_CHANNELS
+        self.positions = [0] * MAX_CHANNELS
+        self.velocities = [0.0] * MAX_CHANNELS
+        self.speeds = [0] * MAX_CHANNELS
+        self.accelerations = [0] * MAX_CHANNELS
+        self.position_times = [0.0] * MAX_CHANNELS
+        self.errors = 0
+        self.frames_received = 0
+        self.bytes_received = 0
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.master_fd, self.slave_fd = os.openpty()
+        tty.setraw(self.slave_fd)
+        self.port_name = os.ttyname(self.slave_fd)
+        self.running = False
+        self.thread = threading.Thread(target=self.threadedReading, daemon=True)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def start(self):
+        self.running = True
+        self.thread.start()
+        log.info('Virtual Maestro listening on "%s"', self.port_name)
+
+    def close(self):
+        self.running = False
+        if self.thread.is_alive():
+            self.thread.join()
+        os.close(self.master_fd)
+        os.close(self.slave_fd)
+
+    """Device state"""
+
+    def getTarget(self, channel: int) -> int:
+        with self.lock:
+            return self.targets[channel]
+
+    def getPosition(self, channel: int) -> int:
+        with self.lock:
+            self.simulate(channel, monotonic())
+            return self.positions[channel]
+
+    def isMoving(self) -> bool:
+        with self.lock:
+            return self.anyMoving(monotonic())
+
+    def anyMoving(self, now: float) -> bool:
+        for channel in range(MAX_CHANNELS):
+            self.simulate(channel, now)
+            if self.positions[channel] != self.targets[channel]:
+                return True
+        return False
+
+    def simulate(self, channel: int, now: float):
+        # move the channel towards its target in 10ms steps, limited by its speed and acceleration
+        position = self.positions[channel]
+        target = self.targets[channel]
+        steps = int((now - self.position_times[channel]) / 0.01)
+        if steps < 1:
+            return
+        self.position_times[channel] += steps * 0.01
+        speed = self.speeds[channel]
+        acceleration = self.accelerations[channel]
+        if position == 0 or (speed == 0 and acceleration == 0):
+            # no limits (or the servo was off): the position jumps to the target
+            self.positions[channel] = target
+            self.velocities[channel] = 0.0
+            return
+        velocity = self.velocities[channel]
+        for _ in range(min(steps, 100000)):
+            remaining = abs(target - position)
+            if remaining == 0:
+                velocity = 0.0
+                break
+            if acceleration > 0:
+                velocity += acceleration / 8
+                if speed > 0:
+                    velocity = min(velocity, speed)
+            else:
+                velocity = speed
+            step = min(remaining, max(1, int(velocity)))
+            position += step if target > position else -step
+        self.positions[channel] = position
+        self.velocities[channel] = velocity
+
+    def waitForTarget(self, channel: int, target: int, timeout: float = None) -> bool:
+        # block until `channel` has been set to `target`
+        with self.changed:
+            return self.changed.wait_for(lambda: self.targets[channel] == target, timeout)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                'frames_received': self.frames_received,
+                'bytes_received': self.bytes_received,
+                'errors': self.errors,
+            }
+
+    """Serial line"""
+
+    def threadedReading(self):
+        data = bytearray()
+        while self.running:
+            readable, _, _ = select.select([self.master_fd], [], [], 0.05)
+            if len(readable) < 1:
+                continue
+            try:
+                chunk = os.read(self.master_fd, 1024)
+            except OSError:
+                break
+            data.extend(chunk)
+            consumed = self.decode(data)
+            del data[:consumed]
+
+    def decode(self, data: bytearray) -> int:
+        # decode every complete frame in `data`, returns the number of bytes used
+        i = 0
+        while i < len(data):
+            start = i
+            byte = data[i]
+            if byte == POLOLU_START_BYTE:
+                # 0xAA, device number, command with the MSB cleared
+                if len(data) < i + 3:
+                    break
+                device_number = data[i + 1]
+                command = data[i + 2] | 0x80
+                i += 3
+            elif byte & 0x80:
+                device_number = self.device_number
+                command = byte
+                i += 1
+            else:
+                # data byte outside of a frame
+                self.setError(SERIAL_PROTOCOL_ERROR)
+                i += 1
+                continue
+            if command == MaestroCommand.SET_MULTIPLE_TARGETS:
+                if len(data) < i + 1:
+                    return start
+                length = 2 + 2 * data[i]
+            elif command in COMMAND_DATA_LENGTH:
+                length = COMMAND_DATA_LENGTH[command]
+            else:
+                log.debug('Virtual Maestro: unknown command 0x%02x', command)
+                self.setError(SERIAL_PROTOCOL_ERROR)
+                continue
+            if len(data) < i + length:
+                return start
+            payload = bytes(data[i:i + length])
+            i += length
+            # time the frame spends on a serial line at the configured baud rate
+            sleep((i - start) * 10 / self.baudrate)
+            if device_number == self.device_number:
+                self.execute(command, payload, i - start)
+        return i
+
+    def execute(self, command: int, payload: bytes, frame_length: int):
+        response = None
+        with self.changed:
+            self.frames_received += 1
+            self.bytes_received += frame_length
+            now = monotonic()
+            if command == MaestroCommand.SET_TARGET:
+                self.setTarget(payload[0], payload[1] | (payload[2] << 7), now)
+            elif command == MaestroCommand.SET_MULTIPLE_TARGETS:
+                count, first_channel = payload[0], payload[1]
+                for n in range(count):
+                    target = payload[2 + 2 * n] | (payload[3 + 2 * n] << 7)
+                    self.setTarget(first_channel + n, target, now)
+            elif command == MaestroCommand.SET_SPEED:
+                if payload[0] < MAX_CHANNELS:
+                    self.simulate(payload[0], now)
+                    self.speeds[payload[0]] = payload[1] | (payload[2] << 7)
+            elif command == MaestroCommand.SET_ACCELERATION:
+                if payload[0] < MAX_CHANNELS:
+                    self.simulate(payload[0], now)
+                    self.accelerations[payload[0]] = payload[1] | (payload[2] << 7)
+            elif command == MaestroCommand.GET_POSITION:
+                position = 0
+                if payload[0] < MAX_CHANNELS:
+                    self.simulate(payload[0], now)
+                    position = self.positions[payload[0]]
+                response = bytes([position & 0xFF, (position >> 8) & 0xFF])
+            elif command == MaestroCommand.GET_MOVING_STATE:
+                response = bytes([0x01 if self.anyMoving(now) else 0x00])
+            elif command == MaestroCommand.GET_ERRORS:
+                response = bytes([self.errors & 0xFF, (self.errors >> 8) & 0xFF])
+                self.errors = 0
+            elif command == MaestroCommand.GET_SCRIPT_STATUS:
+                # scripts are not simulated, report "stopped"
+                response = bytes([0x01])
+            elif command == MaestroCommand.GO_HOME:
+                for channel in range(MAX_CHANNELS):
+                    self.setTarget(channel, 0, now)
+            self.changed.notify_all()
+        if response is not None:
+            os.write(self.master_fd, response)
+
+    def setTarget(self, channel: int, target: int, now: float):
+        if channel >= MAX_CHANNELS:
+            self.errors |= SERIAL_PROTOCOL_ERROR
+            return
+        self.simulate(channel, now)
+        if self.position_times[channel] == 0.0 or self.positions[channel] == self.targets[channel]:
+            self.velocities[channel] = 0.0
+            self.position_times[channel] = now
+        self.targets[channel] = target
+        self.target_times[channel] = now
+
+    def setError(self, error: int):
+        with self.lock:
+            self.errors |= error
+
+# END
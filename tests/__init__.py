@@ -0,0 +1 @@
+# tests are run from the repository root: python -m pytest -q
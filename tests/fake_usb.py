@@ -0,0 +1,38 @@
+# fake_usb.py
+
+class FakeUSB:
+    """Stands in for serial.Serial: records the frames and answers every read with zeros"""
+
+    timeout: float = None
+
+    # constructor
+    def __init__(self):
+        self.frames = list()
+
+    def write(self, command: bytes):
+        self.frames.append(bytes(command))
+
+    def targets(self, channel: int) -> list:
+        """Every target written to `channel`, in order (Pololu protocol frames)"""
+        targets = list()
+        for frame in self.frames:
+            if len(frame) < 3 or frame[0] != 0xAA:
+                continue
+            command = frame[2] | 0x80
+            if command == 0x84 and frame[3] == channel:
+                targets.append(frame[4] | (frame[5] << 7))
+            elif command == 0x9F and frame[4] <= channel < frame[4] + frame[3]:
+                i = 5 + 2 * (channel - frame[4])
+                targets.append(frame[i] | (frame[i + 1] << 7))
+        return targets
+
+    def read(self, length: int) -> bytes:
+        return bytes(length)
+
+    def reset_input_buffer(self):
+        pass
+
+    def close(self):
+        pass
+
+# END
@@ -0,0 +1,53 @@
+# test_command_bus.py
+
+import threading
+import unittest
+from src.commands import CommandBus
+from src.commands import CommandRegistry
+
+class RecordingBot:
+    """Has every command the registry resolves, records the calls and their threads"""
+
+    def __init__(self):
+        self.calls = list()
+
+    def __getattr__(self, name):
+        return lambda **kwargs: self.calls.append((name, threading.current_thread().name))
+
+class CommandBusTest(unittest.TestCase):
+
+    def setUp(self):
+        self.bot = RecordingBot()
+        self.bus = CommandBus(CommandRegistry(self.bot))
+
+    def tearDown(self):
+        self.bus.close()
+
+    def test_call_runs_on_the_bus_in_order(self):
+        def call(value):
+            self.bot.calls.append(('call', threading.current_thread().name))
+            return value
+        self.bus.publish('moveHeadUp')
+        future = self.bus.publishCall(call, 42)
+        self.bus.publish('moveHeadDown')
+        self.assertEqual(future.result(timeout=2), 42)
+        self.assertTrue(self.bus.flush(timeout=2))
+        self.assertEqual(self.bot.calls, [('moveHeadUp', 'command-bus'), ('call', 'command-bus'), ('moveHeadDown', 'command-bus')])
+        self.assertEqual(self.bus.stats()['executed'], 3)
+
+    def test_call_exception_reaches_the_future(self):
+        def fail():
+            raise RuntimeError('script failed')
+        future = self.bus.publishCall(fail)
+        with self.assertRaisesRegex(RuntimeError, 'script failed'):
+            future.result(timeout=2)
+        self.assertEqual(self.bus.stats()['failed'], 1)
+
+    def test_unknown_command_raises_on_publish(self):
+        with self.assertRaises(ValueError):
+            self.bus.publish('fly')
+
+if __name__ == '__main__':
+    unittest.main()
+
+# END
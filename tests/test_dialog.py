@@ -0,0 +1,35 @@
+# test_dialog.py
+
+import unittest
+from src.dialog import Dialog
+
+class RecordingBus:
+    """Stands in for a CommandBus, records the published commands"""
+
+    # constructor
+    def __init__(self):
+        self.published = list()
+
+    def publish(self, name: str, **kwargs):
+        self.published.append((name, kwargs))
+
+class DialogBusTest(unittest.TestCase):
+
+    def test_responses_are_spoken_on_the_bus(self):
+        bus = RecordingBus()
+        dialog = Dialog('dialog.txt', bus=bus)
+        dialog.handleInput('hello')
+        self.assertEqual(len(bus.published), 1)
+        name, kwargs = bus.published[0]
+        self.assertEqual(name, 'speak')
+        self.assertIn(kwargs['text'], ['hi', 'hello', 'what up', 'sup'])
+
+    def test_invalid_input_publishes_nothing(self):
+        bus = RecordingBus()
+        Dialog('dialog.txt', bus=bus).handleInput('qwerty asdf')
+        self.assertEqual(bus.published, [])
+
+if __name__ == '__main__':
+    unittest.main()
+
+# END
@@ -0,0 +1,55 @@
+# test_fleet.py
+
+import unittest
+from unittest import mock
+from src import fleet
+from src.fleet import Fleet
+from src.fleet import FleetRobot
+from src.tango_bot import BotServos
+from src.tango_bot import TangBotController
+from .fake_usb import FakeUSB
+
+class FleetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.usbs = {'port-a': FakeUSB(), 'port-b': FakeUSB()}
+        robots = [FleetRobot('a1', 'port-a', 0x0C), FleetRobot('a2', 'port-a', 0x0D), FleetRobot('b1', 'port-b', 0x0C)]
+        with mock.patch.object(fleet, 'getUSB', side_effect=lambda usb_name: self.usbs[usb_name]):
+            self.fleet = Fleet(robots, write_timeout=0)
+
+    def tearDown(self):
+        self.fleet.close()
+
+    def test_exit_safe_start_once_per_port(self):
+        for writer in self.fleet.writers.values():
+            self.assertTrue(writer.flush(timeout=2))
+        for usb in self.usbs.values():
+            self.assertEqual(usb.frames.count(TangBotController.EXIT_SAFE_START), 1)
+            self.assertEqual(usb.frames[0], TangBotController.EXIT_SAFE_START)
+
+    def test_exit_safe_start_after_reconnect(self):
+        writer = self.fleet.writers['port-a']
+        self.assertTrue(writer.flush(timeout=2))
+        usb = FakeUSB()
+        writer.setUSB(usb)
+        self.assertTrue(writer.flush(timeout=2))
+        # once for the port, not once per robot on it
+        self.assertEqual(usb.frames[0], TangBotController.EXIT_SAFE_START)
+        self.assertEqual(usb.frames.count(TangBotController.EXIT_SAFE_START), 1)
+
+    def test_send_runs_registered_commands(self):
+        latencies = self.fleet.send('moveHeadUp', robots=['b1'])
+        self.assertEqual(list(latencies.keys()), ['b1'])
+        head_tilt = self.usbs['port-b'].targets(BotServos.HeadTilt.value)
+        self.assertEqual(head_tilt[-1], self.fleet['b1'].HEAD_TILT)
+        self.assertNotEqual(head_tilt[-1], TangBotController.TARGET_CENTER)
+        self.assertEqual(self.usbs['port-a'].targets(BotServos.HeadTilt.value)[-1], TangBotController.TARGET_CENTER)
+
+    def test_send_rejects_unknown_commands(self):
+        with self.assertRaises(ValueError):
+            self.fleet.send('restoreState')
+
+if __name__ == '__main__':
+    unittest.main()
+
+# END
@@ -0,0 +1,79 @@
+# test_maestro_protocol.py
+#
+# Byte-exact frames of the Maestro serial protocol (Pololu Maestro user's guide, "Serial Servo Commands").
+
+import unittest
+from src.maestro_protocol import MaestroEncoder
+from src.maestro_protocol import MaestroProtocol
+
+class CompactProtocolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.encoder = MaestroEncoder(MaestroProtocol.Compact)
+
+    def test_channel_commands(self):
+        # 6000 = 0x1770: low 7 bits 0x70, high 7 bits 0x2E
+        self.assertEqual(bytes(self.encoder.setTarget(3, 6000)), bytes.fromhex('84 03 70 2E'))
+        self.assertEqual(bytes(self.encoder.setSpeed(1, 200)), bytes.fromhex('87 01 48 01'))
+        self.assertEqual(bytes(self.encoder.setAcceleration(2, 5)), bytes.fromhex('89 02 05 00'))
+
+    def test_target_keeps_14_bits(self):
+        self.assertEqual(bytes(self.encoder.setTarget(0, 0x3FFF)), bytes.fromhex('84 00 7F 7F'))
+        self.assertEqual(bytes(self.encoder.setTarget(0, 0x4001)), bytes.fromhex('84 00 01 00'))
+
+    def test_set_multiple_targets(self):
+        # command, number of targets, first channel, then low/high bits per target
+        frame = self.encoder.setMultipleTargets(0, [4000, 6000, 8000])
+        self.assertEqual(bytes(frame), bytes.fromhex('9F 03 00 20 1F 70 2E 40 3E'))
+        frame = self.encoder.setMultipleTargets(3, [6000])
+        self.assertEqual(bytes(frame), bytes.fromhex('9F 01 03 70 2E'))
+
+    def test_queries_and_script_commands(self):
+        self.assertEqual(bytes(self.encoder.getPosition(5)), bytes.fromhex('90 05'))
+        self.assertEqual(bytes(self.encoder.getMovingState()), bytes.fromhex('93'))
+        self.assertEqual(bytes(self.encoder.getErrors()), bytes.fromhex('A1'))
+        self.assertEqual(bytes(self.encoder.goHome()), bytes.fromhex('A2'))
+        self.assertEqual(bytes(self.encoder.stopScript()), bytes.fromhex('A4'))
+        self.assertEqual(bytes(self.encoder.restartScriptAtSubroutine(2)), bytes.fromhex('A7 02'))
+        self.assertEqual(bytes(self.encoder.getScriptStatus()), bytes.fromhex('AE'))
+
+    def test_buffer_reuse(self):
+        # a short frame after a long one carries nothing of it
+        self.encoder.setMultipleTargets(0, [4000] * 6)
+        self.assertEqual(bytes(self.encoder.setTarget(1, 4000)), bytes.fromhex('84 01 20 1F'))
+        self.assertEqual(bytes(self.encoder.setMultipleTargets(2, [6000, 6000])), bytes.fromhex('9F 02 02 70 2E 70 2E'))
+
+class PololuProtocolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.encoder = MaestroEncoder(MaestroProtocol.Pololu, device_number=0x0C)
+
+    def test_channel_commands(self):
+        # 0xAA, device number, command byte with the MSB cleared, data
+        self.assertEqual(bytes(self.encoder.setTarget(3, 6000)), bytes.fromhex('AA 0C 04 03 70 2E'))
+        self.assertEqual(bytes(self.encoder.setSpeed(1, 200)), bytes.fromhex('AA 0C 07 01 48 01'))
+        self.assertEqual(bytes(self.encoder.setAcceleration(2, 5)), bytes.fromhex('AA 0C 09 02 05 00'))
+
+    def test_device_number_is_7_bits(self):
+        encoder = MaestroEncoder(MaestroProtocol.Pololu, device_number=0x8C)
+        self.assertEqual(bytes(encoder.goHome()), bytes.fromhex('AA 0C 22'))
+
+    def test_set_multiple_targets(self):
+        frame = self.encoder.setMultipleTargets(0, [4000, 6000, 8000])
+        self.assertEqual(bytes(frame), bytes.fromhex('AA 0C 1F 03 00 20 1F 70 2E 40 3E'))
+        frame = self.encoder.setMultipleTargets(3, [6000])
+        self.assertEqual(bytes(frame), bytes.fromhex('AA 0C 1F 01 03 70 2E'))
+
+    def test_queries_and_script_commands(self):
+        self.assertEqual(bytes(self.encoder.getPosition(5)), bytes.fromhex('AA 0C 10 05'))
+        self.assertEqual(bytes(self.encoder.getMovingState()), bytes.fromhex('AA 0C 13'))
+        self.assertEqual(bytes(self.encoder.getErrors()), bytes.fromhex('AA 0C 21'))
+        self.assertEqual(bytes(self.encoder.goHome()), bytes.fromhex('AA 0C 22'))
+        self.assertEqual(bytes(self.encoder.stopScript()), bytes.fromhex('AA 0C 24'))
+        self.assertEqual(bytes(self.encoder.restartScriptAtSubroutine(2)), bytes.fromhex('AA 0C 27 02'))
+        self.assertEqual(bytes(self.encoder.getScriptStatus()), bytes.fromhex('AA 0C 2E'))
+
+if __name__ == '__main__':
+    unittest.main()
+
+# END
@@ -0,0 +1,141 @@
+# test_recognizers.py
+
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import unittest
+from time import perf_counter
+from src.command_matcher import CommandMatcher
+from src.command_parser import CommandParser
+from src.commands import PHRASE_BOT_DICT
+from src.recognizers import FakeBackend
+from src.recognizers import GoogleBackend
+from src.recognizers import HedgedBackend
+from src.recognizers import RecognizerBackend
+from src.recognizers import SphinxBackend
+from src.recognizers import chooseAlternative
+from src.recognizers import googleAlternatives
+from src.recognizers import VoskBackend
+
+PHRASES = list(PHRASE_BOT_DICT.keys())
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# one second of silence through SphinxBackend, prints [grammar directory, whether the .fsg was written]
+SPHINX_UTTERANCE = '''
+import json, os
+import speech_recognition as sr
+from src.commands import PHRASE_BOT_DICT
+from src.recognizers import SphinxBackend
+backend = SphinxBackend(list(PHRASE_BOT_DICT.keys()))
+backend.recognize(sr.AudioData(bytes(32000), 16000, 2))
+fsg_written = os.path.exists(os.path.join(backend.grammar_dir, SphinxBackend.GRAMMAR_NAME + '.fsg'))
+grammar_dir = backend.grammar_dir
+backend.close()
+print(json.dumps([grammar_dir, fsg_written]))
+'''
+
+def newParser() -> CommandParser:
+    return CommandParser(CommandMatcher(PHRASE_BOT_DICT), speed_commands={'increaseWheelSpeed', 'decreaseWheelSpeed'})
+
+class GrammarTest(unittest.TestCase):
+
+    def test_compound_utterance_through_grammar_backend(self):
+        backend = FakeBackend(['head up twice and then turn left', 'forward at speed two then stop', 'head up please'], phrases=PHRASES)
+        parser = newParser()
+        self.assertEqual(parser.parse(backend.recognize(None)), [('moveHeadUp', {}, 2), ('turnLeft', {}, 1)])
+        self.assertEqual(parser.parse(backend.recognize(None)), [('increaseWheelSpeed', {'speed_level': 2}, 1), ('stop', {}, 1)])
+        # outside the grammar
+        self.assertIsNone(backend.recognize(None))
+
+    def test_vosk_grammar(self):
+        grammar = json.loads(VoskBackend(PHRASES).grammar)
+        for phrase in PHRASES + ['and', 'then', 'after that', 'twice', 'three times', 'at speed two', '[unk]']:
+            self.assertIn(phrase, grammar)
+
+    def test_sphinx_grammar(self):
+        with SphinxBackend(PHRASES) as backend:
+            grammar_dir = backend.grammar_dir
+            self.assertEqual(os.path.basename(backend.grammar_path), f'{SphinxBackend.GRAMMAR_NAME}.jsgf')
+            with open(backend.grammar_path, 'r') as file:
+                grammar = file.read()
+        self.assertFalse(os.path.exists(grammar_dir))
+        self.assertIn('grammar commands;', grammar)
+        self.assertIn('public <commands> = <step> (<separator> <step>)*;', grammar)
+        self.assertIn('<step> = <phrase> [<speed>] [<count>];', grammar)
+        self.assertIn('twice', grammar)
+
+    @unittest.skipUnless(importlib.util.find_spec('pocketsphinx') is not None, 'pocketsphinx is not installed')
+    def test_sphinx_loads_its_grammar(self):
+        # a grammar speech_recognition cannot resolve crashes the interpreter, so run it in a new one
+        result = subprocess.run([sys.executable, '-c', SPHINX_UTTERANCE], cwd=ROOT, capture_output=True, text=True, timeout=120)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        grammar_dir, fsg_written = json.loads(result.stdout.strip().splitlines()[-1])
+        # speech_recognition compiled the grammar, close() removed it with the .fsg
+        self.assertTrue(fsg_written)
+        self.assertFalse(os.path.exists(grammar_dir))
+
+class AlternativeTest(unittest.TestCase):
+
+    def score(self, text: str):
+        result = newParser().parseScored(text)
+        return result[1] if result is not None else None
+
+    def test_google_alternatives(self):
+        response = {'alternative': [{'transcript': 'had a pup', 'confidence': 0.61}, {'transcript': 'head up'}, {'confidence': 0.1}], 'final': True}
+        self.assertEqual(googleAlternatives(response), ['had a pup', 'head up'])
+        # nothing understood
+        self.assertEqual(googleAlternatives([]), [])
+
+    def test_best_score_wins(self):
+        self.assertEqual(chooseAlternative(['had a pup', 'head up', 'had up'], self.score), 1)
+        scores = {'a': 0.5, 'b': 0.9, 'c': 0.7}
+        self.assertEqual(chooseAlternative(['a', 'b', 'c'], scores.get), 1)
+
+    def test_rank_breaks_ties(self):
+        scores = {'a': None, 'b': 0.8, 'c': 0.8}
+        self.assertEqual(chooseAlternative(['a', 'b', 'c'], scores.get), 1)
+        self.assertEqual(chooseAlternative(['head up', 'head up'], self.score), 0)
+
+    def test_top_kept_without_a_command(self):
+        self.assertEqual(chooseAlternative(['hello there', 'good morning'], self.score), 0)
+        self.assertEqual(chooseAlternative([], self.score), 0)
+
+    def test_google_backend_rescues_a_lower_alternative(self):
+        class Recognizer:
+            def recognize_google(self, audio, show_all: bool = False):
+                return {'alternative': [{'transcript': 'had a pup'}, {'transcript': 'head up'}]}
+
+        backend = GoogleBackend(PHRASES, Recognizer(), score=self.score)
+        self.assertEqual(backend.recognize(None), 'head up')
+        self.assertEqual((backend.utterances, backend.rescued), (1, 1))
+
+class BackendTest(unittest.TestCase):
+
+    def test_recognize_is_abstract(self):
+        with self.assertRaises(TypeError):
+            RecognizerBackend(PHRASES)
+
+    def test_google_request_timeout(self):
+        backend = GoogleBackend(PHRASES)
+        self.assertIsNotNone(backend.timeout)
+        self.assertEqual(backend.recognizer.operation_timeout, backend.timeout)
+
+    def test_hedge_gives_up_on_a_stalled_backend(self):
+        stalled = FakeBackend(['head up'], delay=2.0, name='stalled')
+        with HedgedBackend([stalled, FakeBackend(['had up'], name='quick')], accept=lambda text: text == 'head up', timeout=0.2) as backend:
+            start = perf_counter()
+            # nothing accepted in time, the first transcription is reported
+            self.assertEqual(backend.recognize(None), 'had up')
+            self.assertLess(perf_counter() - start, 1.0)
+            self.assertEqual(backend.stats()['hedged']['unanswered'], 1)
+
+    def test_hedge_timeout_is_finite_by_default(self):
+        with HedgedBackend([FakeBackend([])]) as backend:
+            self.assertIsNotNone(backend.timeout)
+
+if __name__ == '__main__':
+    unittest.main()
+
+# END
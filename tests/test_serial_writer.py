@@ -0,0 +1,63 @@
+# test_serial_writer.py
+
+import asyncio
+import unittest
+from src.serial_writer import SerialWriter
+from src.async_tango_bot import AsyncTangBotController
+from src.tango_bot import TangBotController
+from .fake_usb import FakeUSB
+
+def encodePosition(channel: int) -> bytes:
+    return bytes([0x90, channel])
+
+class CancelledFutureTest(unittest.TestCase):
+
+    def setUp(self):
+        self.usb = FakeUSB()
+        self.writer = SerialWriter(self.usb, write_timeout=0.02)
+
+    def tearDown(self):
+        self.writer.close(timeout=2)
+
+    def backlog(self, count: int = 5):
+        # keep the writer thread busy for a while
+        for i in range(count):
+            self.writer.write(bytes([0x84, 0x00, i, 0x00]))
+
+    def test_cancelled_query_is_skipped(self):
+        self.backlog()
+        future = self.writer.submitQuery(encodePosition, (3,), 2)
+        self.assertTrue(future.cancel())
+        self.assertTrue(self.writer.flush(timeout=2))
+        self.assertTrue(self.writer.thread.is_alive())
+        self.assertNotIn(encodePosition(3), self.usb.frames)
+
+    def test_cancelled_flush(self):
+        self.backlog()
+        self.assertTrue(self.writer.submitFlush().cancel())
+        self.assertTrue(self.writer.flush(timeout=2))
+        self.assertTrue(self.writer.thread.is_alive())
+
+    def test_async_query_timeout_keeps_writer_alive(self):
+        bot = TangBotController(writer=self.writer)
+
+        async def run():
+            controller = AsyncTangBotController(bot)
+            self.backlog()
+            # times out while the query is still queued, wait_for() cancels its future
+            self.assertIsNone(await controller.query(encodePosition, (3,), 2, timeout=0.01))
+            task = asyncio.create_task(controller.moveHeadUp(wait=True))
+            await asyncio.sleep(0.01)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            await asyncio.wait_for(controller.wait(), timeout=2)
+
+        asyncio.run(run())
+        self.assertTrue(self.writer.thread.is_alive())
+        self.assertTrue(self.writer.flush(timeout=2))
+
+if __name__ == '__main__':
+    unittest.main()
+
+# END
@@ -0,0 +1,87 @@
+# test_speech_pipeline.py
+
+import threading
+import unittest
+from time import sleep
+from src.microphone_stream import MicrophoneStream
+from src.speech_pipeline import SpeechPipeline
+
+class BrokenMicrophone:
+    """Stands in for sr.Microphone when there is no input device"""
+
+    def __enter__(self):
+        raise OSError('No Default Input Device Available')
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+class ScriptedStream:
+    """Hands out `utterances`, then stops like a MicrophoneStream whose capture thread died"""
+
+    running: bool = False
+    error: Exception = None
+
+    # constructor
+    def __init__(self, utterances: list):
+        self.utterances = list(utterances)
+        self.listens = 0
+
+    def start(self):
+        self.running = True
+
+    def listen(self, timeout: float = None):
+        self.listens += 1
+        if len(self.utterances) > 0:
+            return self.utterances.pop(0)
+        self.running = False
+        self.error = OSError('Input overflowed')
+        return None
+
+    def close(self):
+        self.running = False
+
+class MicrophoneFailureTest(unittest.TestCase):
+
+    def test_stream_reports_the_error(self):
+        stream = MicrophoneStream(recognizer=object(), microphone=BrokenMicrophone())
+        stream.start()
+        stream.thread.join(timeout=2)
+        self.assertFalse(stream.running)
+        self.assertIsInstance(stream.error, OSError)
+        self.assertIsNone(stream.listen(timeout=5))
+        stream.close()
+
+    def test_pipeline_stops_when_the_stream_fails(self):
+        stream = ScriptedStream(['head up'])
+        dispatched = list()
+        done = threading.Event()
+
+        def dispatch(text: str):
+            dispatched.append(text)
+            done.set()
+
+        pipeline = SpeechPipeline(stream, lambda audio: audio, dispatch)
+        pipeline.start()
+        self.assertTrue(pipeline.wait(timeout=2))
+        self.assertIs(pipeline.error, stream.error)
+        # no busy loop on a stream that returns right away
+        self.assertEqual(stream.listens, 2)
+        pipeline.close()
+        self.assertTrue(done.is_set())
+        self.assertEqual(dispatched, ['head up'])
+
+    def test_close_is_not_an_error(self):
+        stream = ScriptedStream([])
+        # nobody speaks
+        stream.listen = lambda timeout=None: sleep(timeout)
+        pipeline = SpeechPipeline(stream, lambda audio: audio, lambda text: None)
+        pipeline.start()
+        self.assertFalse(pipeline.wait(timeout=0.3))
+        pipeline.close()
+        self.assertTrue(pipeline.wait(timeout=2))
+        self.assertIsNone(pipeline.error)
+
+if __name__ == '__main__':
+    unittest.main()
+
+# END
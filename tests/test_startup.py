@@ -0,0 +1,53 @@
+# test_startup.py
+#
+# The startup budget of benchmarks/bench_startup.py, minus the timings: every main.py subcommand
+# is imported in a fresh interpreter and must not load the heavy modules of the others.
+
+import json
+import re
+import subprocess
+import sys
+import unittest
+from benchmarks.bench_startup import FORBIDDEN_MODULES
+from benchmarks.bench_startup import ROOT
+from benchmarks.bench_startup import SUBCOMMAND_IMPORTS
+
+LOADED_MODULES = '''
+import json, sys
+{statement}
+print(json.dumps(sorted(name for name in sys.modules if name.split('.')[0] in {modules!r})))
+'''
+
+# third-party packages a subcommand may be unable to import here, the test is skipped without them
+OPTIONAL_PACKAGES = {'PIL', 'serial', 'speech_recognition', 'tkinter', '_tkinter'}
+
+MISSING_MODULE = re.compile(r"^ModuleNotFoundError: No module named '([^']+)'$")
+
+def loadedModules(statement: str, modules: list) -> list:
+    """Which of `modules` (top-level names) `statement` loads, run in a new interpreter"""
+    code = LOADED_MODULES.format(statement=statement, modules=set(modules))
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, timeout=60)
+    if result.returncode != 0:
+        lines = result.stderr.strip().splitlines()
+        missing = MISSING_MODULE.match(lines[-1]) if len(lines) > 0 else None
+        if missing is not None and missing.group(1).split('.')[0] in OPTIONAL_PACKAGES:
+            raise unittest.SkipTest(f'"{statement}" needs {missing.group(1)}')
+        # anything else (an error in the repo's own code) fails the test
+        raise AssertionError(f'"{statement}" failed with exit code {result.returncode}:\n{result.stderr}')
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+class StartupImportTest(unittest.TestCase):
+
+    def test_main_loads_nothing_heavy(self):
+        heavy = sorted(set(sum(FORBIDDEN_MODULES.values(), list())))
+        self.assertEqual(loadedModules('import main; import src', heavy), [])
+
+    def test_subcommands_load_only_their_modules(self):
+        for name, statement in SUBCOMMAND_IMPORTS.items():
+            with self.subTest(subcommand=name):
+                self.assertEqual(loadedModules(statement, FORBIDDEN_MODULES[name]), [])
+
+if __name__ == '__main__':
+    unittest.main()
+
+# END
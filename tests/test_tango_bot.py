@@ -0,0 +1,116 @@
+# test_tango_bot.py
+
+import unittest
+from time import sleep
+from unittest import mock
+from src import tango_bot
+from src.serial_writer import SerialWriter
+from src.tango_bot import TangBotController
+from src.tango_bot import BotServos
+from .fake_usb import FakeUSB
+
+class TimedMoveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.usb = FakeUSB()
+        # the speed and acceleration frames of the constructor are still queued when the turn starts
+        self.writer = SerialWriter(self.usb, write_timeout=0.06)
+        self.bot = TangBotController(writer=self.writer)
+
+    def tearDown(self):
+        self.writer.close(timeout=2)
+
+    def test_turn_reaches_the_device(self):
+        self.bot.turnLeft()
+        self.assertTrue(self.bot.wait(timeout=2))
+        turning = self.usb.targets(BotServos.WheelTurning.value)
+        self.assertEqual(turning[-2:], [7500, self.bot.TARGET_CENTER])
+
+    def test_hold_is_a_barrier(self):
+        self.bot.increaseWheelSpeed(speed_level=3)
+        self.bot.hold(0)
+        self.bot.stop()
+        self.assertTrue(self.bot.wait(timeout=2))
+        wheels = self.usb.targets(BotServos.WheelTogether.value)
+        self.assertEqual(wheels[-2:], [self.bot.SPEED_FLOOR, self.bot.TARGET_CENTER])
+
+class InFlightTargetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.usb = FakeUSB()
+        self.writer = SerialWriter(self.usb, write_timeout=0.2)
+        self.bot = TangBotController(writer=self.writer)
+        self.assertTrue(self.bot.wait(timeout=5))
+
+    def tearDown(self):
+        self.writer.close(timeout=5)
+
+    def test_target_back_while_the_last_one_is_written(self):
+        self.bot.moveHeadUp()
+        sleep(0.05)
+        # the head up frame is on the wire, the writer sleeps write_timeout after it
+        self.bot.moveHeadDown()
+        self.assertTrue(self.bot.wait(timeout=5))
+        head_tilt = self.usb.targets(BotServos.HeadTilt.value)
+        self.assertEqual(self.bot.HEAD_TILT, self.bot.TARGET_CENTER)
+        self.assertEqual(head_tilt[-1], self.bot.HEAD_TILT)
+        self.assertEqual(self.writer.shadowTarget(BotServos.HeadTilt, self.bot.encodeTargets), self.bot.HEAD_TILT)
+
+    def test_failed_write_is_not_shadowed(self):
+        def unplugged(command: bytes):
+            raise OSError('unplugged')
+
+        self.usb.write = unplugged
+        self.bot.moveHeadUp()
+        self.assertTrue(self.bot.wait(timeout=5))
+        self.assertIsNone(self.writer.shadowTarget(BotServos.HeadTilt, self.bot.encodeTargets))
+
+class MicroMaestroTest(unittest.TestCase):
+
+    def assertSingleTargets(self, usb: FakeUSB, bot: TangBotController):
+        # Set Target (0x84 without the MSB) frames only, no Set Multiple Targets (0x9F)
+        commands = {frame[2] for frame in usb.frames if len(frame) > 2 and frame[0] == 0xAA}
+        self.assertNotIn(0x1F, commands)
+        self.assertIn(0x04, commands)
+        self.assertEqual(usb.targets(BotServos.HeadPan.value)[-1], bot.HEAD_TURN)
+        self.assertEqual(usb.targets(BotServos.HeadTilt.value)[-1], bot.HEAD_TILT)
+
+    def test_single_target_frames(self):
+        usb = FakeUSB()
+        writer = SerialWriter(usb, write_timeout=0)
+        bot = TangBotController(writer=writer, multiple_targets=False)
+        bot.centerAll()
+        bot.stop()
+        self.assertTrue(bot.wait(timeout=2))
+        self.assertSingleTargets(usb, bot)
+        writer.close(timeout=2)
+
+    def test_detected_by_pid(self):
+        usb = FakeUSB()
+        writer = SerialWriter(usb, write_timeout=0)
+        with mock.patch.object(tango_bot, 'supportsMultipleTargets', return_value=False):
+            bot = TangBotController(writer=writer)
+        self.assertFalse(bot.multiple_targets)
+        self.assertTrue(bot.wait(timeout=2))
+        self.assertSingleTargets(usb, bot)
+        writer.close(timeout=2)
+
+class ReconnectTest(unittest.TestCase):
+
+    def test_exit_safe_start_after_reconnect(self):
+        # started without a cable, plugged in later
+        with mock.patch.object(tango_bot, 'getUSB', return_value=None), mock.patch.object(TangBotController, 'usb_write_timeout', 0):
+            bot = TangBotController()
+        usb = FakeUSB()
+        bot.writer.setUSB(usb)
+        self.assertTrue(bot.wait(timeout=2))
+        self.assertEqual(usb.frames[0], TangBotController.EXIT_SAFE_START)
+        self.assertEqual(usb.frames.count(TangBotController.EXIT_SAFE_START), 1)
+        # the state is restored after it
+        self.assertEqual(usb.targets(BotServos.HeadTilt.value)[-1], bot.HEAD_TILT)
+        bot.writer.close(timeout=2)
+
+if __name__ == '__main__':
+    unittest.main()
+
+# END
@@ -0,0 +1,101 @@
+# test_text_to_speech.py
+
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+import src.text_to_speech as text_to_speech
+from src.text_to_speech import TextToSpeech
+from src.text_to_speech import findVoice
+
+class Voice:
+    # what pyttsx3 lists for a voice
+    def __init__(self, id: str, name: str):
+        self.id = id
+        self.name = name
+
+class Engine:
+    listed: int = 0
+
+    def __init__(self, voices: list):
+        self.voices = voices
+
+    def getProperty(self, name: str):
+        self.listed += 1
+        return self.voices
+
+VOICES = [Voice(f'voice-{i}', f'Voice {i}') for i in range(9)] + [Voice('en-gb', 'English (Great Britain)'), Voice('en-us', 'English (America)')]
+
+class VoiceSelectionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        patcher = mock.patch.object(text_to_speech, 'TTS_CACHE_FILE', os.path.join(self.directory.name, 'tts_voice'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.directory.cleanup)
+
+    def test_find_voice(self):
+        self.assertEqual(findVoice(VOICES, '10'), 'en-us')
+        self.assertEqual(findVoice(VOICES, 'great britain'), 'en-gb')
+        self.assertEqual(findVoice(VOICES, 'en-us'), 'en-us')
+        self.assertIsNone(findVoice(VOICES, '42'))
+        self.assertIsNone(findVoice(VOICES, 'klingon'))
+
+    def test_cached_voice(self):
+        engine = Engine(VOICES)
+        self.assertEqual(TextToSpeech(voice_name='10', player='').selectVoice(engine), 'en-us')
+        self.assertEqual(engine.listed, 1)
+        # the next start with the same voice does not list the voices
+        self.assertEqual(TextToSpeech(voice_name='10', player='').selectVoice(engine), 'en-us')
+        self.assertEqual(engine.listed, 1)
+        # a different voice does
+        self.assertEqual(TextToSpeech(voice_name='britain', player='').selectVoice(engine), 'en-gb')
+        self.assertEqual(engine.listed, 2)
+
+    def test_default_voice(self):
+        self.assertIsNone(TextToSpeech(player='').selectVoice(Engine(VOICES)))
+
+class BlockingTextToSpeech(TextToSpeech):
+    """Worker without an engine: speakNow records the text, the worker is held back until `release`"""
+
+    def __init__(self):
+        super().__init__(player='')
+        self.release = threading.Event()
+        self.spoken = list()
+
+    def getEngine(self):
+        self.release.wait(2)
+
+    def speakNow(self, text: str, generation: int):
+        self.spoken.append(text)
+
+class InterruptTest(unittest.TestCase):
+
+    def test_interrupt_before_dequeue(self):
+        tts = BlockingTextToSpeech()
+        stale = tts.speak('stale')
+        # the worker took the utterance off the queue but has not started it when the interrupt comes
+        item = tts.queue.get_nowait()
+        tts.interrupt()
+        tts.queue.put(item)
+        fresh = tts.speak('fresh')
+        tts.release.set()
+        self.assertFalse(stale.result(2))
+        self.assertTrue(fresh.result(2))
+        self.assertEqual(tts.spoken, ['fresh'])
+
+    def test_interrupt_drops_queue(self):
+        tts = BlockingTextToSpeech()
+        futures = [tts.speak(text) for text in ('one', 'two')]
+        latest = tts.speak('three', interrupt=True)
+        tts.release.set()
+        self.assertEqual([future.result(2) for future in futures], [False, False])
+        self.assertTrue(latest.result(2))
+        self.assertEqual(tts.spoken, ['three'])
+
+if __name__ == '__main__':
+    unittest.main()
+
+# END
@@ -0,0 +1,39 @@
+# test_trajectory.py
+
+import unittest
+from src.serial_writer import SerialWriter
+from src.tango_bot import TangBotController
+from src.tango_bot import BotServos
+from src.trajectory import TrajectoryPlayer
+from src.trajectory import headNod
+from .fake_usb import FakeUSB
+
+class TrajectoryPlayerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.usb = FakeUSB()
+        self.writer = SerialWriter(self.usb, write_timeout=0.02)
+        self.bot = TangBotController(writer=self.writer)
+
+    def tearDown(self):
+        self.writer.close(timeout=2)
+
+    def test_rate_capped_by_writer(self):
+        player = TrajectoryPlayer(self.bot, rate=200.0)
+        self.assertAlmostEqual(player.effectiveRate([BotServos.HeadTilt]), 50.0)
+        # waist (2) and head tilt (4) are not contiguous: two frames per tick
+        self.assertAlmostEqual(player.effectiveRate([BotServos.Waist, BotServos.HeadTilt]), 25.0)
+
+    def test_ticks_reach_the_wire(self):
+        report = TrajectoryPlayer(self.bot, rate=200.0).play(headNod(times=1, period=0.4))
+        self.assertEqual(report.rate, 50.0)
+        # (almost) every tick is written instead of being coalesced away
+        self.assertGreaterEqual(report.frames_written, 0.8 * report.ticks)
+        self.assertLessEqual(report.frames_dropped, 0.2 * report.ticks)
+        self.assertEqual(len(report.write_intervals), report.frames_written - 1)
+        self.assertLess(report.jitter, 0.02)
+
+if __name__ == '__main__':
+    unittest.main()
+
+# END
@@ -0,0 +1,58 @@
+# test_usb.py
+
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+from src import usb
+
+def port(device: str, vid: int = None, pid: int = None, location: str = None):
+    # stands in for a list_ports ListPortInfo
+    return SimpleNamespace(device=device, vid=vid, pid=pid, location=location)
+
+class GetUSBTest(unittest.TestCase):
+
+    def getUSB(self, ports: list, cached_name: str = None) -> list:
+        """The port names getUSB() tries to open, in order"""
+        opened = list()
+
+        def openUSB(name: str):
+            opened.append(name)
+            return None
+
+        with mock.patch.object(usb.list_ports, 'comports', return_value=ports), \
+                mock.patch.object(usb, 'readCachedUSBName', return_value=cached_name), \
+                mock.patch.object(usb, 'writeCachedUSBName'), \
+                mock.patch.object(usb, 'openUSB', side_effect=openUSB):
+            self.assertIsNone(usb.getUSB(quiet=True))
+        return opened
+
+    def test_cached_maestro_first(self):
+        ports = [port('/dev/ttyACM0', usb.POLOLU_VID, 0x0089, '1-1:1.0'), port('/dev/ttyACM2', usb.POLOLU_VID, 0x008A, '1-2:1.0')]
+        self.assertEqual(self.getUSB(ports, '/dev/ttyACM2'), ['/dev/ttyACM2', '/dev/ttyACM0', '/dev/ttyACM1'])
+
+    def test_stale_cache_is_not_opened(self):
+        # the Maestro re-enumerated as ACM1, ACM0 is now another board
+        ports = [port('/dev/ttyACM0', 0x2341, 0x0043), port('/dev/ttyACM1', usb.POLOLU_VID, 0x0089, '1-1:1.0')]
+        self.assertEqual(self.getUSB(ports, '/dev/ttyACM0'), ['/dev/ttyACM1'])
+
+    def test_fallback_skips_other_devices(self):
+        ports = [port('/dev/ttyACM0', 0x2341, 0x0043)]
+        self.assertEqual(self.getUSB(ports), ['/dev/ttyACM1'])
+
+    def test_fallback_without_vid_pid(self):
+        self.assertEqual(self.getUSB([port('/dev/ttyACM0')]), ['/dev/ttyACM0', '/dev/ttyACM1'])
+
+class MultipleTargetsTest(unittest.TestCase):
+
+    def test_by_pid(self):
+        ports = [port('/dev/ttyACM0', usb.POLOLU_VID, usb.MICRO_MAESTRO_PID, '1-1:1.0'), port('/dev/ttyACM2', usb.POLOLU_VID, 0x008A, '1-2:1.0')]
+        with mock.patch.object(usb.list_ports, 'comports', return_value=ports):
+            self.assertFalse(usb.supportsMultipleTargets('/dev/ttyACM0'))
+            self.assertTrue(usb.supportsMultipleTargets('/dev/ttyACM2'))
+            # e.g. a VirtualMaestro
+            self.assertTrue(usb.supportsMultipleTargets('/dev/pts/4'))
+
+if __name__ == '__main__':
+    unittest.main()
+
+# END
@@ -0,0 +1,63 @@
+# test_vad.py
+
+import unittest
+import numpy as np
+import speech_recognition as sr
+from src.vad import VoiceActivityDetector
+
+RATE = 16000
+
+def audio(*parts) -> sr.AudioData:
+    # 16 bit mono AudioData of the concatenated sample arrays
+    samples = np.concatenate(parts).clip(-32768, 32767).astype(np.int16)
+    return sr.AudioData(samples.tobytes(), RATE, 2)
+
+def silence(seconds: float, level: float = 20.0) -> np.ndarray:
+    return np.random.default_rng(1).normal(0, level, int(RATE * seconds))
+
+def voiced(seconds: float, amplitude: float = 3000.0) -> np.ndarray:
+    # a 150 Hz tone with a harmonic, few zero crossings like a vowel
+    t = np.arange(int(RATE * seconds)) / RATE
+    return amplitude * (np.sin(2 * np.pi * 150 * t) + 0.5 * np.sin(2 * np.pi * 300 * t))
+
+@unittest.skipUnless(hasattr(sr, 'AudioData'), 'needs SpeechRecognition')
+class VoiceActivityDetectorTest(unittest.TestCase):
+
+    def test_silence_is_dropped(self):
+        vad = VoiceActivityDetector()
+        self.assertIsNone(vad.detect(audio(silence(1.0))))
+        self.assertEqual(vad.stats()['dropped'], 1)
+
+    def test_click_is_dropped(self):
+        click = np.zeros(int(RATE * 0.01))
+        click[:40] = 20000
+        self.assertIsNone(VoiceActivityDetector().detect(audio(silence(0.5), click, silence(0.5))))
+
+    def test_noise_is_dropped(self):
+        # loud hiss crosses zero on about every other sample
+        noise = np.random.default_rng(2).normal(0, 4000, RATE)
+        self.assertIsNone(VoiceActivityDetector().detect(audio(silence(0.3), noise, silence(0.3))))
+
+    def test_speech_is_trimmed(self):
+        vad = VoiceActivityDetector(padding=0.1)
+        trimmed = vad.detect(audio(silence(0.6), voiced(0.5), silence(0.6)))
+        self.assertIsNotNone(trimmed)
+        seconds = len(trimmed.frame_data) / 2 / RATE
+        self.assertAlmostEqual(seconds, 0.5 + 2 * 0.1, delta=0.05)
+
+    def test_speech_without_quiet_frames(self):
+        # a steady voiced second, nothing quiet to take the noise floor from
+        vad = VoiceActivityDetector()
+        self.assertIsNotNone(vad.detect(audio(voiced(1.0))))
+        with_ambient = VoiceActivityDetector(ambient_energy=lambda: 20.0)
+        self.assertIsNotNone(with_ambient.detect(audio(voiced(1.0))))
+
+    def test_ambient_noise_floor(self):
+        # the stream heard a loud room: a tone barely above it is not speech
+        vad = VoiceActivityDetector(ambient_energy=lambda: 2000.0)
+        self.assertIsNone(vad.detect(audio(silence(0.3), voiced(0.5, amplitude=1500.0), silence(0.3))))
+
+if __name__ == '__main__':
+    unittest.main()
+
+# END
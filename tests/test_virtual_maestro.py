@@ -0,0 +1,122 @@
+# test_virtual_maestro.py
+
+import os
+import select
+import unittest
+from src.maestro_protocol import MaestroEncoder
+from src.maestro_protocol import MaestroProtocol
+from src.virtual_maestro import SERIAL_PROTOCOL_ERROR
+from src.virtual_maestro import VirtualMaestro
+
+@unittest.skipUnless(hasattr(os, 'openpty'), 'VirtualMaestro needs a pseudo-terminal')
+class VirtualMaestroTest(unittest.TestCase):
+
+    def setUp(self):
+        self.maestro = VirtualMaestro(device_number=0x0C, baudrate=10_000_000)
+        self.encoder = MaestroEncoder(MaestroProtocol.Pololu, 0x0C)
+
+    def tearDown(self):
+        self.maestro.close()
+
+    def decode(self, *frames) -> int:
+        # decode without the serial line, returns the bytes consumed
+        return self.maestro.decode(bytearray(b''.join(bytes(frame) for frame in frames)))
+
+    def query(self, frame, response_length: int) -> bytes:
+        # write to the pseudo-terminal like the controller does and read the answer
+        os.write(self.maestro.slave_fd, bytes(frame))
+        response = b''
+        while len(response) < response_length:
+            readable, _, _ = select.select([self.maestro.slave_fd], [], [], 2)
+            self.assertTrue(readable, 'no answer from the VirtualMaestro')
+            response += os.read(self.maestro.slave_fd, response_length - len(response))
+        return response
+
+    """Frame decoding"""
+
+    def test_pololu_set_target(self):
+        self.assertEqual(self.decode(self.encoder.setTarget(3, 6000)), 6)
+        self.assertEqual(self.maestro.getTarget(3), 6000)
+
+    def test_other_device_is_ignored(self):
+        self.decode(MaestroEncoder(MaestroProtocol.Pololu, 0x0D).setTarget(3, 6000))
+        self.assertEqual(self.maestro.getTarget(3), 0)
+        self.assertEqual(self.maestro.stats()['frames_received'], 0)
+
+    def test_compact_set_target(self):
+        self.decode(MaestroEncoder(MaestroProtocol.Compact).setTarget(2, 4500))
+        self.assertEqual(self.maestro.getTarget(2), 4500)
+
+    def test_set_multiple_targets(self):
+        self.decode(self.encoder.setMultipleTargets(2, [5000, 6000, 7000]))
+        self.assertEqual([self.maestro.getTarget(channel) for channel in (2, 3, 4)], [5000, 6000, 7000])
+        self.assertEqual(self.maestro.stats()['frames_received'], 1)
+
+    def test_partial_frame_waits_for_the_rest(self):
+        frame = bytes(self.encoder.setTarget(1, 5000))
+        self.assertEqual(self.decode(frame[:4]), 0)
+        self.assertEqual(self.decode(bytes(self.encoder.setTarget(0, 4000)), frame[:4]), 6)
+        self.assertEqual(self.maestro.getTarget(0), 4000)
+
+    def test_exit_safe_start_is_a_command(self):
+        self.decode(bytes([0x83]), self.encoder.setTarget(0, 4000))
+        self.assertEqual(self.maestro.stats()['errors'], 0)
+        self.assertEqual(self.maestro.getTarget(0), 4000)
+
+    def test_malformed_input_sets_the_protocol_error(self):
+        self.decode(bytes([0x05]))
+        self.assertEqual(self.maestro.stats()['errors'], SERIAL_PROTOCOL_ERROR)
+        self.maestro.errors = 0
+        self.decode(bytes([0xAA, 0x0C, 0x7F]))
+        self.assertEqual(self.maestro.stats()['errors'], SERIAL_PROTOCOL_ERROR)
+
+    """Queries"""
+
+    def test_query_answers(self):
+        self.maestro.start()
+        os.write(self.maestro.slave_fd, bytes(self.encoder.setTarget(4, 6000)))
+        self.assertTrue(self.maestro.waitForTarget(4, 6000, timeout=2))
+        # no speed limit: the position is at the target once simulated
+        self.maestro.simulate(4, self.maestro.position_times[4] + 0.01)
+        self.assertEqual(self.query(self.encoder.getPosition(4), 2), bytes([6000 & 0xFF, 6000 >> 8]))
+        self.assertEqual(self.query(self.encoder.getMovingState(), 1), bytes([0x00]))
+        self.assertEqual(self.query(self.encoder.getErrors(), 2), bytes([0x00, 0x00]))
+        self.assertEqual(self.query(self.encoder.getScriptStatus(), 1), bytes([0x01]))
+
+    def test_errors_are_cleared_by_the_query(self):
+        self.maestro.start()
+        self.maestro.setError(SERIAL_PROTOCOL_ERROR)
+        self.assertEqual(self.query(self.encoder.getErrors(), 2), bytes([SERIAL_PROTOCOL_ERROR, 0x00]))
+        self.assertEqual(self.query(self.encoder.getErrors(), 2), bytes([0x00, 0x00]))
+
+    """Motion"""
+
+    def test_speed_limited_motion(self):
+        maestro = self.maestro
+        maestro.setTarget(3, 6000, 1.0)
+        maestro.simulate(3, 1.01)
+        self.assertEqual(maestro.positions[3], 6000)
+        maestro.speeds[3] = 10
+        maestro.setTarget(3, 6400, 2.0)
+        # 10 steps of 10ms at 10 (0.25us) per step
+        maestro.simulate(3, 2.1)
+        self.assertEqual(maestro.positions[3], 6100)
+        self.assertTrue(maestro.anyMoving(2.1))
+        maestro.simulate(3, 2.5)
+        self.assertEqual(maestro.positions[3], 6400)
+        self.assertFalse(maestro.anyMoving(2.5))
+
+    def test_acceleration_ramps_up(self):
+        maestro = self.maestro
+        maestro.setTarget(2, 6000, 1.0)
+        maestro.simulate(2, 1.01)
+        maestro.accelerations[2] = 8
+        maestro.setTarget(2, 7000, 2.0)
+        # the velocity grows by acceleration / 8 = 1 per step: 1 + 2 + 3 + 4
+        maestro.simulate(2, 2.04)
+        self.assertEqual(maestro.positions[2], 6010)
+
+if __name__ == '__main__':
+    unittest.main()
+
+# END